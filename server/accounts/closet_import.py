@@ -0,0 +1,249 @@
+"""
+Closet import from a ZIP archive.
+
+The archive is either a previous export (clothing_items.jsonl plus
+images/, see accounts.export), a ZIP with a manifest.jsonl/manifest.json
+of item objects whose "image" names a file in the archive, or just a
+folder of photos. For a folder of photos each image becomes an item named
+after the file; a top-level directory named like a category (e.g.
+Shoes/boots.jpg) sets the category, otherwise the import's default does.
+
+Entries are handled in batches: the rows are validated and inserted with
+one bulk_create per batch, then the batch's images are decoded and
+resized on the image process pool and stored from the storage threads
+(see processing.process_images). Workers read images straight out of the
+archive, so nothing is extracted to disk.
+
+Progress is saved on the ClosetImport row after every batch. Every entry
+has an import_key (unique per user), so running an import again - after a
+crash, or with the same archive - skips what already exists and only
+re-processes images that never finished.
+"""
+from collections import namedtuple
+from datetime import timedelta
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+from concurrent.futures import ThreadPoolExecutor
+from .models import ClothingItem
+from .serializers import ClothingItemSerializer
+from .filters import sync_item_tags
+from .processing import get_executor, process_images, save_fields
+from . import search, suggestions
+import threading
+import zipfile
+import logging
+import json
+import os
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAMES = ('clothing_items.jsonl', 'manifest.jsonl', 'manifest.json')
+MAX_MANIFEST_SIZE = 50 * 1024 * 1024
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif')
+IMPORT_FIELDS = (
+    'name', 'brand', 'size', 'color', 'category', 'tags', 'is_favorite', 'is_worn', 'last_worn', 'image_url',
+)
+BATCH_SIZE = 100
+# Only the first errors are kept on the ClosetImport row
+MAX_ERRORS = 100
+# A running import that hasn't saved progress for this long was interrupted
+STALLED_AFTER = timedelta(minutes=10)
+
+Entry = namedtuple('Entry', ['key', 'fields', 'image'])
+
+_lock = threading.Lock()
+_runner = None
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def _photo_entry(name, default_category):
+    parts = name.split('/')
+    stem = parts[-1].rsplit('.', 1)[0]
+    categories = {choice.lower(): choice for choice, _ in ClothingItem.CATEGORY_CHOICES}
+    category = categories.get(parts[0].lower(), default_category) if len(parts) > 1 else default_category
+    title = ' '.join(stem.replace('_', ' ').replace('-', ' ').split())[:200]
+    return Entry(f"file:{name}", {'name': title or 'Imported item', 'category': category}, name)
+
+
+def read_entries(archive, default_category):
+    """List the archive's entries; raises ArchiveError for an unreadable manifest"""
+    names = archive.namelist()
+    manifest = next((name for name in MANIFEST_NAMES if name in names), None)
+
+    if manifest is None:
+        return [
+            _photo_entry(name, default_category)
+            for name in sorted(names)
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+            and not name.startswith('__MACOSX/')
+            and not name.rsplit('/', 1)[-1].startswith('.')
+        ]
+
+    if archive.getinfo(manifest).file_size > MAX_MANIFEST_SIZE:
+        raise ArchiveError(f"{manifest} is too large")
+    try:
+        text = archive.read(manifest).decode('utf-8')
+        if manifest.endswith('.json'):
+            rows = json.loads(text)
+        else:
+            rows = [json.loads(line) for line in text.splitlines() if line.strip()]
+    except ValueError as e:
+        raise ArchiveError(f"Could not read {manifest}: {str(e)}")
+    if not isinstance(rows, list):
+        raise ArchiveError(f"{manifest} must hold a list of items")
+
+    entries = []
+    present = set(names)
+    for index, row in enumerate(rows):
+        row = row if isinstance(row, dict) else {}
+        image = row.get('image') if row.get('image') in present else None
+        if row.get('id') is not None:
+            key = f"id:{row['id']}"
+        else:
+            key = f"file:{image}" if image else f"row:{index}"
+        fields = {name: row[name] for name in IMPORT_FIELDS if row.get(name) is not None}
+        fields.setdefault('category', default_category)
+        entries.append(Entry(key[:255], fields, image))
+    return entries
+
+
+def _add_error(closet_import, key, error):
+    closet_import.failed += 1
+    if len(closet_import.errors) < MAX_ERRORS:
+        closet_import.errors.append({'entry': key, 'error': error})
+
+
+def _import_batch(closet_import, batch, existing, executor):
+    archive_path = closet_import.archive_path
+    new_items, jobs, keys = [], [], {}
+
+    for entry in batch:
+        if entry.key in existing:
+            item_id, image_status = existing[entry.key]
+            if image_status == 'processing' and entry.image:
+                # Inserted by an earlier run that stopped before its image was
+                # stored; it counts as created once this run finishes it
+                jobs.append((item_id, (archive_path, entry.image), 'import.jpg'))
+                keys[item_id] = entry.key
+                closet_import.created += 1
+            else:
+                closet_import.skipped += 1
+            continue
+
+        serializer = ClothingItemSerializer(data=entry.fields)
+        if not serializer.is_valid():
+            _add_error(closet_import, entry.key, serializer.errors)
+            continue
+        new_items.append((entry, ClothingItem(
+            user=closet_import.user,
+            import_key=entry.key,
+            image_status='processing' if entry.image else 'ready',
+            **serializer.validated_data,
+        )))
+
+    created = [item for _, item in new_items]
+    with transaction.atomic():
+        ClothingItem.objects.bulk_create(created)
+        # bulk_create skips the post_save signals that maintain these
+        sync_item_tags(created)
+        search.index_objects(created)
+        suggestions.invalidate(closet_import.user_id)
+    closet_import.created += len(created)
+
+    for entry, item in new_items:
+        existing[entry.key] = (item.pk, item.image_status)
+        if entry.image:
+            jobs.append((item.pk, (archive_path, entry.image), 'import.jpg'))
+            keys[item.pk] = entry.key
+
+    for item_id in process_images(ClothingItem, jobs, executor=executor):
+        _add_error(closet_import, keys[item_id], 'Image could not be processed')
+
+
+def run_import(closet_import, batch_size=BATCH_SIZE, progress=None, executor=None):
+    """
+    Import the archive of `closet_import`, saving progress after each batch.
+
+    Counters restart on every run; entries imported by an earlier run count
+    as skipped. An item whose image can't be processed is still created
+    (image_status 'failed') and is listed in the errors. `progress` is
+    called with the ClosetImport after each batch. Images are rendered on
+    `executor` when given, else on the shared image executor.
+    """
+    closet_import.status = 'running'
+    closet_import.processed = closet_import.created = closet_import.skipped = closet_import.failed = 0
+    closet_import.errors = []
+    closet_import.finished_at = None
+    closet_import.save()
+
+    try:
+        with zipfile.ZipFile(closet_import.archive_path) as archive:
+            entries = read_entries(archive, closet_import.default_category)
+        closet_import.total = len(entries)
+        save_fields(closet_import, ['total'])
+
+        existing = {
+            key: (item_id, image_status)
+            for key, item_id, image_status in ClothingItem.objects.filter(user=closet_import.user)
+            .exclude(import_key='').values_list('import_key', 'id', 'image_status')
+        }
+        for start in range(0, len(entries), batch_size):
+            batch = entries[start:start + batch_size]
+            _import_batch(closet_import, batch, existing, executor)
+            closet_import.processed += len(batch)
+            save_fields(closet_import, ['processed', 'created', 'skipped', 'failed', 'errors'])
+            if progress:
+                progress(closet_import)
+
+        closet_import.status = 'done'
+    except (ArchiveError, zipfile.BadZipFile, OSError) as e:
+        logger.error(f"Closet import {closet_import.id} failed: {str(e)}")
+        closet_import.status = 'failed'
+        closet_import.errors.append({'entry': None, 'error': str(e)})
+    except Exception as e:
+        logger.error(f"Closet import {closet_import.id} failed: {str(e)}")
+        closet_import.status = 'failed'
+        closet_import.errors.append({'entry': None, 'error': 'Import failed, it can be resumed'})
+    finally:
+        closet_import.finished_at = timezone.now()
+        closet_import.save()
+
+    if closet_import.status == 'done' and closet_import.remove_archive:
+        try:
+            os.remove(closet_import.archive_path)
+        except OSError as e:
+            logger.error(f"Could not remove import archive {closet_import.archive_path}: {str(e)}")
+
+    logger.info(
+        f"Closet import {closet_import.id} {closet_import.status}: {closet_import.created} created, "
+        f"{closet_import.skipped} skipped, {closet_import.failed} failed"
+    )
+    return closet_import
+
+
+def _run_in_background(closet_import):
+    # Runs on the import thread with its own database connection
+    close_old_connections()
+    try:
+        run_import(closet_import)
+    finally:
+        connection.close()
+
+
+def start_import(closet_import):
+    """
+    Run an import off the request thread; imports in one process run one at
+    a time. With the inline image executor (tests) it runs straight away.
+    """
+    global _runner
+    if getattr(get_executor(), 'inline', False):
+        return run_import(closet_import)
+
+    with _lock:
+        if _runner is None:
+            _runner = ThreadPoolExecutor(max_workers=1, thread_name_prefix='closet-import')
+    _runner.submit(_run_in_background, closet_import)
+    return closet_import
@@ -0,0 +1,129 @@
+"""
+Color math for dominant image colors and ?color_near= (see accounts.filters).
+
+A clothing item's dominant color (ClothingItem.image_color, found by
+imaging.dominant_color) is also stored as rounded CIE Lab coordinates
+plus a bucket. Buckets split colors by lightness (dark, mid, light; see
+LIGHTNESS_BANDS) and by hue: chromatic colors into 12 hue sectors of 30
+degrees, neutrals (chroma under NEUTRAL_CHROMA) into one more. A bucket
+is hue sector * 3 + band, so 0-35 are chromatic and 36-38 neutral.
+
+Distances in Lab roughly follow perceived difference (about 2.3 is just
+noticeable), so "near navy" is a sphere around navy in Lab.
+buckets_near() lists the buckets such a sphere can reach, which lets the
+query narrow on the indexed bucket column before checking the distance.
+
+No Django imports: the image workers use this module too.
+"""
+import math
+
+HUE_SECTORS = 12
+HUE_SECTOR_DEGREES = 360 / HUE_SECTORS
+NEUTRAL_CHROMA = 12
+# Neutrals get the sector after the hues
+NEUTRAL_SECTOR = HUE_SECTORS
+# L* ranges of the lightness bands: [low, high)
+LIGHTNESS_BANDS = ((0, 35), (35, 70), (70, 101))
+
+NAMED_COLORS = {
+    'black': '#1a1a1a', 'white': '#f5f5f5', 'grey': '#808080', 'gray': '#808080',
+    'charcoal': '#36454f', 'beige': '#d8c8a8', 'cream': '#f3ead3', 'tan': '#c8a27a',
+    'khaki': '#b5a67a', 'brown': '#6b4423', 'camel': '#c19a6b', 'navy': '#1f2a44',
+    'denim': '#3b5a7a', 'blue': '#2f6fd0', 'light blue': '#9cc3e6', 'teal': '#1f8a8a',
+    'green': '#2e8b3e', 'olive': '#6b6b2a', 'mint': '#a8e6c8', 'yellow': '#f2d13a',
+    'mustard': '#d4a017', 'orange': '#f07f1d', 'red': '#c8202a', 'burgundy': '#6d1a2a',
+    'pink': '#f2a0b8', 'purple': '#6a3d9a', 'lavender': '#b9a6dc',
+}
+
+
+def parse_hex(value):
+    """(r, g, b) for '#rrggbb' or 'rrggbb', else None"""
+    value = (value or '').strip().lstrip('#')
+    if len(value) != 6:
+        return None
+    try:
+        return tuple(int(value[i:i + 2], 16) for i in (0, 2, 4))
+    except ValueError:
+        return None
+
+
+def parse_color(value):
+    """(r, g, b) for a color name from NAMED_COLORS or a hex code, else None"""
+    name = ' '.join((value or '').lower().replace('-', ' ').split())
+    return parse_hex(NAMED_COLORS.get(name, value))
+
+
+def _linear(channel):
+    channel /= 255
+    return channel / 12.92 if channel <= 0.04045 else ((channel + 0.055) / 1.055) ** 2.4
+
+
+def rgb_to_lab(rgb):
+    """CIE L*a*b* (D65) of an sRGB color"""
+    r, g, b = (_linear(c) for c in rgb)
+    x = (0.4124 * r + 0.3576 * g + 0.1805 * b) / 0.95047
+    y = 0.2126 * r + 0.7152 * g + 0.0722 * b
+    z = (0.0193 * r + 0.1192 * g + 0.9505 * b) / 1.08883
+
+    def f(t):
+        return t ** (1 / 3) if t > 216 / 24389 else (24389 / 27 * t + 16) / 116
+
+    fx, fy, fz = f(x), f(y), f(z)
+    return 116 * fy - 16, 500 * (fx - fy), 200 * (fy - fz)
+
+
+def _band(lightness):
+    for band, (_, high) in enumerate(LIGHTNESS_BANDS):
+        if lightness < high:
+            return band
+    return len(LIGHTNESS_BANDS) - 1
+
+
+def bucket(lab):
+    lightness, a, b = lab
+    if math.hypot(a, b) < NEUTRAL_CHROMA:
+        sector = NEUTRAL_SECTOR
+    else:
+        sector = int((math.degrees(math.atan2(b, a)) % 360) // HUE_SECTOR_DEGREES)
+    return sector * len(LIGHTNESS_BANDS) + _band(lightness)
+
+
+def columns(hex_color):
+    """(bucket, L, a, b) as stored on ClothingItem for a '#rrggbb' color; all None without one"""
+    rgb = parse_hex(hex_color)
+    if rgb is None:
+        return None, None, None, None
+    lab = rgb_to_lab(rgb)
+    return (bucket(lab), *(round(value) for value in lab))
+
+
+def _hue_gap(hue, sector):
+    """Degrees from `hue` to the nearest edge of hue `sector` (0 if inside)"""
+    offset = (hue - sector * HUE_SECTOR_DEGREES) % 360
+    if offset < HUE_SECTOR_DEGREES:
+        return 0
+    return min(offset - HUE_SECTOR_DEGREES, 360 - offset)
+
+
+def buckets_near(lab, radius):
+    """Every bucket holding colors that can be within `radius` of `lab`"""
+    lightness, a, b = lab
+    chroma = math.hypot(a, b)
+    sectors = []
+
+    if chroma - radius < NEUTRAL_CHROMA:
+        sectors.append(NEUTRAL_SECTOR)
+    if chroma + radius >= NEUTRAL_CHROMA:
+        if chroma <= radius:
+            sectors += range(HUE_SECTORS)
+        else:
+            # Colors within the radius lie within this angle of the hue
+            spread = math.degrees(math.asin(radius / chroma))
+            hue = math.degrees(math.atan2(b, a)) % 360
+            sectors += [sector for sector in range(HUE_SECTORS) if _hue_gap(hue, sector) <= spread]
+
+    bands = [
+        band for band, (low, high) in enumerate(LIGHTNESS_BANDS)
+        if lightness - radius < high and lightness + radius >= low
+    ]
+    return sorted(sector * len(LIGHTNESS_BANDS) + band for sector in sectors for band in bands)
@@ -0,0 +1,57 @@
+"""
+Conditional GET for closet, outfit and profile reads.
+
+Validators come from timestamps the database already has: one aggregate
+query for a list, the row itself for a detail view. A client whose
+If-None-Match / If-Modified-Since still matches gets a 304 without any rows
+being loaded or serialized.
+"""
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+import hashlib
+
+# Bump when a serializer's output changes shape so cached copies are refetched
+REPRESENTATION_VERSION = 'v1'
+
+
+def make_etag(request, *parts):
+    """Weak ETag over the user, the full request path (filters, cursor) and `parts`"""
+    key = ':'.join(str(p) for p in (REPRESENTATION_VERSION, request.user.pk, request.get_full_path(), *parts))
+    return f'W/"{hashlib.sha1(key.encode()).hexdigest()}"'
+
+
+def list_etag(request, queryset, **extra_aggregates):
+    """
+    ETag for a list endpoint from a single max(updated_at) + count query.
+
+    Extra aggregates (e.g. the latest update of embedded rows) are folded in.
+    No Last-Modified is offered for lists: a deletion can make max(updated_at)
+    go backwards, which only the count in the ETag catches.
+    """
+    summary = queryset.order_by().aggregate(
+        latest=Max('updated_at'), count=Count('id', distinct=True), **extra_aggregates
+    )
+    return make_etag(request, *(summary[k] for k in sorted(summary)))
+
+
+def not_modified(request, etag, last_modified=None):
+    """Return a 304 response if the client's copy is current, else None"""
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=int(last_modified.timestamp()) if last_modified else None,
+    )
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag, last_modified=None):
+    """Attach validators and make sure private data is revalidated, not reused blindly"""
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ('Authorization',))
+    return response
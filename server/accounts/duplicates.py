@@ -0,0 +1,169 @@
+"""
+Near-duplicate clothing photos: items whose perceptual hashes differ in at
+most MAX_DISTANCE bits, found by a vectorized scan of a per-user HashIndex.
+"""
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from .models import ClothingItem
+import numpy as np
+import threading
+import time
+import uuid
+
+MAX_DISTANCE = 10
+# Largest distance the report accepts; past this unrelated photos match
+MAX_REPORT_DISTANCE = 16
+# Per-process index cache size, in users
+MAX_INDEXES = 500
+
+MASK = (1 << 64) - 1
+
+_lock = threading.Lock()
+_indexes = OrderedDict()
+
+
+def _unsigned(values):
+    # Hashes are stored as signed 64-bit integers
+    return np.asarray(values, dtype=np.int64).view(np.uint64)
+
+
+def distance(a, b):
+    """Number of differing bits between two hashes"""
+    return ((a ^ b) & MASK).bit_count()
+
+
+class HashIndex:
+    """A closet's image hashes, searchable by Hamming distance"""
+
+    def __init__(self, item_ids, hashes):
+        self.ids = np.asarray(item_ids, dtype=np.int64)
+        self.hashes = _unsigned(hashes)
+
+    def search(self, value, max_distance):
+        """[(distance, item id)] for every hash within `max_distance` of `value`, closest then oldest first"""
+        distances = np.bitwise_count(self.hashes ^ _unsigned([value])[0])
+        near = np.flatnonzero(distances <= max_distance)
+        return sorted(zip(distances[near].tolist(), self.ids[near].tolist()))
+
+
+def _version_key(user_id):
+    return f"image-hash-version:{user_id}"
+
+
+def _bump(user_id):
+    cache.set(_version_key(user_id), uuid.uuid4().hex, None)
+
+
+def invalidate(user_id):
+    """Mark `user_id`'s indexes stale in every process, now and once the transaction commits"""
+    _bump(user_id)
+    transaction.on_commit(lambda: _bump(user_id))
+
+
+def _hash_version(user_id):
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        cache.add(_version_key(user_id), uuid.uuid4().hex, None)
+        version = cache.get(_version_key(user_id))
+    return version
+
+
+def index_for(user_id):
+    """The HashIndex of `user_id`'s closet, rebuilt when the version moved or it timed out"""
+    version = _hash_version(user_id)
+    with _lock:
+        cached = _indexes.get(user_id)
+        if cached and cached[0] == version and cached[1] > time.monotonic():
+            _indexes.move_to_end(user_id)
+            return cached[2]
+
+    expires = time.monotonic() + getattr(settings, 'DUPLICATE_INDEX_TIMEOUT', 60)
+    rows = list(
+        ClothingItem.objects.filter(user_id=user_id, image_hash__isnull=False)
+        .order_by('id').values_list('id', 'image_hash')
+    )
+    index = HashIndex([row[0] for row in rows], [row[1] for row in rows])
+
+    with _lock:
+        _indexes[user_id] = (version, expires, index)
+        _indexes.move_to_end(user_id)
+        while len(_indexes) > MAX_INDEXES:
+            _indexes.popitem(last=False)
+    return index
+
+
+def find_duplicates(user_id, value, max_distance=MAX_DISTANCE):
+    """[(distance, item id)] of `user_id`'s items near `value`, closest (then oldest) first"""
+    return index_for(user_id).search(value, max_distance)
+
+
+def _closest_older(matches, item_id):
+    return next((match_id for _, match_id in matches if match_id < item_id), None)
+
+
+def flag_duplicate(item):
+    """Point item.duplicate_of at the closest older item with a matching hash, or clear it"""
+    invalidate(item.user_id)
+    original = None
+    if item.image_hash is not None:
+        original = _closest_older(find_duplicates(item.user_id, item.image_hash), item.pk)
+    if original != item.duplicate_of_id:
+        item.duplicate_of_id, item.updated_at = original, timezone.now()
+        ClothingItem.objects.filter(pk=item.pk).update(duplicate_of=original, updated_at=item.updated_at)
+    return original
+
+
+def reflag_closet(user_id):
+    """Recompute duplicate_of for a whole closet (after a backfill); returns how many changed"""
+    index = index_for(user_id)
+    items = list(
+        ClothingItem.objects.filter(user_id=user_id, image_hash__isnull=False)
+        .only('id', 'image_hash', 'duplicate_of')
+    )
+    now = timezone.now()
+    changed = []
+    for item in items:
+        original = _closest_older(index.search(item.image_hash, MAX_DISTANCE), item.pk)
+        if original != item.duplicate_of_id:
+            item.duplicate_of_id, item.updated_at = original, now
+            changed.append(item)
+    ClothingItem.objects.bulk_update(changed, ['duplicate_of', 'updated_at'], batch_size=1000)
+    return len(changed)
+
+
+def clusters(user_id, max_distance=MAX_DISTANCE):
+    """
+    Groups of item ids whose photos are near-duplicates of each other.
+
+    Items are grouped transitively (A~B and B~C puts A, B and C together).
+    Each group is sorted oldest first; groups are sorted largest first.
+    """
+    index = index_for(user_id)
+    parent = {}
+
+    def root(item_id):
+        while parent[item_id] != item_id:
+            parent[item_id] = parent[parent[item_id]]
+            item_id = parent[item_id]
+        return item_id
+
+    for item_id, value in zip(index.ids.tolist(), index.hashes.view(np.int64).tolist()):
+        for _, match_id in index.search(value, max_distance):
+            if match_id == item_id:
+                continue
+            for member in (item_id, match_id):
+                parent.setdefault(member, member)
+            a, b = root(item_id), root(match_id)
+            if a != b:
+                parent[max(a, b)] = min(a, b)
+
+    groups = {}
+    for item_id in parent:
+        groups.setdefault(root(item_id), []).append(item_id)
+    return sorted(
+        (sorted(group) for group in groups.values()),
+        key=lambda group: (-len(group), group[0]),
+    )
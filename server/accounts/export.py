@@ -0,0 +1,206 @@
+"""
+Streaming export of a user's closet and outfits.
+
+Rows are read with .iterator(chunk_size=...) and encoded one at a time
+into a generator for StreamingHttpResponse, so memory use does not grow
+with the size of the closet:
+
+- jsonl: one JSON object per line, clothing items then outfits, each with
+  a "type" key.
+- csv: one table, clothing items (kind=clothing_items, the default) or
+  outfits (kind=outfits). List values are joined with "|".
+- zip: clothing_items.jsonl and outfits.jsonl plus every stored image
+  under images/. The archive is written to a non-seekable sink (entries
+  use data descriptors) and images are copied from MediaStorage in
+  COPY_CHUNK_SIZE pieces, so at most one chunk is buffered at a time.
+"""
+from django.db.models import Prefetch
+from .models import ClothingItem, Outfit
+import zipfile
+import logging
+import json
+import csv
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {
+    'jsonl': 'application/x-ndjson',
+    'csv': 'text/csv',
+    'zip': 'application/zip',
+}
+CHUNK_SIZE = 500
+COPY_CHUNK_SIZE = 64 * 1024
+
+ITEM_COLUMNS = [
+    'id', 'name', 'brand', 'size', 'color', 'category', 'tags', 'is_favorite', 'is_worn',
+    'last_worn', 'image', 'image_url', 'created_at', 'updated_at',
+]
+OUTFIT_COLUMNS = [
+    'id', 'title', 'description', 'category', 'occasion', 'items', 'tags', 'liked',
+    'image', 'created_at', 'updated_at',
+]
+
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+def item_record(item, image=None):
+    """Plain dict for one clothing item; `image` overrides the stored image name"""
+    return {
+        'id': item.id,
+        'name': item.name,
+        'brand': item.brand,
+        'size': item.size,
+        'color': item.color,
+        'category': item.category,
+        'tags': item.tags if isinstance(item.tags, list) else [],
+        'is_favorite': item.is_favorite,
+        'is_worn': item.is_worn,
+        'last_worn': _iso(item.last_worn),
+        'image': image if image is not None else (item.image.name or None),
+        'image_url': item.image_url,
+        'created_at': _iso(item.created_at),
+        'updated_at': _iso(item.updated_at),
+    }
+
+
+def outfit_record(outfit, image=None):
+    return {
+        'id': outfit.id,
+        'title': outfit.title,
+        'description': outfit.description,
+        'category': outfit.category,
+        'occasion': outfit.occasion,
+        'items': [item.id for item in outfit.items.all()],
+        'tags': outfit.tags if isinstance(outfit.tags, list) else [],
+        'liked': outfit.liked,
+        'image': image if image is not None else (outfit.image.name or None),
+        'created_at': _iso(outfit.created_at),
+        'updated_at': _iso(outfit.updated_at),
+    }
+
+
+def iter_items(user):
+    return ClothingItem.objects.filter(user=user).order_by('id').iterator(chunk_size=CHUNK_SIZE)
+
+
+def iter_outfits(user):
+    # Prefetches run per chunk when combined with iterator()
+    return Outfit.objects.filter(user=user).order_by('id').prefetch_related(
+        Prefetch('items', queryset=ClothingItem.objects.only('id'))
+    ).iterator(chunk_size=CHUNK_SIZE)
+
+
+def _json_line(record):
+    return json.dumps(record, ensure_ascii=False) + '\n'
+
+
+def stream(user, fmt, kind=None):
+    """Generator of encoded chunks for `fmt` (a key of FORMATS)"""
+    if fmt == 'zip':
+        return stream_zip(user)
+    if fmt == 'csv':
+        return stream_csv(user, kind or 'clothing_items')
+    return stream_jsonl(user)
+
+
+def stream_jsonl(user):
+    for item in iter_items(user):
+        yield _json_line({'type': 'clothing_item', **item_record(item)})
+    for outfit in iter_outfits(user):
+        yield _json_line({'type': 'outfit', **outfit_record(outfit)})
+
+
+class _Echo:
+    """File-like object whose write() hands back what was written"""
+    def write(self, value):
+        return value
+
+
+def stream_csv(user, kind='clothing_items'):
+    if kind == 'outfits':
+        columns, records = OUTFIT_COLUMNS, (outfit_record(o) for o in iter_outfits(user))
+    else:
+        columns, records = ITEM_COLUMNS, (item_record(i) for i in iter_items(user))
+
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for record in records:
+        yield writer.writerow([
+            '|'.join(str(v) for v in record[c]) if isinstance(record[c], list) else record[c]
+            for c in columns
+        ])
+
+
+class _Sink:
+    """Non-seekable write target that buffers until drained"""
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _archive_name(storage_name, prefix, object_id):
+    extension = storage_name.rsplit('.', 1)[-1] if '.' in storage_name else 'jpg'
+    return f"images/{prefix}/{object_id}.{extension}"
+
+
+def _copy_image(archive, sink, storage, storage_name, arcname):
+    """Stream one stored image into the archive, yielding output as it is produced"""
+    info = zipfile.ZipInfo(arcname)
+    # Images are already compressed
+    info.compress_type = zipfile.ZIP_STORED
+    with storage.open(storage_name, 'rb') as source:
+        with archive.open(info, 'w', force_zip64=True) as target:
+            while True:
+                chunk = source.read(COPY_CHUNK_SIZE)
+                if not chunk:
+                    break
+                target.write(chunk)
+                yield sink.drain()
+    yield sink.drain()
+
+
+def stream_zip(user):
+    return (chunk for chunk in _zip_chunks(user) if chunk)
+
+
+def _zip_chunks(user):
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for model, name, records, to_record, prefix in (
+            (ClothingItem, 'clothing_items.jsonl', iter_items(user), item_record, 'clothing'),
+            (Outfit, 'outfits.jsonl', iter_outfits(user), outfit_record, 'outfits'),
+        ):
+            with archive.open(name, 'w', force_zip64=True) as target:
+                for instance in records:
+                    image = _archive_name(instance.image.name, prefix, instance.id) if instance.image else None
+                    target.write(_json_line(to_record(instance, image)).encode())
+                    yield sink.drain()
+            yield sink.drain()
+
+            # Archive entries can't interleave, so the images follow in a
+            # second pass over just the image names
+            storage = model._meta.get_field('image').storage
+            stored = model.objects.filter(user=user).exclude(image='').exclude(image__isnull=True)
+            for object_id, storage_name in stored.order_by('id').values_list('id', 'image').iterator(
+                chunk_size=CHUNK_SIZE
+            ):
+                try:
+                    yield from _copy_image(
+                        archive, sink, storage, storage_name, _archive_name(storage_name, prefix, object_id)
+                    )
+                except Exception as e:
+                    logger.error(f"Export skipped image {storage_name}: {str(e)}")
+    yield sink.drain()
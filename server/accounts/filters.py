@@ -0,0 +1,149 @@
+"""
+Server-side closet filters for GET clothing-items/.
+
+    ?category=Tops&brand=Uniqlo&color=Navy
+    ?is_favorite=true&is_worn=false
+    ?last_worn_after=2026-01-01&last_worn_before=2026-06-30
+    ?tags=summer,linen          (items carrying every listed tag)
+    ?color_near=navy&color_distance=15   (or ?color_near=%231f2a44)
+
+Every filter is an exact match on a column covered by a (user, column)
+index, so it narrows the per-user index range instead of scanning the
+closet. Tag containment uses a GIN (jsonb_path_ops) index on `tags` on
+PostgreSQL; other databases have no jsonb containment, so tags are mirrored
+into the indexed ClothingItemTag table and matched through it.
+
+color_near matches the dominant color read from the item's photo (see
+accounts.colors): it narrows on the indexed color_bucket column to the
+buckets the color's Lab sphere can reach, then checks the distance.
+"""
+from django.db import connection
+from django.db.models import F
+from django.utils.dateparse import parse_date
+from .models import ClothingItemTag
+from . import colors
+
+TAG_MAX_LENGTH = ClothingItemTag._meta.get_field('tag').max_length
+
+BOOLEAN_VALUES = {
+    'true': True, '1': True, 'yes': True,
+    'false': False, '0': False, 'no': False,
+}
+
+
+# Lab distance for ?color_near= unless ?color_distance= says otherwise
+COLOR_DISTANCE = 20
+MAX_COLOR_DISTANCE = 100
+
+
+class InvalidFilter(ValueError):
+    pass
+
+
+def uses_tag_table():
+    """True when tag filters go through ClothingItemTag rather than a jsonb index"""
+    return connection.vendor != 'postgresql'
+
+
+def tag_values(tags):
+    """The distinct, stripped tag strings of a `tags` value as the index stores them"""
+    if isinstance(tags, str):
+        tags = tags.split(',')
+    values = (str(tag).strip()[:TAG_MAX_LENGTH] for tag in tags or [])
+    return {tag for tag in values if tag}
+
+
+def sync_item_tags(items):
+    """
+    Rebuild the ClothingItemTag rows for `items`.
+
+    Called from the post_save signal; bulk_create/bulk_update skip signals, so
+    bulk paths must call this themselves. A no-op on PostgreSQL.
+    """
+    if not uses_tag_table():
+        return
+    items = list(items)
+    if not items:
+        return
+    ClothingItemTag.objects.filter(item_id__in=[item.pk for item in items]).delete()
+    ClothingItemTag.objects.bulk_create([
+        ClothingItemTag(item_id=item.pk, user_id=item.user_id, tag=tag)
+        for item in items
+        for tag in tag_values(item.tags)
+    ])
+
+
+def _boolean(params, name):
+    value = params[name].strip().lower()
+    if value not in BOOLEAN_VALUES:
+        raise InvalidFilter(f"{name} must be true or false")
+    return BOOLEAN_VALUES[value]
+
+
+def _date(params, name):
+    try:
+        value = parse_date(params[name])
+    except ValueError:
+        value = None
+    if value is None:
+        raise InvalidFilter(f"{name} must be a date (YYYY-MM-DD)")
+    return value
+
+
+def _color_near(queryset, params):
+    rgb = colors.parse_color(params['color_near'])
+    if rgb is None:
+        raise InvalidFilter('color_near must be a color name or a hex code like #1f2a44')
+    radius = COLOR_DISTANCE
+    if 'color_distance' in params:
+        try:
+            radius = float(params['color_distance'])
+        except ValueError:
+            radius = -1
+        if not 0 < radius <= MAX_COLOR_DISTANCE:
+            raise InvalidFilter(f"color_distance must be a number between 0 and {MAX_COLOR_DISTANCE}")
+
+    lightness, a, b = colors.rgb_to_lab(rgb)
+    return queryset.filter(
+        color_bucket__in=colors.buckets_near((lightness, a, b), radius),
+        color_l__range=(lightness - radius, lightness + radius),
+        color_a__range=(a - radius, a + radius),
+        color_b__range=(b - radius, b + radius),
+    ).alias(
+        color_delta=(F('color_l') - lightness) * (F('color_l') - lightness)
+        + (F('color_a') - a) * (F('color_a') - a)
+        + (F('color_b') - b) * (F('color_b') - b)
+    ).filter(color_delta__lte=radius * radius)
+
+
+def filter_clothing_items(queryset, user, params):
+    """Apply the closet filters in `params` to `user`'s items; raises InvalidFilter"""
+    for name in ('category', 'brand', 'color'):
+        if name in params:
+            queryset = queryset.filter(**{name: params[name]})
+
+    for name in ('is_favorite', 'is_worn'):
+        if name in params:
+            queryset = queryset.filter(**{name: _boolean(params, name)})
+
+    if 'last_worn_after' in params:
+        queryset = queryset.filter(last_worn__gte=_date(params, 'last_worn_after'))
+    if 'last_worn_before' in params:
+        queryset = queryset.filter(last_worn__lte=_date(params, 'last_worn_before'))
+
+    if 'color_near' in params:
+        queryset = _color_near(queryset, params)
+
+    tags = set()
+    for value in params.getlist('tags'):
+        tags |= tag_values(value)
+    if tags:
+        if uses_tag_table():
+            for tag in sorted(tags):
+                queryset = queryset.filter(
+                    id__in=ClothingItemTag.objects.filter(user=user, tag=tag).values('item_id')
+                )
+        else:
+            queryset = queryset.filter(tags__contains=sorted(tags))
+
+    return queryset
@@ -0,0 +1,222 @@
+"""
+Pillow helpers for uploaded images.
+
+Everything in here runs inside image-processing worker processes, so it
+must stay free of Django imports and only deal in bytes, paths and URLs.
+
+Memory per image is bounded by checking dimensions from the header before
+anything is decoded (MAX_PIXELS) and by letting JPEG decode at a reduced
+scale (draft mode) when only smaller derivatives are needed. See the
+bench_image_memory management command for peak RSS numbers.
+"""
+from PIL import Image, ImageOps
+from urllib.request import urlopen
+import shutil
+import tempfile
+import zipfile
+import math
+import io
+
+AVATAR_SIZE = 400
+IMAGE_MAX_SIZE = 1600
+JPEG_QUALITY = 85
+WEBP_QUALITY = 80
+
+# Longest edge of each derivative produced for clothing items and outfits
+VARIANT_SIZES = {
+    'thumb': 200,
+    'medium': 600,
+    'full': IMAGE_MAX_SIZE,
+}
+VARIANT_FORMATS = ('webp', 'jpeg')
+
+ALLOWED_FORMATS = {'JPEG', 'MPO', 'PNG', 'WEBP', 'GIF'}
+
+# 50 MP covers current phone cameras; a decoded RGB bitmap this size is ~150 MB
+MAX_PIXELS = 50_000_000
+Image.MAX_IMAGE_PIXELS = MAX_PIXELS
+
+# Remote sources are spooled to disk past this size
+SPOOL_MAX_MEMORY = 1024 * 1024
+
+# Same limit as a single image upload
+MAX_ARCHIVE_MEMBER_SIZE = 20 * 1024 * 1024
+
+# dHash compares HASH_SIZE + 1 columns of HASH_SIZE rows: a 64-bit hash
+HASH_SIZE = 8
+
+# Dominant colors are picked from a palette of this many colors, quantized
+# from a copy no larger than COLOR_SAMPLE_SIZE on its longest edge
+PALETTE_SIZE = 6
+COLOR_SAMPLE_SIZE = 64
+# A palette color covering this share of the border is taken as the backdrop
+BACKGROUND_BORDER_SHARE = 0.5
+
+
+class ImageRejected(ValueError):
+    pass
+
+
+def sniff_image(fileobj):
+    """
+    Read just the image header and return (format, (width, height)).
+
+    Nothing is decoded, so this is cheap for any file size. Raises
+    ImageRejected for non-images, unsupported formats and images with
+    more than MAX_PIXELS pixels.
+    """
+    position = fileobj.tell()
+    try:
+        with Image.open(fileobj) as image:
+            image_format, size = image.format, image.size
+    except Image.DecompressionBombError:
+        raise ImageRejected('Image dimensions are too large')
+    except Exception:
+        raise ImageRejected('File must be an image')
+    finally:
+        fileobj.seek(position)
+
+    if image_format not in ALLOWED_FORMATS:
+        raise ImageRejected(f"Unsupported image format: {image_format}")
+    if size[0] * size[1] > MAX_PIXELS:
+        raise ImageRejected('Image dimensions are too large')
+    return image_format, size
+
+
+def _open_source(source):
+    """
+    Open raw bytes, a local file path, an http(s) URL such as a presigned
+    GET for an object in the bucket, or an (archive path, member name)
+    tuple for an image inside a ZIP.
+
+    Paths and archive members are read lazily by Pillow and remote bodies
+    are streamed into a spooled temp file, so the encoded image never has
+    to fit in memory.
+    """
+    if isinstance(source, bytes):
+        return Image.open(io.BytesIO(source))
+    if isinstance(source, tuple):
+        archive_path, member = source
+        archive = zipfile.ZipFile(archive_path)
+        if archive.getinfo(member).file_size > MAX_ARCHIVE_MEMBER_SIZE:
+            raise ImageRejected('Image file is too large')
+        return Image.open(archive.open(member))
+    if source.startswith(('http://', 'https://')):
+        spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+        with urlopen(source, timeout=30) as response:
+            shutil.copyfileobj(response, spool)
+        spool.seek(0)
+        return Image.open(spool)
+    return Image.open(source)
+
+
+def _encode(image, fmt):
+    # No exif/icc arguments are passed, so metadata is stripped
+    output = io.BytesIO()
+    if fmt == 'webp':
+        image.save(output, format='WEBP', quality=WEBP_QUALITY, method=4)
+    else:
+        image.save(output, format='JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return output.getvalue()
+
+
+def dhash(image):
+    """
+    Perceptual difference hash of a PIL image.
+
+    The image is shrunk to 9x8 grayscale and each bit records whether a
+    pixel is brighter than its right neighbour, so re-encodes, resizes and
+    small edits of the same picture land a few bits apart. Returned as a
+    signed 64-bit integer so it fits a BigIntegerField.
+    """
+    small = image.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BILINEAR)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(HASH_SIZE):
+        for column in range(HASH_SIZE):
+            offset = row * (HASH_SIZE + 1) + column
+            value = (value << 1) | (pixels[offset] > pixels[offset + 1])
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def image_hash(source):
+    """dhash() of `source` (as for render_variants), decoding as little as possible"""
+    image = _open_source(source)
+    if image.width * image.height > MAX_PIXELS:
+        raise ImageRejected('Image dimensions are too large')
+    image.draft('RGB', (64, 64))
+    return dhash(ImageOps.exif_transpose(image))
+
+
+def dominant_color(image):
+    """
+    Dominant color of a PIL image as '#rrggbb'.
+
+    A small copy is quantized to PALETTE_SIZE colors (median cut, in C)
+    and the most common palette color wins. Product photos are usually
+    taken against a plain backdrop, so a color that fills most of the
+    border is skipped unless it is all there is.
+    """
+    sample = image.convert('RGB')
+    sample.thumbnail((COLOR_SAMPLE_SIZE, COLOR_SAMPLE_SIZE))
+    quantized = sample.quantize(colors=PALETTE_SIZE, method=Image.Quantize.MEDIANCUT)
+    palette = quantized.getpalette()
+    counts = sorted(quantized.getcolors(), reverse=True)
+
+    width, height = quantized.size
+    pixels = quantized.load()
+    border = [pixels[x, y] for x in range(width) for y in (0, height - 1)]
+    border += [pixels[x, y] for y in range(1, height - 1) for x in (0, width - 1)]
+    backdrop = max(set(border), key=border.count)
+    if border.count(backdrop) < BACKGROUND_BORDER_SHARE * len(border):
+        backdrop = None
+
+    index = next((index for _, index in counts if index != backdrop), counts[0][1])
+    return '#{:02x}{:02x}{:02x}'.format(*palette[index * 3:index * 3 + 3])
+
+
+def image_color(source):
+    """dominant_color() of `source` (as for render_variants), decoding as little as possible"""
+    image = _open_source(source)
+    if image.width * image.height > MAX_PIXELS:
+        raise ImageRejected('Image dimensions are too large')
+    image.draft('RGB', (COLOR_SAMPLE_SIZE, COLOR_SAMPLE_SIZE))
+    return dominant_color(ImageOps.exif_transpose(image))
+
+
+def render_variants(source, sizes=None, formats=VARIANT_FORMATS):
+    """
+    Decode `source` (bytes, a path or a URL) once and render a derivative
+    per size and format.
+
+    The image is rotated according to its EXIF orientation and re-encoded
+    without metadata. Returns {name: {'width', 'height', <format>: bytes}}
+    plus 'dhash', the perceptual hash of the image (see dhash()), and
+    'color', its dominant color (see dominant_color()). Sizes are rendered
+    largest first, each one downscaled from the last.
+    """
+    sizes = sizes or VARIANT_SIZES
+    image = _open_source(source)
+    if image.width * image.height > MAX_PIXELS:
+        raise ImageRejected('Image dimensions are too large')
+
+    # JPEGs can be decoded at 1/2, 1/4 or 1/8 scale straight from the DCT
+    # data; ask for the smallest scale that still covers the largest size
+    scale = max(sizes.values()) / max(image.size)
+    if scale < 1:
+        image.draft('RGB', (math.ceil(image.width * scale), math.ceil(image.height * scale)))
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+
+    variants = {}
+    for name, max_size in sorted(sizes.items(), key=lambda kv: kv[1], reverse=True):
+        image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+        variant = {'width': image.width, 'height': image.height}
+        for fmt in formats:
+            variant[fmt] = _encode(image, fmt)
+        variants[name] = variant
+    # Both come from the smallest rendition, which is already in memory
+    variants['dhash'] = dhash(image)
+    variants['color'] = dominant_color(image)
+    return variants
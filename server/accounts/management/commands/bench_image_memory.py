@@ -0,0 +1,96 @@
+"""
+Peak memory of processing one uploaded image.
+
+Each case runs in a fresh process and reports that process's peak RSS, so
+the numbers are what one image-processing worker needs per upload:
+
+    python manage.py bench_image_memory --width 6000 --height 4000
+
+Reference run (Pillow 11.3, Linux x86_64; the source is noise, so it
+encodes larger than a camera JPEG of the same size):
+
+    6000x4000 JPEG, 16.9 MB           peak RSS
+    baseline (imports only)            30 MB
+    full decode (previous code)       231 MB
+    render_variants from a file        77 MB
+
+    4000x3000 JPEG, 8.4 MB
+    full decode (previous code)       131 MB
+    render_variants from a file        67 MB
+
+render_variants also encodes all six derivatives, so it is not directly
+comparable on time.
+
+The previous avatar code decoded the whole bitmap before resizing.
+render_variants opens the spooled file lazily and uses JPEG draft mode,
+so the bitmap is decoded at the smallest DCT scale that still covers the
+largest derivative. Anything over imaging.MAX_PIXELS is rejected from the
+header before any decode.
+"""
+from django.core.management.base import BaseCommand
+from PIL import Image
+import multiprocessing
+import resource
+import io
+import tempfile
+import time
+import os
+
+
+def _peak_rss_mb():
+    # VmHWM belongs to the process image, whereas ru_maxrss survives exec
+    # and would report the parent's peak at fork time
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _run_case(case, path, queue):
+    from accounts import imaging
+
+    started = time.perf_counter()
+    if case == 'full decode (previous code)':
+        with open(path, 'rb') as f:
+            data = f.read()
+        image = Image.open(io.BytesIO(data))
+        image.load()
+        image = image.convert('RGB')
+        image.thumbnail((imaging.IMAGE_MAX_SIZE, imaging.IMAGE_MAX_SIZE), Image.Resampling.LANCZOS)
+    elif case == 'render_variants from a file':
+        imaging.render_variants(path)
+    queue.put((case, _peak_rss_mb(), time.perf_counter() - started))
+
+
+class Command(BaseCommand):
+    help = 'Measure peak RSS per uploaded image for the image-processing pipeline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--width', type=int, default=6000)
+        parser.add_argument('--height', type=int, default=4000)
+
+    def handle(self, *args, **options):
+        width, height = options['width'], options['height']
+        fd, path = tempfile.mkstemp(suffix='.jpg')
+        os.close(fd)
+        try:
+            # Noise so the JPEG is roughly camera-sized rather than a few KB
+            Image.effect_noise((width, height), 64).convert('RGB').save(path, format='JPEG', quality=90)
+            self.stdout.write(
+                f"Source: {width}x{height} JPEG, {os.path.getsize(path) / (1024 * 1024):.1f} MB"
+            )
+
+            context = multiprocessing.get_context('spawn')
+            for case in ('baseline (imports only)', 'full decode (previous code)', 'render_variants from a file'):
+                queue = context.Queue()
+                process = context.Process(target=_run_case, args=(case, path, queue))
+                process.start()
+                name, peak, elapsed = queue.get()
+                process.join()
+                self.stdout.write(f"{name:<32} peak RSS {peak:7.1f} MB  {elapsed * 1000:8.1f} ms")
+        finally:
+            os.remove(path)
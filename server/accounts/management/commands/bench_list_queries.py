@@ -0,0 +1,163 @@
+"""
+Seed a large closet and record the query plan and latency of every list query.
+
+    python manage.py bench_list_queries --users 20 --items 5000 --outfits 1000
+
+Runs against whatever DATABASES points at (SQLite locally, PostgreSQL via
+DATABASE_URL). Everything is seeded inside a transaction that is rolled
+back at the end unless --keep is passed. Each query is timed as the
+median of --repeat runs, with its EXPLAIN output printed underneath.
+"""
+from contextlib import contextmanager
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+from accounts.models import ClothingItem, Outfit
+from accounts.filters import filter_clothing_items, sync_item_tags
+from django.http import QueryDict
+import statistics
+import random
+import time
+
+CATEGORIES = [choice for choice, _ in ClothingItem.CATEGORY_CHOICES]
+OUTFIT_CATEGORIES = ['Casual', 'Work', 'Formal', 'Sport', 'Saved']
+TAGS = ['summer', 'winter', 'work', 'linen', 'denim', 'vintage', 'gym', 'party']
+PAGE_SIZE = 50
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let bulk_create keep the created_at/updated_at values we set"""
+    fields = [m._meta.get_field(name) for m in models for name in ('created_at', 'updated_at')]
+    saved = [(f, f.auto_now, f.auto_now_add) for f in fields]
+    for f in fields:
+        f.auto_now = f.auto_now_add = False
+    try:
+        yield
+    finally:
+        for f, auto_now, auto_now_add in saved:
+            f.auto_now, f.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the closet/outfit list queries on a seeded dataset'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--items', type=int, default=5000, help='Clothing items per user')
+        parser.add_argument('--outfits', type=int, default=1000, help='Outfits per user')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded data')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = self.seed(options['users'], options['items'], options['outfits'])
+            self.run(user, options['repeat'])
+            if not options['keep']:
+                transaction.set_rollback(True)
+
+    def seed(self, user_count, item_count, outfit_count):
+        started = time.perf_counter()
+        now = timezone.now()
+        run_id = random.randint(0, 10 ** 9)
+        users = [
+            User.objects.create_user(f'bench-{run_id}-{i}', f'bench-{run_id}-{i}@example.com', 'unused')
+            for i in range(user_count)
+        ]
+
+        with explicit_timestamps(ClothingItem, Outfit):
+            for user in users:
+                items = []
+                for i in range(item_count):
+                    created = now - timedelta(minutes=item_count - i)
+                    items.append(ClothingItem(
+                        user=user, name=f'Item {i}', category=random.choice(CATEGORIES),
+                        brand=f'Brand {i % 40}', color=f'Color {i % 12}',
+                        tags=random.sample(TAGS, random.randint(0, 3)),
+                        is_favorite=random.random() < 0.1, is_worn=random.random() < 0.5,
+                        last_worn=(created - timedelta(days=random.randint(0, 365))).date(),
+                        created_at=created, updated_at=created,
+                    ))
+                ClothingItem.objects.bulk_create(items, batch_size=1000)
+                sync_item_tags(items)
+
+                outfits = []
+                for i in range(outfit_count):
+                    created = now - timedelta(minutes=outfit_count - i)
+                    outfits.append(Outfit(
+                        user=user, title=f'Outfit {i}', category=random.choice(OUTFIT_CATEGORIES),
+                        created_at=created, updated_at=created,
+                    ))
+                Outfit.objects.bulk_create(outfits, batch_size=1000)
+
+        # Link a few items to each of the target user's outfits
+        target = users[0]
+        item_ids = list(ClothingItem.objects.filter(user=target).values_list('id', flat=True))
+        through = Outfit.items.through
+        links = [
+            through(outfit_id=outfit_id, clothingitem_id=item_id)
+            for outfit_id in Outfit.objects.filter(user=target).values_list('id', flat=True)
+            for item_id in random.sample(item_ids, min(4, len(item_ids)))
+        ]
+        through.objects.bulk_create(links, batch_size=1000)
+
+        # Fresh statistics so the planner sees the seeded distribution
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        self.stdout.write(
+            f"Seeded {user_count} users x ({item_count} items, {outfit_count} outfits) "
+            f"on {connection.vendor} in {time.perf_counter() - started:.1f}s\n"
+        )
+        return target
+
+    def queries(self, user):
+        items = ClothingItem.objects.filter(user=user)
+        outfits = Outfit.objects.filter(user=user)
+        keyset = items.order_by('-created_at', '-id')
+        deep = keyset[items.count() // 2:items.count() // 2 + 1].get()
+        recent = timezone.now() - timedelta(minutes=30)
+
+        return [
+            ('clothing-items/ (full list)', items),
+            ('clothing-items/?page_size=50', keyset[:PAGE_SIZE + 1]),
+            ('clothing-items/ deep cursor page', keyset.filter(created_at__lt=deep.created_at)[:PAGE_SIZE + 1]),
+            ('clothing-items/ validator', items.order_by().values('user').annotate(
+                latest=Max('updated_at'), count=Count('id'))),
+            ('clothing-items/?category=Tops', self.filtered(user, items, 'category=Tops')),
+            ('clothing-items/?brand=Brand 7', self.filtered(user, items, 'brand=Brand+7')),
+            ('clothing-items/?is_favorite=true', self.filtered(user, items, 'is_favorite=true')),
+            ('clothing-items/?is_worn=false', self.filtered(user, items, 'is_worn=false')),
+            ('clothing-items/?last_worn_after=<30 days ago>', self.filtered(
+                user, items, f"last_worn_after={(timezone.now() - timedelta(days=30)).date()}")),
+            ('clothing-items/?tags=summer,linen', self.filtered(user, items, 'tags=summer,linen')),
+            ('clothing-items/?category=Tops&color=Color 3&tags=summer',
+             self.filtered(user, items, 'category=Tops&color=Color+3&tags=summer')),
+            ('outfits/ (full list)', outfits.order_by('-created_at')),
+            ('outfits/?category=Work', outfits.filter(category='Work').order_by('-created_at')),
+            ('outfits/?page_size=50', outfits.order_by('-created_at', '-id')[:PAGE_SIZE + 1]),
+            ('outfits/?category=Work&page_size=50',
+             outfits.filter(category='Work').order_by('-created_at', '-id')[:PAGE_SIZE + 1]),
+            ('sync/?since=<30 min ago> items', items.filter(updated_at__gte=recent)),
+            ('sync/?since=<30 min ago> outfits', outfits.filter(updated_at__gte=recent)),
+        ]
+
+    def filtered(self, user, items, query):
+        return filter_clothing_items(items, user, QueryDict(query)).order_by('-created_at', '-id')[:PAGE_SIZE + 1]
+
+    def run(self, user, repeat):
+        for name, queryset in self.queries(user):
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                rows = len(list(queryset.all()))
+                timings.append(time.perf_counter() - started)
+
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{name}: {rows} rows, median {statistics.median(timings) * 1000:.2f} ms"
+            ))
+            for line in queryset.explain().splitlines():
+                self.stdout.write(f"    {line}")
@@ -0,0 +1,93 @@
+"""
+Measure search latency on a seeded index.
+
+    python manage.py bench_search --rows 100000 --users 10
+
+Seeds --rows clothing items spread over --users users (plus a tenth as
+many outfits), indexes them in bulk and times the search for a set of
+queries against the first user's closet. Runs on the configured database,
+so it reports FTS5 numbers on SQLite and tsvector/GIN numbers on
+PostgreSQL. Everything is rolled back at the end.
+"""
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from accounts.models import ClothingItem, Outfit
+from accounts import search
+import statistics
+import random
+import time
+
+ADJECTIVES = ['blue', 'black', 'white', 'linen', 'wool', 'denim', 'silk', 'vintage', 'striped', 'cropped']
+NOUNS = ['shirt', 'jeans', 'dress', 'jacket', 'sneakers', 'scarf', 'coat', 'skirt', 'hoodie', 'boots']
+BRANDS = ['Uniqlo', 'Levis', 'Zara', 'Nike', 'Patagonia', 'COS', 'Arket', 'Adidas']
+TAGS = ['summer', 'winter', 'work', 'weekend', 'party', 'gym', 'travel']
+CATEGORIES = [choice for choice, _ in ClothingItem.CATEGORY_CHOICES]
+
+QUERIES = ['blue', 'linen shirt', 'vin', 'uniqlo jacket', 'winter wool coat', 'nothingmatches']
+BATCH_SIZE = 2000
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the search endpoint query on a seeded index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100_000)
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = self.seed(options['rows'], options['users'])
+            self.run(user, options['repeat'])
+            transaction.set_rollback(True)
+
+    def seed(self, rows, user_count):
+        started = time.perf_counter()
+        run_id = random.randint(0, 10 ** 9)
+        users = [
+            User.objects.create_user(f'search-{run_id}-{i}', f'search-{run_id}-{i}@example.com', 'unused')
+            for i in range(user_count)
+        ]
+
+        for start in range(0, rows, BATCH_SIZE):
+            items = ClothingItem.objects.bulk_create([
+                ClothingItem(
+                    user=users[i % user_count],
+                    name=f"{random.choice(ADJECTIVES)} {random.choice(ADJECTIVES)} {random.choice(NOUNS)}",
+                    brand=random.choice(BRANDS), color=random.choice(ADJECTIVES),
+                    category=random.choice(CATEGORIES), tags=random.sample(TAGS, 2),
+                )
+                for i in range(start, min(start + BATCH_SIZE, rows))
+            ])
+            # bulk_create skips the signals that keep the index in sync
+            search.index_objects(items)
+
+        outfits = Outfit.objects.bulk_create([
+            Outfit(
+                user=users[i % user_count], title=f"{random.choice(TAGS)} {random.choice(NOUNS)} look",
+                description=' '.join(random.sample(ADJECTIVES + NOUNS, 6)), tags=random.sample(TAGS, 2),
+            )
+            for i in range(rows // 10)
+        ], batch_size=BATCH_SIZE)
+        search.index_objects(outfits)
+
+        self.stdout.write(
+            f"Seeded and indexed {rows} items and {rows // 10} outfits for {user_count} users "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
+        return users[0]
+
+    def run(self, user, repeat):
+        for query in QUERIES:
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                results = search.search(user, query, limit=20)
+                timings.append(time.perf_counter() - started)
+            timings.sort()
+            self.stdout.write(
+                f"{query!r:22} {len(results):3} results  "
+                f"median {statistics.median(timings) * 1000:7.2f} ms  "
+                f"max {timings[-1] * 1000:7.2f} ms"
+            )
@@ -0,0 +1,70 @@
+"""
+Measure outfit suggestion latency on a seeded closet.
+
+    python manage.py bench_suggestions --items 1000
+
+Seeds one closet of --items clothing items and times suggest() with cold
+features (built from the database) and with cached features. Everything
+is rolled back at the end.
+"""
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from datetime import date, timedelta
+from accounts.models import ClothingItem
+from accounts import suggestions
+import statistics
+import random
+import time
+
+COLORS = ['Black', 'White', 'Navy', 'Beige', 'Red', 'Olive Green', 'Sky Blue', 'Mustard', 'Pink', 'Grey', 'Teal']
+TAGS = ['summer', 'winter', 'work', 'weekend', 'party', 'gym', 'travel', 'linen', 'wool', 'denim']
+CATEGORIES = [choice for choice, _ in ClothingItem.CATEGORY_CHOICES]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark outfit suggestions on a seeded closet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=1000)
+        parser.add_argument('--limit', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = self.seed(options['items'])
+            self.run(user, options['limit'], options['repeat'])
+            transaction.set_rollback(True)
+
+    def seed(self, count):
+        run_id = random.randint(0, 10 ** 9)
+        user = User.objects.create_user(f'suggest-{run_id}', f'suggest-{run_id}@example.com', 'unused')
+        today = date.today()
+        ClothingItem.objects.bulk_create([
+            ClothingItem(
+                user=user, name=f'Item {i}', category=random.choice(CATEGORIES),
+                color=random.choice(COLORS), tags=random.sample(TAGS, random.randint(0, 3)),
+                is_favorite=random.random() < 0.1,
+                last_worn=today - timedelta(days=random.randint(0, 90)) if random.random() < 0.7 else None,
+            )
+            for i in range(count)
+        ], batch_size=2000)
+        suggestions.invalidate(user.id)
+        self.stdout.write(f"Seeded {count} items")
+        return user
+
+    def run(self, user, limit, repeat):
+        for label, warm in (('cold', False), ('cached', True)):
+            timings = []
+            for _ in range(repeat):
+                if not warm:
+                    suggestions.invalidate(user.id)
+                started = time.perf_counter()
+                picked = suggestions.suggest(user.id, limit)
+                timings.append(time.perf_counter() - started)
+            timings.sort()
+            self.stdout.write(
+                f"{label:7} {len(picked):3} outfits  "
+                f"median {statistics.median(timings) * 1000:7.2f} ms  "
+                f"max {timings[-1] * 1000:7.2f} ms"
+            )
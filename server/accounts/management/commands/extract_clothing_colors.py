@@ -0,0 +1,80 @@
+"""
+Find the dominant color of clothing items stored before colors were
+extracted (see accounts.colors), so they show up in ?color_near= queries.
+
+    python manage.py extract_clothing_colors
+    python manage.py extract_clothing_colors --user 42 --all --batch-size 500
+
+Works through the items in id-ordered batches. Within a batch the
+smallest stored rendition of each image is read from storage on a pool of
+threads and handed to the image process pool as soon as it arrives, so
+storage reads and color extraction overlap; each batch is saved with one
+bulk_update.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+from accounts.models import ClothingItem
+from accounts.processing import get_executor
+from accounts import colors, imaging
+from .hash_clothing_images import smallest_rendition
+import time
+
+BATCH_SIZE = 200
+READ_THREADS = 8
+
+
+class Command(BaseCommand):
+    help = 'Extract dominant colors for stored clothing images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='Only this user id')
+        parser.add_argument('--all', action='store_true', help='Also redo items that have a color')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        items = ClothingItem.objects.exclude(Q(image='') | Q(image__isnull=True)).filter(image_status='ready')
+        if options['user']:
+            items = items.filter(user_id=options['user'])
+        if not options['all']:
+            items = items.filter(image_color='')
+        items = items.only('id', 'image', 'image_variants', *ClothingItem.COLOR_COLUMNS, 'image_color').order_by('id')
+
+        executor = get_executor()
+        readers = ThreadPoolExecutor(max_workers=READ_THREADS, thread_name_prefix='color-backfill')
+        done, failed, last_id = 0, 0, 0
+        try:
+            while True:
+                batch = list(items.filter(id__gt=last_id)[:options['batch_size']])
+                if not batch:
+                    break
+                last_id = batch[-1].id
+
+                def extract(item):
+                    with item.image.storage.open(smallest_rendition(item), 'rb') as source:
+                        data = source.read()
+                    return executor.submit(imaging.image_color, data).result()
+
+                now = timezone.now()
+                changed = []
+                for item, future in [(item, readers.submit(extract, item)) for item in batch]:
+                    try:
+                        item.image_color = future.result()
+                    except Exception as e:
+                        self.stderr.write(f"Could not extract the color of item {item.id}: {str(e)}")
+                        failed += 1
+                        continue
+                    # bulk_update skips save(), which derives these and updated_at
+                    for name, value in zip(ClothingItem.COLOR_COLUMNS, colors.columns(item.image_color)):
+                        setattr(item, name, value)
+                    item.updated_at = now
+                    changed.append(item)
+                ClothingItem.objects.bulk_update(changed, ['image_color', *ClothingItem.COLOR_COLUMNS, 'updated_at'])
+                done += len(changed)
+                self.stdout.write(f"{done} colors extracted, {failed} failed")
+        finally:
+            readers.shutdown()
+
+        self.stdout.write(f"Extracted {done} colors ({failed} failed) in {time.perf_counter() - started:.1f}s")
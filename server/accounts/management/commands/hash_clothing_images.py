@@ -0,0 +1,87 @@
+"""
+Compute perceptual hashes for clothing items stored before hashing
+existed, then flag duplicates in the affected closets (see
+accounts.duplicates).
+
+    python manage.py hash_clothing_images
+    python manage.py hash_clothing_images --user 42 --rehash
+
+The smallest stored rendition of each image is read from storage and
+hashed on the image process pool, BATCH_SIZE items at a time.
+"""
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from accounts.models import ClothingItem
+from accounts.processing import get_executor
+from accounts import duplicates, imaging
+import time
+
+BATCH_SIZE = 200
+
+
+def smallest_rendition(item):
+    """Storage name of the smallest stored copy of an item's image"""
+    variants = item.image_variants or {}
+    for name in sorted(variants, key=lambda n: variants[n].get('width') or 0):
+        for fmt in ('jpeg', 'webp'):
+            if variants[name].get(fmt):
+                return variants[name][fmt]
+    return item.image.name
+
+
+class Command(BaseCommand):
+    help = 'Hash stored clothing images and flag near-duplicates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='Only this user id')
+        parser.add_argument('--rehash', action='store_true', help='Also rehash items that have a hash')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        items = ClothingItem.objects.exclude(Q(image='') | Q(image__isnull=True)).filter(image_status='ready')
+        if options['user']:
+            items = items.filter(user_id=options['user'])
+        if not options['rehash']:
+            items = items.filter(image_hash__isnull=True)
+        items = items.only('id', 'user_id', 'image', 'image_variants', 'image_hash').order_by('id')
+
+        executor = get_executor()
+        hashed, failed, users, last_id = 0, 0, set(), 0
+        while True:
+            batch = list(items.filter(id__gt=last_id)[:options['batch_size']])
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            futures = []
+            for item in batch:
+                try:
+                    with item.image.storage.open(smallest_rendition(item), 'rb') as source:
+                        futures.append((item, executor.submit(imaging.image_hash, source.read())))
+                except Exception as e:
+                    self.stderr.write(f"Could not read the image of item {item.id}: {str(e)}")
+                    failed += 1
+
+            changed = []
+            for item, future in futures:
+                try:
+                    item.image_hash = future.result()
+                    changed.append(item)
+                except Exception as e:
+                    self.stderr.write(f"Could not hash the image of item {item.id}: {str(e)}")
+                    failed += 1
+            # bulk_update skips the signal that flags duplicates; closets are reflagged below
+            ClothingItem.objects.bulk_update(changed, ['image_hash'])
+            hashed += len(changed)
+            users.update(item.user_id for item in changed)
+
+        flagged = 0
+        for user_id in users:
+            duplicates.invalidate(user_id)
+            flagged += duplicates.reflag_closet(user_id)
+
+        self.stdout.write(
+            f"Hashed {hashed} images ({failed} failed) in {len(users)} closets; "
+            f"{flagged} duplicate flags changed in {time.perf_counter() - started:.1f}s"
+        )
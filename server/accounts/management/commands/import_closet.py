@@ -0,0 +1,77 @@
+"""
+Import a ZIP archive into a user's closet (see accounts.closet_import).
+
+    python manage.py import_closet alice closet.zip --workers 8
+    python manage.py import_closet alice closet.zip --resume 12
+
+Images are processed on a pool of --workers processes. Re-running with
+--resume <import id> (or simply with the same archive) skips entries that
+were already imported.
+"""
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from accounts.models import ClosetImport, ClothingItem
+from accounts.closet_import import run_import, BATCH_SIZE
+from accounts.processing import new_executor
+import time
+import os
+
+
+class Command(BaseCommand):
+    help = 'Import clothing items and images from a ZIP archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('archive')
+        parser.add_argument('--category', default='Tops', help='Category for entries that have none')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+        parser.add_argument('--resume', type=int, metavar='IMPORT_ID', help='Continue an earlier import')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['username']}")
+        if options['category'] not in dict(ClothingItem.CATEGORY_CHOICES):
+            raise CommandError(f"Unknown category {options['category']}")
+
+        archive_path = os.path.abspath(options['archive'])
+        if not os.path.exists(archive_path):
+            raise CommandError(f"No such file: {archive_path}")
+
+        if options['resume']:
+            try:
+                job = ClosetImport.objects.get(id=options['resume'], user=user)
+            except ClosetImport.DoesNotExist:
+                raise CommandError(f"No import {options['resume']} for {user.username}")
+            job.archive_path = archive_path
+        else:
+            job = ClosetImport.objects.create(
+                user=user, archive_path=archive_path, default_category=options['category']
+            )
+
+        started = time.perf_counter()
+
+        def progress(job):
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"[{job.processed}/{job.total}] {job.created} created, {job.skipped} skipped, "
+                f"{job.failed} failed ({job.processed / elapsed:.1f} entries/s)"
+            )
+
+        self.stdout.write(f"Import {job.id}: {archive_path}")
+        executor = new_executor(options['workers'])
+        try:
+            job = run_import(job, batch_size=options['batch_size'], progress=progress, executor=executor)
+        finally:
+            executor.shutdown()
+        for error in job.errors:
+            self.stderr.write(f"  {error['entry']}: {error['error']}")
+
+        if job.status != 'done':
+            raise CommandError(f"Import {job.id} {job.status}; resume with --resume {job.id}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Import {job.id} done in {time.perf_counter() - started:.1f}s: "
+            f"{job.created} created, {job.skipped} skipped, {job.failed} failed"
+        ))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from accounts.sync import prune_tombstones, TOMBSTONE_RETENTION
+
+
+class Command(BaseCommand):
+    help = 'Delete sync tombstones older than the retention window'
+
+    def handle(self, *args, **options):
+        deleted = prune_tombstones()
+        self.stdout.write(f"Deleted {deleted} tombstones older than {TOMBSTONE_RETENTION.days} days")
@@ -0,0 +1,30 @@
+"""
+Rebuild the search index (accounts.search) from the clothing item and
+outfit tables. Needed once after migrating, and after any bulk change
+that bypassed the save/delete signals.
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from accounts.models import ClothingItem, Outfit
+from accounts import search
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the clothing item and outfit search index'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            search.clear_index()
+            for model in (ClothingItem, Outfit):
+                batch, total = [], 0
+                for instance in model.objects.order_by().only('id', 'user_id', *search.SEARCH_FIELDS[model]).iterator(chunk_size=BATCH_SIZE):
+                    batch.append(instance)
+                    if len(batch) == BATCH_SIZE:
+                        search.index_objects(batch)
+                        total += len(batch)
+                        batch = []
+                search.index_objects(batch)
+                total += len(batch)
+                self.stdout.write(f"Indexed {total} {model._meta.verbose_name_plural}")
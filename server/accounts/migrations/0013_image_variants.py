@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 05:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0012_image_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clothingitem',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='outfit',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
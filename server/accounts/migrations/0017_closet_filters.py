@@ -0,0 +1,90 @@
+# Generated by Django 5.2.4 on 2026-10-18 05:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+TAG_MAX_LENGTH = 100
+
+
+def index_tags(apps, schema_editor):
+    """GIN index for jsonb containment on PostgreSQL, the side table everywhere else"""
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS clothing_tags_gin_idx '
+            'ON accounts_clothingitem USING GIN (tags jsonb_path_ops)'
+        )
+        return
+
+    ClothingItem = apps.get_model('accounts', 'ClothingItem')
+    ClothingItemTag = apps.get_model('accounts', 'ClothingItemTag')
+    rows = []
+    for item_id, user_id, tags in ClothingItem.objects.values_list('id', 'user_id', 'tags').iterator():
+        if isinstance(tags, str):
+            tags = tags.split(',')
+        values = {str(tag).strip()[:TAG_MAX_LENGTH] for tag in tags or [] if str(tag).strip()}
+        rows.extend(ClothingItemTag(item_id=item_id, user_id=user_id, tag=tag) for tag in values)
+    ClothingItemTag.objects.bulk_create(rows, batch_size=1000)
+
+
+def drop_tag_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS clothing_tags_gin_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0016_list_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClothingItemTag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tag', models.CharField(max_length=100)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='clothingitem',
+            index=models.Index(fields=['user', 'category', '-created_at', '-id'], name='clothing_user_cat_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='clothingitem',
+            index=models.Index(fields=['user', 'is_favorite', '-created_at', '-id'], name='clothing_user_fav_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='clothingitem',
+            index=models.Index(fields=['user', 'brand'], name='clothing_user_brand_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='clothingitem',
+            index=models.Index(fields=['user', 'color'], name='clothing_user_color_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='clothingitem',
+            index=models.Index(fields=['user', 'last_worn'], name='clothing_user_last_worn_idx'),
+        ),
+        migrations.AddField(
+            model_name='clothingitemtag',
+            name='item',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tag_index', to='accounts.clothingitem'),
+        ),
+        migrations.AddField(
+            model_name='clothingitemtag',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='clothingitemtag',
+            index=models.Index(fields=['user', 'tag', 'item'], name='clothing_tag_user_tag_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='clothingitemtag',
+            constraint=models.UniqueConstraint(fields=('item', 'tag'), name='clothing_item_tag_unique'),
+        ),
+        migrations.RunPython(index_tags, drop_tag_index),
+    ]
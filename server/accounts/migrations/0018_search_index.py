@@ -0,0 +1,36 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    """See accounts.search for the layout of the table on each backend"""
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE TABLE accounts_search_index ('
+            'id bigint PRIMARY KEY, user_id integer NOT NULL, document tsvector NOT NULL)'
+        )
+        schema_editor.execute(
+            'CREATE INDEX accounts_search_document_idx ON accounts_search_index USING GIN (document)'
+        )
+        schema_editor.execute(
+            'CREATE INDEX accounts_search_user_idx ON accounts_search_index (user_id)'
+        )
+    else:
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE accounts_search_index USING fts5('
+            "owner, title, tags, details, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    schema_editor.execute('DROP TABLE IF EXISTS accounts_search_index')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0017_closet_filters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
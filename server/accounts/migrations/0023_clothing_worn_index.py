@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-18 07:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0022_upload_confirmation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='clothingitem',
+            index=models.Index(fields=['user', 'is_worn', '-created_at', '-id'], name='clothing_user_worn_created_idx'),
+        ),
+    ]
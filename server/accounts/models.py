@@ -1,6 +1,8 @@
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 from django.contrib.auth.models import User
 from .storage import MediaStorage
+from . import colors
 import uuid
 
 def user_avatar_path(instance, filename):
@@ -18,6 +20,12 @@ def outfit_image_path(instance, filename):
     filename = f'{uuid.uuid4()}.{ext}'
     return f'outfits/{instance.user.id}/{filename}'
 
+IMAGE_STATUS_CHOICES = [
+    ('ready', 'Ready'),
+    ('processing', 'Processing'),
+    ('failed', 'Failed'),
+]
+
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     bio = models.TextField(max_length=500, blank=True)
@@ -27,13 +35,24 @@ class UserProfile(models.Model):
         blank=True,
         storage=MediaStorage
     )
+    avatar_status = models.CharField(max_length=20, choices=IMAGE_STATUS_CHOICES, default='ready')
     followers_count = models.IntegerField(default=0)
     following_count = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.user.username}'s profile"
 
+    @classmethod
+    def for_user(cls, user):
+        """The user's profile, from the auth cache when available, created if missing"""
+        try:
+            return user.profile
+        except cls.DoesNotExist:
+            profile, _ = cls.objects.get_or_create(user=user)
+            return profile
+
 class ClothingItem(models.Model):
     CATEGORY_CHOICES = [
         ('Tops', 'Tops'),
@@ -56,20 +75,69 @@ class ClothingItem(models.Model):
         blank=True,
         storage=MediaStorage
     )
+    image_status = models.CharField(max_length=20, choices=IMAGE_STATUS_CHOICES, default='ready')
+    image_variants = models.JSONField(default=dict, blank=True)
+    # Perceptual hash of the stored image and the older item it nearly matches (see accounts.duplicates)
+    image_hash = models.BigIntegerField(null=True, blank=True, editable=False)
+    duplicate_of = models.ForeignKey(
+        'self', on_delete=models.SET_NULL, null=True, blank=True, editable=False, related_name='duplicates'
+    )
+    # Dominant color of the stored image, and its Lab coordinates and bucket for ?color_near=
+    image_color = models.CharField(max_length=7, blank=True, default='', editable=False)
+    color_bucket = models.SmallIntegerField(null=True, blank=True, editable=False)
+    color_l = models.SmallIntegerField(null=True, blank=True, editable=False)
+    color_a = models.SmallIntegerField(null=True, blank=True, editable=False)
+    color_b = models.SmallIntegerField(null=True, blank=True, editable=False)
     image_url = models.URLField(blank=True, null=True, help_text="URL reference for external images")
     tags = models.JSONField(default=list, blank=True)
     is_favorite = models.BooleanField(default=False)
     is_worn = models.BooleanField(default=False)
     last_worn = models.DateField(blank=True, null=True)
+    # Identifies the archive entry an imported item came from (see accounts.closet_import)
+    import_key = models.CharField(max_length=255, blank=True, default='')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'import_key'],
+                condition=~models.Q(import_key=''),
+                name='clothing_user_import_key_unique',
+            ),
+        ]
+        indexes = [
+            # Closet list and its cursor pagination: filter(user) order by -created_at, -id
+            models.Index(fields=['user', '-created_at', '-id'], name='clothing_user_created_idx'),
+            models.Index(fields=['user', 'updated_at'], name='clothing_user_updated_idx'),
+            # Closet filters (see accounts.filters); each keeps the list ordering after the filter column
+            models.Index(fields=['user', 'category', '-created_at', '-id'], name='clothing_user_cat_created_idx'),
+            models.Index(fields=['user', 'is_favorite', '-created_at', '-id'], name='clothing_user_fav_created_idx'),
+            models.Index(fields=['user', 'is_worn', '-created_at', '-id'], name='clothing_user_worn_created_idx'),
+            models.Index(fields=['user', 'brand'], name='clothing_user_brand_idx'),
+            models.Index(fields=['user', 'color'], name='clothing_user_color_idx'),
+            models.Index(fields=['user', 'last_worn'], name='clothing_user_last_worn_idx'),
+            models.Index(fields=['user', 'color_bucket', '-created_at', '-id'], name='clothing_user_colorbkt_idx'),
+            # Loading a closet's hashes for duplicate lookups
+            models.Index(fields=['user', 'image_hash'], name='clothing_user_image_hash_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username}'s {self.name}"
 
+    COLOR_COLUMNS = ('color_bucket', 'color_l', 'color_a', 'color_b')
+
+    def save(self, *args, **kwargs):
+        # The color columns are derived from image_color
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'image_color' in update_fields:
+            for name, value in zip(self.COLOR_COLUMNS, colors.columns(self.image_color)):
+                setattr(self, name, value)
+            if update_fields is not None:
+                kwargs['update_fields'] = [*update_fields, *self.COLOR_COLUMNS]
+        super().save(*args, **kwargs)
+
     def get_display_image(self):
         if self.image:
             return self.image.url
@@ -81,6 +149,27 @@ class ClothingItem(models.Model):
     def is_external_image(self):
         return bool(self.image_url and not self.image)
 
+class ClothingItemTag(models.Model):
+    """
+    One row per (item, tag), used for tag filters on databases without
+    jsonb containment. On PostgreSQL the GIN index on ClothingItem.tags is
+    used instead and this table stays empty (see accounts.filters).
+    """
+    item = models.ForeignKey(ClothingItem, on_delete=models.CASCADE, related_name='tag_index')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    tag = models.CharField(max_length=100)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['item', 'tag'], name='clothing_item_tag_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'tag', 'item'], name='clothing_tag_user_tag_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.tag} on item {self.item_id}"
+
 class Outfit(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='outfits')
     title = models.CharField(max_length=200)
@@ -97,6 +186,8 @@ class Outfit(models.Model):
         blank=True,
         storage=MediaStorage
     )
+    image_status = models.CharField(max_length=20, choices=IMAGE_STATUS_CHOICES, default='ready')
+    image_variants = models.JSONField(default=dict, blank=True)
     tags = models.JSONField(default=list, blank=True)
     liked = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -104,6 +195,114 @@ class Outfit(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='outfit_user_created_idx'),
+            models.Index(fields=['user', 'category', '-created_at', '-id'], name='outfit_user_cat_created_idx'),
+            models.Index(fields=['user', 'updated_at'], name='outfit_user_updated_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.title}"
+
+    def change_items(self, add_ids=(), remove_ids=()):
+        """
+        Add and remove items by id in one transaction.
+
+        Only the membership diff is written, with a bulk insert and a single
+        delete on the through table. Ownership must be checked by the caller.
+        Returns the (added, removed) id lists.
+        """
+        through = Outfit.items.through
+        with transaction.atomic():
+            existing = set(through.objects.filter(
+                outfit_id=self.id, clothingitem_id__in=add_ids
+            ).values_list('clothingitem_id', flat=True))
+            added = sorted(set(add_ids) - existing)
+            through.objects.bulk_create(
+                [through(outfit_id=self.id, clothingitem_id=item_id) for item_id in added],
+                ignore_conflicts=True
+            )
+
+            removed = sorted(through.objects.filter(
+                outfit_id=self.id, clothingitem_id__in=remove_ids
+            ).values_list('clothingitem_id', flat=True))
+            if removed:
+                through.objects.filter(outfit_id=self.id, clothingitem_id__in=removed).delete()
+                # Bulk deletes skip m2m_changed, so log the removals for sync here
+                Tombstone.objects.bulk_create([
+                    Tombstone(user_id=self.user_id, kind='outfit_item', object_id=self.id, related_id=item_id)
+                    for item_id in removed
+                ])
+
+            if added or removed:
+                self.updated_at = timezone.now()
+                Outfit.objects.filter(pk=self.pk).update(updated_at=self.updated_at)
+
+        # Drop any stale prefetched items
+        getattr(self, '_prefetched_objects_cache', {}).pop('items', None)
+        return added, removed
+
+
+class ClosetImport(models.Model):
+    """Progress of one archive import (see accounts.closet_import)"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='closet_imports')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    archive_path = models.CharField(max_length=500)
+    # Archives uploaded through the API are removed once the import is done
+    remove_archive = models.BooleanField(default=False)
+    default_category = models.CharField(max_length=50, default='Tops')
+    total = models.IntegerField(default=0)
+    processed = models.IntegerField(default=0)
+    created = models.IntegerField(default=0)
+    skipped = models.IntegerField(default=0)
+    failed = models.IntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Import {self.id} for {self.user.username} ({self.status})"
+
+
+class UploadConfirmation(models.Model):
+    """A direct upload that was confirmed, so its token can't be replayed (see accounts.uploads)"""
+    key = models.CharField(max_length=255, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Upload {self.key} confirmed at {self.created_at}"
+
+
+class Tombstone(models.Model):
+    """A deleted row, or an item removed from an outfit, kept for delta sync"""
+    KIND_CHOICES = [
+        ('clothing_item', 'Clothing item'),
+        ('outfit', 'Outfit'),
+        ('outfit_item', 'Outfit item'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='tombstones')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    # For 'outfit_item', object_id is the outfit and related_id the item
+    related_id = models.BigIntegerField(null=True, blank=True)
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'deleted_at'], name='tombstone_user_deleted_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.user.username} - {self.title}"
\ No newline at end of file
+        return f"{self.kind} {self.object_id} deleted at {self.deleted_at}"
@@ -0,0 +1,116 @@
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+import json
+
+
+def _cursor_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+class CreatedAtCursorPagination(CursorPagination):
+    """
+    Keyset pagination over (created_at, id), newest first.
+
+    Matches the models' Meta.ordering, with id as a tie-breaker so the
+    cursor is stable. The cursor holds the last row's values of both
+    ordering fields, so each page is a single indexed range query (deep
+    pages cost the same as the first one) and rows sharing a created_at
+    are neither skipped nor repeated. Subclasses can page over any two
+    fields whose combination is unique.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+    def _fields(self, reverse):
+        """[(field, lookup)] rows after the cursor must satisfy, in order"""
+        fields = []
+        for name in self.ordering:
+            descending = name.startswith('-')
+            fields.append((name.lstrip('-'), 'lt' if descending != reverse else 'gt'))
+        return fields
+
+    def _after(self, position, reverse):
+        (first, first_lookup), (second, second_lookup) = self._fields(reverse)
+        return (
+            Q(**{f'{first}__{first_lookup}': position[0]})
+            | Q(**{first: position[0], f'{second}__{second_lookup}': position[1]})
+        )
+
+    def _position(self, instance):
+        # Strings round-trip through the model fields' own parsing
+        return [_cursor_value(getattr(instance, name)) for name, _ in self._fields(False)]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor.reverse)
+        position = None
+        if cursor and cursor.position:
+            try:
+                position = json.loads(cursor.position)
+            except ValueError:
+                raise NotFound(self.invalid_cursor_message)
+            if not isinstance(position, list) or len(position) != 2:
+                raise NotFound(self.invalid_cursor_message)
+
+        order = [f'-{name}' if lookup == 'lt' else name for name, lookup in self._fields(reverse)]
+        queryset = queryset.order_by(*order)
+        if position is not None:
+            try:
+                queryset = queryset.filter(self._after(position, reverse))
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+
+        # Coming from a cursor means there is something on its other side
+        self.has_next = position is not None if reverse else has_more
+        self.has_previous = has_more if reverse else position is not None
+        self.next_position = self._position(self.page[-1]) if self.page else position
+        self.previous_position = self._position(self.page[0]) if self.page else position
+        return self.page
+
+    def _link(self, position, reverse):
+        return self.encode_cursor(Cursor(offset=0, reverse=reverse, position=json.dumps(position)))
+
+    def get_next_link(self):
+        return self._link(self.next_position, False) if self.has_next else None
+
+    def get_previous_link(self):
+        return self._link(self.previous_position, True) if self.has_previous else None
+
+
+def wants_pagination(request):
+    """Pagination is opt-in so existing clients keep getting a plain list"""
+    params = request.query_params
+    return 'cursor' in params or 'page_size' in params
+
+
+def paginated_response(request, queryset, serializer_class, context=None):
+    """
+    Serialize one cursor page of `queryset`.
+
+    Returns a DRF Response shaped as {'next', 'previous', 'results'} where
+    next/previous are URLs carrying an opaque cursor.
+    """
+    paginator = CreatedAtCursorPagination()
+    page = paginator.paginate_queryset(queryset, request)
+    serializer = serializer_class(page, many=True, context=context or {})
+    return paginator.get_paginated_response(serializer.data)
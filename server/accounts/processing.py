@@ -0,0 +1,299 @@
+"""
+Background image processing for uploads.
+
+CPU-bound work (decode, resize, encode) is handed to a pluggable executor:
+a process pool in production and an inline executor in tests. Once the
+derivatives are ready they are written to storage and swapped into the
+model's image field, and the matching `<field>_status` column moves from
+'processing' to 'ready' (or 'failed').
+"""
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, connection
+import multiprocessing
+import threading
+import tempfile
+import logging
+import shutil
+import uuid
+import os
+from . import imaging
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_process_pool = None
+_io_pool = None
+
+
+class InlineExecutor:
+    """Runs jobs immediately in the calling thread. Used in tests."""
+    inline = True
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def shutdown(self, wait=True):
+        pass
+
+
+def new_executor(workers):
+    """
+    A new executor with `workers` processes (inline when so configured),
+    for jobs that size their own pool. The caller shuts it down.
+    """
+    if getattr(settings, 'IMAGE_PROCESSING_EXECUTOR', 'process') == 'inline':
+        return InlineExecutor()
+    # Spawned workers only import accounts.imaging, so they never
+    # inherit the parent's database connections or threads
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+def get_executor():
+    """Return the executor configured by IMAGE_PROCESSING_EXECUTOR"""
+    global _process_pool
+    if getattr(settings, 'IMAGE_PROCESSING_EXECUTOR', 'process') == 'inline':
+        return InlineExecutor()
+
+    with _lock:
+        if _process_pool is None:
+            _process_pool = new_executor(getattr(settings, 'IMAGE_PROCESSING_WORKERS', 2))
+        return _process_pool
+
+
+def _get_io_pool():
+    global _io_pool
+    with _lock:
+        if _io_pool is None:
+            _io_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='image-store')
+        return _io_pool
+
+
+def save_fields(instance, fields):
+    """save(update_fields=...) that also writes auto_now timestamps"""
+    fields = list(fields)
+    if any(f.name == 'updated_at' for f in instance._meta.concrete_fields):
+        fields.append('updated_at')
+    instance.save(update_fields=fields)
+
+
+def _variant_name(base_name, variant, fmt):
+    stem = base_name.rsplit('.', 1)[0]
+    extension = 'jpg' if fmt == 'jpeg' else fmt
+    return f"{stem}_{variant}.{extension}"
+
+
+def stored_image_names(instance, field_name):
+    """Storage names of an image field's file and all of its derivatives"""
+    field_file = getattr(instance, field_name)
+    names = [field_file.name] if field_file else []
+    for variant in (getattr(instance, f'{field_name}_variants', None) or {}).values():
+        names.extend(v for k, v in variant.items() if k not in ('width', 'height'))
+    return names
+
+
+def delete_image(instance, field_name, names=None):
+    """Delete an image field's file and every stored derivative of it"""
+    field_file = getattr(instance, field_name)
+    if names is None:
+        names = stored_image_names(instance, field_name)
+
+    for name in set(names):
+        try:
+            field_file.storage.delete(name)
+        except Exception as e:
+            logger.error(f"Could not delete image {name}: {str(e)}")
+
+
+def _discard(model, field_name, names):
+    """Delete stored files that are no longer needed, such as a raw direct upload"""
+    storage = model._meta.get_field(field_name).storage
+    for name in names:
+        try:
+            storage.delete(name)
+        except Exception as e:
+            logger.error(f"Could not delete image {name}: {str(e)}")
+
+
+def _store_result(model, pk, field_name, filename, future, discard=()):
+    status_field = f'{field_name}_status'
+    variants_field = f'{field_name}_variants'
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        logger.warning(f"{model.__name__} {pk} was deleted before its image was processed")
+        _discard(model, field_name, discard)
+        return
+
+    try:
+        rendered = future.result()
+    except Exception as e:
+        logger.error(f"Image processing failed for {model.__name__} {pk}: {str(e)}")
+        setattr(instance, status_field, 'failed')
+        save_fields(instance, [status_field])
+        _discard(model, field_name, discard)
+        return
+
+    field_file = getattr(instance, field_name)
+    has_variants = hasattr(instance, variants_field)
+    old_names = stored_image_names(instance, field_name)
+    image_hash = rendered.pop('dhash', None)
+    image_color = rendered.pop('color', None)
+
+    # The full-size JPEG lives in the image field itself; everything else
+    # is stored next to it and recorded in <field>_variants
+    field_file.save(filename, ContentFile(rendered['full']['jpeg']), save=False)
+    setattr(instance, status_field, 'ready')
+    update_fields = [field_name, status_field]
+
+    if has_variants:
+        stored = {}
+        for variant, renditions in rendered.items():
+            stored[variant] = {'width': renditions['width'], 'height': renditions['height']}
+            for fmt, data in renditions.items():
+                if fmt in ('width', 'height'):
+                    continue
+                if variant == 'full' and fmt == 'jpeg':
+                    stored[variant][fmt] = field_file.name
+                else:
+                    stored[variant][fmt] = field_file.storage.save(
+                        _variant_name(field_file.name, variant, fmt), ContentFile(data)
+                    )
+        setattr(instance, variants_field, stored)
+        update_fields.append(variants_field)
+
+    # Models with <field>_hash / <field>_color columns keep the perceptual
+    # hash (see accounts.duplicates) and dominant color (see accounts.colors)
+    for suffix, value in (('hash', image_hash), ('color', image_color)):
+        if hasattr(instance, f'{field_name}_{suffix}'):
+            setattr(instance, f'{field_name}_{suffix}', value)
+            update_fields.append(f'{field_name}_{suffix}')
+
+    save_fields(instance, update_fields)
+
+    # Only drop the previous files once the new ones are in place
+    old_names.extend(discard)
+    if old_names:
+        delete_image(instance, field_name, names=old_names)
+
+    logger.info(f"Stored processed image for {model.__name__} {pk}: {field_file.name}")
+
+
+def _store_in_background(model, pk, field_name, filename, future, discard=()):
+    # Runs on a storage thread with its own database connection
+    close_old_connections()
+    try:
+        _store_result(model, pk, field_name, filename, future, discard)
+    except Exception as e:
+        logger.error(f"Storing processed image failed for {model.__name__} {pk}: {str(e)}")
+    finally:
+        connection.close()
+
+
+def _spool_upload(upload):
+    """
+    Image data to hand to a worker for a Django upload.
+
+    Small uploads are still in memory and go over as bytes. Larger ones
+    were streamed to a temp file by Django, which deletes it when the
+    request ends, so the worker gets a path to a hard link (or copy) of it.
+    """
+    if not hasattr(upload, 'temporary_file_path'):
+        upload.seek(0)
+        return upload.read()
+
+    directory = getattr(settings, 'FILE_UPLOAD_TEMP_DIR', None) or tempfile.gettempdir()
+    path = os.path.join(directory, f'oasis-image-{uuid.uuid4().hex}')
+    try:
+        os.link(upload.temporary_file_path(), path)
+    except OSError:
+        shutil.copyfile(upload.temporary_file_path(), path)
+    return path
+
+
+def _remove_spooled(path):
+    try:
+        os.remove(path)
+    except OSError as e:
+        logger.error(f"Could not remove spooled upload {path}: {str(e)}")
+
+
+def schedule_image(instance, field_name, upload, sizes=None, formats=imaging.VARIANT_FORMATS):
+    """
+    Process `upload` off the request thread and attach it to `instance`.
+
+    Renders `sizes` (imaging.VARIANT_SIZES by default) in each of `formats`;
+    the 'full' JPEG becomes the image field. `instance` must already be
+    saved. It is marked as processing straight away; with the inline
+    executor it is refreshed with the stored result before returning.
+    """
+    filename = f"{upload.name.rsplit('.', 1)[0]}.jpg"
+    return schedule_source(instance, field_name, _spool_upload(upload), filename, sizes, formats)
+
+
+def schedule_source(instance, field_name, source, filename, sizes=None,
+                    formats=imaging.VARIANT_FORMATS, discard=()):
+    """
+    Like schedule_image, for image data that is not a Django upload.
+
+    `source` is raw bytes, a local file path (removed once the worker is
+    done with it) or a URL the worker can fetch, e.g. a presigned GET for
+    an object that was uploaded straight to the bucket. Storage names in
+    `discard` are deleted once the result is stored.
+    """
+    status_field = f'{field_name}_status'
+    model = type(instance)
+
+    # Rows created as 'processing' (e.g. by a batch insert) skip this save
+    if getattr(instance, status_field) != 'processing':
+        setattr(instance, status_field, 'processing')
+        save_fields(instance, [status_field])
+
+    executor = get_executor()
+    future = executor.submit(imaging.render_variants, source, sizes, formats)
+
+    if getattr(executor, 'inline', False):
+        _store_result(model, instance.pk, field_name, filename, future, discard)
+        instance.refresh_from_db()
+    else:
+        future.add_done_callback(
+            lambda f: _get_io_pool().submit(
+                _store_in_background, model, instance.pk, field_name, filename, f, discard
+            )
+        )
+
+    if isinstance(source, str) and not source.startswith(('http://', 'https://')):
+        future.add_done_callback(lambda f: _remove_spooled(source))
+    return future
+
+
+def process_images(model, jobs, field_name='image', sizes=None, formats=imaging.VARIANT_FORMATS, executor=None):
+    """
+    Render and store images for many saved rows, blocking until all are stored.
+
+    `jobs` is a list of (pk, source, filename) with sources as for
+    schedule_source. Rendering runs on the image executor and storage
+    writes on the storage threads, so the two overlap across jobs. Rows
+    should already be marked 'processing'. Returns the pks whose image
+    could not be rendered (those rows are marked 'failed'). Renders run
+    on `executor` when given, else on the shared one.
+    """
+    executor = executor or get_executor()
+    renders = {
+        executor.submit(imaging.render_variants, source, sizes, formats): (pk, filename)
+        for pk, source, filename in jobs
+    }
+    stores = []
+    for future in as_completed(renders):
+        pk, filename = renders[future]
+        if getattr(executor, 'inline', False):
+            _store_result(model, pk, field_name, filename, future)
+        else:
+            stores.append(_get_io_pool().submit(_store_in_background, model, pk, field_name, filename, future))
+    wait(stores)
+    return [pk for future, (pk, _) in renders.items() if future.exception() is not None]
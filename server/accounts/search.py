@@ -0,0 +1,140 @@
+"""
+Full-text search over clothing items and outfits.
+
+Both kinds share one index table, accounts_search_index, created by
+migration 0018 for the database in use:
+
+- PostgreSQL: a tsvector column with a GIN index. Names/titles get weight
+  A, tags/brand/color/occasion B and descriptions C; results are ranked
+  with ts_rank.
+- SQLite: an FTS5 virtual table with title, tags and details columns,
+  ranked with bm25 using the same relative weights. The owner is stored
+  as an indexed token so the per-user filter is part of the MATCH.
+
+A row's id encodes what it points at: object_id * 2 + kind, with kind 0
+for clothing items and 1 for outfits. Upserts and deletes are then
+primary-key operations on both backends.
+
+Rows are kept in sync by the post_save/post_delete signals. Bulk paths
+(bulk_create, queryset.update/delete) skip signals and must call
+index_objects()/remove_objects() themselves. Run
+`manage.py rebuild_search_index` to fill the index for existing data.
+
+Queries are split into words and every word must match, as a prefix, so
+partial input such as "blu lin" finds "Blue linen shirt".
+"""
+from django.db import connection
+from .filters import tag_values
+from .models import ClothingItem, Outfit
+import re
+
+TABLE = 'accounts_search_index'
+KINDS = {ClothingItem: 0, Outfit: 1}
+KIND_NAMES = {0: 'clothing_item', 1: 'outfit'}
+
+# Columns that feed the index; saves touching none of them skip reindexing
+SEARCH_FIELDS = {
+    ClothingItem: ('name', 'brand', 'color', 'category', 'tags'),
+    Outfit: ('title', 'description', 'occasion', 'category', 'tags'),
+}
+
+MAX_TERMS = 8
+
+# Relative column weights: title, tags, details (PostgreSQL uses A, B, C)
+WEIGHTS = (10.0, 5.0, 1.0)
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _row_id(model, pk):
+    return pk * 2 + KINDS[model]
+
+
+def _document(instance):
+    """(title, tags, details) text for an item or outfit"""
+    tags = ' '.join(sorted(tag_values(instance.tags)))
+    if isinstance(instance, ClothingItem):
+        return instance.name, tags, f"{instance.brand} {instance.color} {instance.category}"
+    return instance.title, f"{tags} {instance.occasion} {instance.category}", instance.description
+
+
+def terms(query):
+    """The searchable words of a user query (lowercased, at most MAX_TERMS)"""
+    return [word.lower() for word in WORD_RE.findall(query or '')][:MAX_TERMS]
+
+
+def index_objects(instances):
+    """Add or refresh index rows for clothing items and/or outfits"""
+    rows = [
+        (_row_id(type(instance), instance.pk), instance.user_id, *_document(instance))
+        for instance in instances
+    ]
+    if not rows:
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.executemany(
+                f"INSERT INTO {TABLE} (id, user_id, document) VALUES (%s, %s, "
+                "setweight(to_tsvector('simple', %s), 'A') || "
+                "setweight(to_tsvector('simple', %s), 'B') || "
+                "setweight(to_tsvector('simple', %s), 'C')) "
+                "ON CONFLICT (id) DO UPDATE SET user_id = EXCLUDED.user_id, document = EXCLUDED.document",
+                rows,
+            )
+        else:
+            placeholders = ', '.join(['%s'] * len(rows))
+            cursor.execute(f"DELETE FROM {TABLE} WHERE rowid IN ({placeholders})", [row[0] for row in rows])
+            cursor.executemany(
+                f"INSERT INTO {TABLE} (rowid, owner, title, tags, details) VALUES (%s, %s, %s, %s, %s)",
+                [(row_id, f"u{user_id}", *document) for row_id, user_id, *document in rows],
+            )
+
+
+def remove_objects(model, pks):
+    """Drop the index rows of deleted items or outfits"""
+    row_ids = [_row_id(model, pk) for pk in pks]
+    if not row_ids:
+        return
+    key = 'id' if connection.vendor == 'postgresql' else 'rowid'
+    placeholders = ', '.join(['%s'] * len(row_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE} WHERE {key} IN ({placeholders})", row_ids)
+
+
+def clear_index():
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE}")
+
+
+def search(user, query, limit=20):
+    """
+    Rank `user`'s items and outfits against `query`.
+
+    Returns a list of (kind name, object id, score), best match first.
+    """
+    words = terms(query)
+    if not words:
+        return []
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                f"SELECT id, ts_rank(document, query) AS score "
+                f"FROM {TABLE}, to_tsquery('simple', %s) query "
+                "WHERE user_id = %s AND document @@ query "
+                "ORDER BY score DESC, id DESC LIMIT %s",
+                [' & '.join(f"{word}:*" for word in words), user.id, limit],
+            )
+        else:
+            match = f'owner : "u{user.id}" AND {{title tags details}} : (' + ' AND '.join(
+                f'"{word}"*' for word in words
+            ) + ')'
+            weights = ', '.join(str(w) for w in (0.0, *WEIGHTS))
+            cursor.execute(
+                f"SELECT rowid, -bm25({TABLE}, {weights}) AS score FROM {TABLE} "
+                f"WHERE {TABLE} MATCH %s ORDER BY score DESC, rowid DESC LIMIT %s",
+                [match, limit],
+            )
+        rows = cursor.fetchall()
+
+    return [(KIND_NAMES[row_id % 2], row_id // 2, float(score)) for row_id, score in rows]
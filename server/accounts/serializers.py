@@ -1,7 +1,27 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.db.models import Prefetch
 from django.contrib.auth import authenticate
-from .models import UserProfile, ClothingItem, Outfit
+from .models import UserProfile, ClothingItem, Outfit, ClosetImport
+
+
+def build_srcset(field_file, variants):
+    """
+    Turn stored image derivatives into {size: {'width', 'height', format: url}}
+    so clients can pick the smallest rendition that fits.
+    """
+    srcset = {}
+    try:
+        for size, variant in (variants or {}).items():
+            entry = {'width': variant.get('width'), 'height': variant.get('height')}
+            for fmt, name in variant.items():
+                if fmt not in ('width', 'height'):
+                    entry[fmt] = field_file.storage.url(name)
+            srcset[size] = entry
+    except Exception as e:
+        print(f"❌ Error building srcset: {e}")
+        return {}
+    return srcset
 
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
@@ -52,7 +72,8 @@ class UserProfileSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = UserProfile
-        fields = ('username', 'email', 'first_name', 'last_name', 'bio', 'avatar', 'followers_count', 'following_count', 'created_at')
+        fields = ('username', 'email', 'first_name', 'last_name', 'bio', 'avatar', 'avatar_status', 'followers_count', 'following_count', 'created_at')
+        read_only_fields = ('avatar_status',)
 
     def to_representation(self, instance):
         data = super().to_representation(instance)
@@ -73,10 +94,10 @@ class ClothingItemSerializer(serializers.ModelSerializer):
         model = ClothingItem
         fields = [
             'id', 'name', 'brand', 'size', 'color', 'category', 
-            'image', 'image_url', 'tags', 'is_favorite', 'is_worn',
-            'last_worn', 'created_at', 'updated_at'
+            'image', 'image_status', 'image_url', 'tags', 'is_favorite', 'is_worn',
+            'last_worn', 'image_color', 'duplicate_of', 'created_at', 'updated_at'
         ]
-        read_only_fields = ('id', 'created_at', 'updated_at')
+        read_only_fields = ('id', 'image_status', 'image_color', 'duplicate_of', 'created_at', 'updated_at')
 
     def create(self, validated_data):
         validated_data['user'] = self.context['request'].user
@@ -96,6 +117,36 @@ class ClothingItemSerializer(serializers.ModelSerializer):
             print(f"❌ Error getting clothing item image URL: {e}")
             data['image'] = None
 
+        data['srcset'] = build_srcset(instance.image, instance.image_variants)
+        return data
+
+
+class OutfitItemsChangeSerializer(serializers.Serializer):
+    """Item ids to add to and remove from an outfit in one request"""
+    add = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, default=list)
+    remove = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, default=list)
+
+    def validate(self, data):
+        add_ids = set(data['add'])
+        remove_ids = set(data['remove'])
+        if not add_ids and not remove_ids:
+            raise serializers.ValidationError('Provide item ids to add or remove')
+        if add_ids & remove_ids:
+            raise serializers.ValidationError(
+                f"Items cannot be both added and removed: {sorted(add_ids & remove_ids)}"
+            )
+
+        # One query to check ownership of everything being added
+        request = self.context['request']
+        owned_ids = set(ClothingItem.objects.filter(
+            user=request.user, id__in=add_ids
+        ).values_list('id', flat=True))
+        not_owned = sorted(add_ids - owned_ids)
+        if not_owned:
+            raise serializers.ValidationError({'add': f"Items {not_owned} do not belong to you"})
+
+        data['add'] = add_ids
+        data['remove'] = remove_ids
         return data
 
 
@@ -113,23 +164,52 @@ class OutfitSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'title', 'description', 'category', 'occasion',
             'items',  # THIS IS THE NEW FIELD ADDED
-            'image', 'tags', 'liked', 'created_at', 'updated_at'
+            'image', 'image_status', 'tags', 'liked', 'created_at', 'updated_at'
         ]
-        read_only_fields = ('id', 'created_at', 'updated_at')
+        read_only_fields = ('id', 'image_status', 'created_at', 'updated_at')
+
+    # Columns needed to render the embedded item dicts and their validators
+    ITEM_FIELDS = ('id', 'name', 'category', 'image', 'image_url', 'image_variants', 'brand', 'color', 'updated_at')
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        """Prefetch outfit items so rendering a list costs a fixed number of queries"""
+        return queryset.prefetch_related(
+            Prefetch('items', queryset=ClothingItem.objects.only(*cls.ITEM_FIELDS))
+        )
+
+    def _render_item(self, item):
+        # The same garment usually shows up in several outfits of a list,
+        # so build each dict (and resolve its image URL) only once
+        if not hasattr(self, '_item_cache'):
+            self._item_cache = {}
+        cache = self._item_cache
+        if item.id not in cache:
+            cache[item.id] = {
+                'id': item.id,
+                'name': item.name,
+                'category': item.category,
+                'image': item.get_display_image(),
+                'srcset': build_srcset(item.image, item.image_variants),
+                'brand': item.brand,
+                'color': item.color
+            }
+        return cache[item.id]
 
     def validate_items(self, value):
         """Ensure all items belong to the requesting user"""
         request = self.context.get('request')
         if request and value:
-            user_item_ids = ClothingItem.objects.filter(
-                user=request.user
-            ).values_list('id', flat=True)
-            
-            for item in value:
-                if item.id not in user_item_ids:
-                    raise serializers.ValidationError(
-                        f"Item {item.id} does not belong to you"
-                    )
+            submitted_ids = {item.id for item in value}
+            owned_ids = set(ClothingItem.objects.filter(
+                user=request.user, id__in=submitted_ids
+            ).values_list('id', flat=True))
+
+            not_owned = sorted(submitted_ids - owned_ids)
+            if not_owned:
+                raise serializers.ValidationError(
+                    f"Item {not_owned[0]} does not belong to you"
+                )
         return value
 
     def create(self, validated_data):
@@ -195,20 +275,12 @@ class OutfitSerializer(serializers.ModelSerializer):
             except Exception as e:
                 print(f"❌ Error getting outfit image URL for {instance.title}: {e}")
                 data['image'] = None
+            data['srcset'] = build_srcset(instance.image, instance.image_variants)
             
-            # Include full item details instead of just IDs
+            # Include full item details instead of just IDs.
+            # items.all() reads the prefetch cache when the view set it up
             try:
-                items_data = []
-                for item in instance.items.all():
-                    items_data.append({
-                        'id': item.id,
-                        'name': item.name,
-                        'category': item.category,
-                        'image': item.get_display_image(),
-                        'brand': item.brand,
-                        'color': item.color
-                    })
-                data['items'] = items_data
+                data['items'] = [self._render_item(item) for item in instance.items.all()]
             except Exception as e:
                 print(f"❌ Error getting outfit items: {e}")
                 data['items'] = []
@@ -235,8 +307,19 @@ class OutfitSerializer(serializers.ModelSerializer):
                 'occasion': instance.occasion if hasattr(instance, 'occasion') else '',
                 'items': [],
                 'image': None,
+                'image_status': instance.image_status if hasattr(instance, 'image_status') else 'ready',
+                'srcset': {},
                 'tags': [],
                 'liked': instance.liked if hasattr(instance, 'liked') else False,
                 'created_at': instance.created_at if hasattr(instance, 'created_at') else None,
                 'updated_at': instance.updated_at if hasattr(instance, 'updated_at') else None,
-            }
\ No newline at end of file
+            }
+
+class ClosetImportSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ClosetImport
+        fields = [
+            'id', 'status', 'total', 'processed', 'created', 'skipped', 'failed', 'errors',
+            'created_at', 'updated_at', 'finished_at',
+        ]
+        read_only_fields = fields
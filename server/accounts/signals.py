@@ -1,11 +1,146 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, pre_delete, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.contrib.auth.models import User
+from django.utils import timezone
 from rest_framework.authtoken.models import Token
-from .models import UserProfile
+from .authentication import invalidate_tokens
+from .filters import sync_item_tags
+from . import duplicates, search, suggestions
+from .models import UserProfile, ClothingItem, Outfit, Tombstone
 
 @receiver(post_save, sender=User)
 def create_user_extras(sender, instance, created, **kwargs):
     if created:
         Token.objects.create(user=instance)
-        UserProfile.objects.create(user=instance)
\ No newline at end of file
+        UserProfile.objects.create(user=instance)
+
+
+# Cached token authentication (see accounts.authentication)
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    invalidate_tokens([instance.key])
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(sender, instance, created, **kwargs):
+    # Covers deactivation as well as username/name changes
+    if not created:
+        invalidate_tokens(Token.objects.filter(user_id=instance.pk).values_list('key', flat=True))
+
+
+@receiver(post_save, sender=UserProfile)
+def invalidate_profile_tokens(sender, instance, created, **kwargs):
+    if not created:
+        invalidate_tokens(Token.objects.filter(user_id=instance.user_id).values_list('key', flat=True))
+
+
+# Tag index for closet filters (see accounts.filters)
+
+@receiver(post_save, sender=ClothingItem)
+def index_clothing_item_tags(sender, instance, created, update_fields=None, **kwargs):
+    if created and not instance.tags:
+        return
+    if update_fields is None or 'tags' in update_fields:
+        sync_item_tags([instance])
+
+
+# Outfit validators and delta sync (see accounts.conditional, accounts.sync)
+
+@receiver(pre_delete, sender=ClothingItem)
+def touch_outfits_of_deleted_item(sender, instance, **kwargs):
+    # The cascade drops the through rows without touching the outfits, so
+    # mark them changed while their membership can still be found
+    Outfit.objects.filter(items=instance).update(updated_at=timezone.now())
+
+
+# Full-text search index (see accounts.search)
+
+@receiver(post_save, sender=ClothingItem)
+@receiver(post_save, sender=Outfit)
+def index_for_search(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or set(update_fields) & set(search.SEARCH_FIELDS[sender]):
+        search.index_objects([instance])
+
+
+@receiver(post_delete, sender=ClothingItem)
+@receiver(post_delete, sender=Outfit)
+def remove_from_search(sender, instance, **kwargs):
+    search.remove_objects(sender, [instance.pk])
+
+
+# Cached outfit suggestion features (see accounts.suggestions)
+
+@receiver(post_save, sender=ClothingItem)
+def invalidate_suggestions(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is None or set(update_fields) & set(suggestions.FEATURE_FIELDS):
+        suggestions.invalidate(instance.user_id)
+
+
+@receiver(post_delete, sender=ClothingItem)
+def invalidate_suggestions_on_delete(sender, instance, **kwargs):
+    suggestions.invalidate(instance.user_id)
+
+
+# Near-duplicate photos (see accounts.duplicates)
+
+@receiver(post_save, sender=ClothingItem)
+def flag_duplicate_image(sender, instance, update_fields=None, **kwargs):
+    # Hashes are only written by image processing, with update_fields
+    if update_fields is not None and 'image_hash' in update_fields:
+        duplicates.flag_duplicate(instance)
+
+
+@receiver(pre_delete, sender=ClothingItem)
+def touch_duplicates_of_deleted_item(sender, instance, **kwargs):
+    # on_delete=SET_NULL clears duplicate_of without touching updated_at
+    ClothingItem.objects.filter(duplicate_of=instance).update(updated_at=timezone.now())
+
+
+@receiver(post_delete, sender=ClothingItem)
+def forget_image_hash(sender, instance, **kwargs):
+    if instance.image_hash is not None:
+        duplicates.invalidate(instance.user_id)
+
+
+# Deletion log for delta sync (see accounts.sync)
+
+@receiver(post_delete, sender=ClothingItem)
+def log_clothing_item_deleted(sender, instance, **kwargs):
+    Tombstone.objects.create(user_id=instance.user_id, kind='clothing_item', object_id=instance.pk)
+
+
+@receiver(post_delete, sender=Outfit)
+def log_outfit_deleted(sender, instance, **kwargs):
+    Tombstone.objects.create(user_id=instance.user_id, kind='outfit', object_id=instance.pk)
+
+
+@receiver(m2m_changed, sender=Outfit.items.through)
+def log_outfit_items_removed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        # The cleared ids are gone by post_clear, so collect them now
+        if reverse:
+            pairs = instance.outfits.values_list('id', 'user_id')
+            instance._cleared_outfit_items = [(outfit_id, instance.pk, user_id) for outfit_id, user_id in pairs]
+        else:
+            instance._cleared_outfit_items = [
+                (instance.pk, item_id, instance.user_id)
+                for item_id in instance.items.values_list('id', flat=True)
+            ]
+        return
+
+    if action == 'post_remove':
+        if reverse:
+            pairs = Outfit.objects.filter(pk__in=pk_set).values_list('id', 'user_id')
+            removed = [(outfit_id, instance.pk, user_id) for outfit_id, user_id in pairs]
+        else:
+            removed = [(instance.pk, item_id, instance.user_id) for item_id in pk_set]
+    elif action == 'post_clear':
+        removed = getattr(instance, '_cleared_outfit_items', [])
+    else:
+        return
+
+    Tombstone.objects.bulk_create([
+        Tombstone(user_id=user_id, kind='outfit_item', object_id=outfit_id, related_id=item_id)
+        for outfit_id, item_id, user_id in removed
+    ])
@@ -0,0 +1,233 @@
+"""Outfit suggestions (GET outfits/suggestions/), scored with NumPy on color, tags, recency and favorites"""
+from itertools import combinations
+from datetime import date
+from collections import Counter
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from .filters import tag_values
+from .models import ClothingItem
+import numpy as np
+import uuid
+
+CATEGORIES = [choice for choice, _ in ClothingItem.CATEGORY_CHOICES]
+CATEGORY_CODES = {category: code for code, category in enumerate(CATEGORIES)}
+
+# Shoes are left out of a template when the closet has none
+TEMPLATES = [
+    (*base, *extra)
+    for base in (('Tops', 'Bottoms', 'Shoes'), ('Dresses', 'Shoes'))
+    for extra in ((), ('Outerwear',), ('Accessories',), ('Outerwear', 'Accessories'))
+]
+OPTIONAL_SLOTS = {'Shoes'}
+
+# Fields the features are built from; saves that touch none keep the cache
+FEATURE_FIELDS = ('category', 'color', 'tags', 'is_favorite', 'last_worn')
+
+WEIGHTS = {'color': 0.4, 'tags': 0.2, 'recency': 0.25, 'favorite': 0.15}
+RECENCY_DAYS = 30
+SLOT_CANDIDATES = 12
+MAX_ITEM_REPEATS = 2
+# Only the most used tags of a closet take part in tag overlap
+MAX_TAGS = 64
+
+# Hue in degrees, or None for neutrals. A color string maps to the first
+# of these words it contains, so "Navy Blue" is navy.
+COLOR_HUES = {
+    'black': None, 'white': None, 'grey': None, 'gray': None, 'charcoal': None, 'silver': None,
+    'beige': None, 'cream': None, 'ivory': None, 'tan': None, 'khaki': None, 'camel': None,
+    'brown': None, 'nude': None, 'navy': None, 'denim': None,
+    'burgundy': 345, 'maroon': 345, 'red': 0, 'coral': 15, 'orange': 30, 'mustard': 50,
+    'gold': 50, 'yellow': 55, 'olive': 80, 'green': 120, 'mint': 150, 'teal': 175,
+    'turquoise': 180, 'blue': 215, 'lavender': 270, 'purple': 275, 'violet': 280,
+    'magenta': 300, 'pink': 330,
+}
+COLOR_NAMES = list(COLOR_HUES)
+UNKNOWN_COLOR = len(COLOR_NAMES)
+
+
+def _harmony(a, b):
+    if a is None or b is None:
+        return 0.9 if a is None and b is None else 1.0
+    distance = min(abs(a - b), 360 - abs(a - b))
+    if distance <= 30:
+        return 1.0
+    if distance >= 150:
+        return 0.85
+    if 105 <= distance <= 135:
+        return 0.7
+    return 0.3
+
+
+def _harmony_matrix():
+    hues = [COLOR_HUES[name] for name in COLOR_NAMES]
+    size = len(hues) + 1
+    matrix = np.full((size, size), 0.5, dtype=np.float32)
+    for i, a in enumerate(hues):
+        for j, b in enumerate(hues):
+            matrix[i, j] = _harmony(a, b)
+    return matrix
+
+
+HARMONY = _harmony_matrix()
+
+
+def color_code(color):
+    words = (color or '').lower().replace('-', ' ').replace('/', ' ').split()
+    for word in words:
+        if word in COLOR_HUES:
+            return COLOR_NAMES.index(word)
+    return UNKNOWN_COLOR
+
+
+def _version_key(user_id):
+    return f"closet-version:{user_id}"
+
+
+def _bump(user_id):
+    cache.set(_version_key(user_id), uuid.uuid4().hex, None)
+
+
+def invalidate(user_id):
+    """
+    Drop the cached features of `user_id`'s closet.
+
+    The version changes again once the transaction commits, so features
+    rebuilt from not yet committed data in the meantime are not kept.
+    """
+    _bump(user_id)
+    transaction.on_commit(lambda: _bump(user_id))
+
+
+def _closet_version(user_id):
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        version = uuid.uuid4().hex
+        # Another request may have set one first; use whichever won
+        cache.add(_version_key(user_id), version, None)
+        version = cache.get(_version_key(user_id), version)
+    return version
+
+
+def build_features(user_id):
+    """Feature arrays for a closet, from one query"""
+    rows = list(
+        ClothingItem.objects.filter(user_id=user_id).order_by('id')
+        .values_list('id', 'category', 'color', 'tags', 'is_favorite', 'last_worn')
+    )
+    tag_sets = [tag_values(tags) for _, _, _, tags, _, _ in rows]
+    vocabulary = [tag for tag, _ in Counter(tag for tags in tag_sets for tag in tags).most_common(MAX_TAGS)]
+    tag_columns = {tag: column for column, tag in enumerate(vocabulary)}
+
+    tag_matrix = np.zeros((len(rows), len(vocabulary)), dtype=np.float32)
+    for row, tags in enumerate(tag_sets):
+        for tag in tags:
+            if tag in tag_columns:
+                tag_matrix[row, tag_columns[tag]] = 1
+
+    return {
+        'ids': np.array([row[0] for row in rows], dtype=np.int64),
+        'category': np.array([CATEGORY_CODES.get(row[1], -1) for row in rows], dtype=np.int8),
+        'color': np.array([color_code(row[2]) for row in rows], dtype=np.int16),
+        'favorite': np.array([row[4] for row in rows], dtype=np.float32),
+        # Day ordinal of last_worn, NaN if never worn
+        'worn_day': np.array(
+            [row[5].toordinal() if row[5] else np.nan for row in rows], dtype=np.float64
+        ),
+        'tags': tag_matrix,
+        'tag_counts': tag_matrix.sum(axis=1),
+    }
+
+
+def get_features(user_id):
+    key = f"outfit-features:{user_id}:{_closet_version(user_id)}"
+    features = cache.get(key)
+    if features is None:
+        features = build_features(user_id)
+        cache.set(key, features, getattr(settings, 'OUTFIT_SUGGESTIONS_CACHE_TIMEOUT', 60))
+    return features
+
+
+def item_scores(features, today=None):
+    """Weighted recency + favorite score of every item (before dividing by outfit size)"""
+    today = (today or date.today()).toordinal()
+    days = today - features['worn_day']
+    recency = np.where(np.isnan(days), 1.0, np.clip(days, 0, RECENCY_DAYS) / RECENCY_DAYS)
+    return (WEIGHTS['recency'] * recency + WEIGHTS['favorite'] * features['favorite']).astype(np.float32)
+
+
+def _pair_scores(features, a, b):
+    colors = features['color']
+    harmony = HARMONY[colors[a][:, None], colors[b][None, :]]
+    tags = features['tags']
+    shared = tags[a] @ tags[b].T
+    union = features['tag_counts'][a][:, None] + features['tag_counts'][b][None, :] - shared
+    overlap = np.divide(shared, union, out=np.zeros_like(shared), where=union > 0)
+    return WEIGHTS['color'] * harmony + WEIGHTS['tags'] * overlap
+
+
+def _score_template(features, slots, unary, limit):
+    """Best `limit` (score, item indexes) combinations for one template"""
+    size = len(slots)
+    pairs = list(combinations(range(size), 2))
+    total = np.zeros([len(slot) for slot in slots], dtype=np.float32)
+
+    for axis, slot in enumerate(slots):
+        shape = [1] * size
+        shape[axis] = len(slot)
+        total += (unary[slot] / size).reshape(shape)
+    for a, b in pairs:
+        shape = [1] * size
+        shape[a], shape[b] = len(slots[a]), len(slots[b])
+        total += (_pair_scores(features, slots[a], slots[b]) / len(pairs)).reshape(shape)
+
+    flat = total.ravel()
+    count = min(limit, flat.size)
+    best = np.argpartition(-flat, count - 1)[:count]
+    positions = np.unravel_index(best, total.shape)
+    return [
+        (float(flat[index]), [int(slots[axis][positions[axis][n]]) for axis in range(size)])
+        for n, index in enumerate(best)
+    ]
+
+
+def suggest(user_id, limit=10, today=None):
+    """
+    Top `limit` outfits for a closet, best first.
+
+    Returns a list of (score, [clothing item ids]) with items in template
+    order.
+    """
+    features = get_features(user_id)
+    if not len(features['ids']):
+        return []
+    unary = item_scores(features, today)
+
+    by_category = {}
+    for category, code in CATEGORY_CODES.items():
+        members = np.flatnonzero(features['category'] == code)
+        if len(members) > SLOT_CANDIDATES:
+            members = members[np.argpartition(-unary[members], SLOT_CANDIDATES - 1)[:SLOT_CANDIDATES]]
+        by_category[category] = members
+
+    candidates = []
+    seen_templates = set()
+    for template in TEMPLATES:
+        template = tuple(c for c in template if len(by_category[c]) or c not in OPTIONAL_SLOTS)
+        if template in seen_templates or len(template) < 2 or not all(len(by_category[c]) for c in template):
+            continue
+        seen_templates.add(template)
+        candidates += _score_template(features, [by_category[c] for c in template], unary, limit * 10)
+
+    # Greedy pick that keeps any one item from filling the whole list
+    candidates.sort(key=lambda candidate: -candidate[0])
+    uses = Counter()
+    picked = []
+    for score, indexes in candidates:
+        if any(uses[index] >= MAX_ITEM_REPEATS for index in indexes):
+            continue
+        uses.update(indexes)
+        picked.append((round(score, 4), [int(features['ids'][index]) for index in indexes]))
+        if len(picked) == limit:
+            break
+    return picked
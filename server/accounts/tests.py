@@ -1,3 +1,1082 @@
+from django.conf import settings
 from django.test import TestCase
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from unittest import skipUnless
+from unittest.mock import Mock, patch
+from concurrent.futures import Future
+from PIL import Image, ImageDraw
+from django.core.management import call_command
+import tempfile
+import logging
+import math
+import zipfile
+import shutil
+import random
+import json
+import io
+from django.core.cache import cache
+from django.utils import timezone
+from django.contrib.auth.models import User
+from rest_framework.pagination import Cursor
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from .models import ClothingItem, Outfit, Tombstone, UserProfile
+from .pagination import CreatedAtCursorPagination
+from .serializers import ClothingItemSerializer
+from .processing import new_executor, schedule_image, schedule_source
+from .storage import MediaStorage
+from . import colors, duplicates, imaging, sync
 
-# Create your tests here.
+try:
+    from moto.server import ThreadedMotoServer
+    import requests
+except ImportError:
+    ThreadedMotoServer = None
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'password123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        ClothingItem.objects.bulk_create([
+            ClothingItem(user=self.user, name=f'Item {i}', category='Tops') for i in range(7)
+        ])
+        # Ties on created_at are broken by id
+        ClothingItem.objects.update(created_at=timezone.now())
+        self.ids = list(ClothingItem.objects.order_by('-id').values_list('id', flat=True))
+
+    def pages(self, url, direction):
+        ids = []
+        while url:
+            page = self.client.get(url).json()
+            ids.append([item['id'] for item in page['results']])
+            url = page[direction]
+        return ids
+
+    def test_next_and_previous_links_cover_every_row_once(self):
+        pages = self.pages('/api/auth/clothing-items/?page_size=3', 'next')
+        self.assertEqual(pages, [self.ids[0:3], self.ids[3:6], self.ids[6:7]])
+
+        last = self.client.get('/api/auth/clothing-items/?page_size=3').json()
+        last = self.client.get(self.client.get(last['next']).json()['next']).json()
+        self.assertIsNone(last['next'])
+        self.assertEqual(self.pages(last['previous'], 'previous'), [self.ids[3:6], self.ids[0:3]])
+
+    def test_outfit_pages(self):
+        Outfit.objects.bulk_create([Outfit(user=self.user, title=f'Outfit {i}') for i in range(5)])
+        Outfit.objects.update(created_at=timezone.now())
+        ids = list(Outfit.objects.order_by('-id').values_list('id', flat=True))
+        self.assertEqual(self.pages('/api/auth/outfits/?page_size=2', 'next'), [ids[0:2], ids[2:4], ids[4:5]])
+
+    def test_page_size_is_capped(self):
+        ClothingItem.objects.bulk_create([
+            ClothingItem(user=self.user, name=f'More {i}', category='Tops') for i in range(200)
+        ])
+        page = self.client.get('/api/auth/clothing-items/', {'page_size': 1000}).json()
+        self.assertEqual(len(page['results']), CreatedAtCursorPagination.max_page_size)
+        self.assertIsNotNone(page['next'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/auth/clothing-items/', {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get('/api/auth/outfits/', {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+        # Well-formed cursors whose position isn't
+        paginator = CreatedAtCursorPagination()
+        paginator.base_url = 'http://testserver/api/auth/clothing-items/'
+        for position in ('not json', '["yesterday", "1"]', '[1]'):
+            cursor = paginator.encode_cursor(Cursor(0, False, position))
+            self.assertEqual(self.client.get(cursor).status_code, 404)
+
+    def test_unpaginated_list_is_unchanged(self):
+        response = self.client.get('/api/auth/clothing-items/')
+        items = ClothingItem.objects.filter(user=self.user).order_by('-created_at')
+        self.assertEqual(response.content, JSONRenderer().render(ClothingItemSerializer(items, many=True).data))
+        self.assertEqual([item['id'] for item in response.json()], self.ids)
+
+
+class OutfitListQueryCountTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'password123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_outfits(self, count, items_per_outfit):
+        for i in range(count):
+            outfit = Outfit.objects.create(user=self.user, title=f'Outfit {i}')
+            items = [
+                ClothingItem.objects.create(user=self.user, name=f'Item {i}-{j}', category='Tops')
+                for j in range(items_per_outfit)
+            ]
+            outfit.items.set(items)
+
+    def test_list_query_count_is_constant(self):
+        # validator aggregate + outfits + prefetched items
+        self.create_outfits(1, 1)
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/auth/outfits/')
+        self.assertEqual(len(response.json()), 1)
+
+        self.create_outfits(20, 5)
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/auth/outfits/')
+        self.assertEqual(len(response.json()), 21)
+        self.assertEqual(len(response.json()[0]['items']), 5)
+
+    def test_detail_query_count_is_constant(self):
+        self.create_outfits(1, 10)
+        outfit = Outfit.objects.get()
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/auth/outfits/{outfit.id}/')
+        self.assertEqual(len(response.json()['items']), 10)
+
+
+class OutfitItemsChangeTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'password123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.items = [
+            ClothingItem.objects.create(user=self.user, name=f'Item {i}', category='Tops') for i in range(12)
+        ]
+        self.outfit = Outfit.objects.create(user=self.user, title='Outfit')
+        self.outfit.items.add(*self.items[:2])
+        self.url = f'/api/auth/outfits/{self.outfit.id}/items/'
+
+    def change(self, **ids):
+        return self.client.patch(self.url, {key: [item.id for item in items] for key, items in ids.items()}, format='json')
+
+    def member_ids(self):
+        return set(self.outfit.items.values_list('id', flat=True))
+
+    def updated_at(self):
+        return Outfit.objects.get(pk=self.outfit.pk).updated_at
+
+    def test_rejects_foreign_and_conflicting_ids(self):
+        other = User.objects.create_user('other', 'other@example.com', 'password123')
+        foreign = ClothingItem.objects.create(user=other, name='Theirs', category='Tops')
+        self.assertEqual(self.change(add=[foreign]).status_code, 400)
+        self.assertEqual(self.change(add=[self.items[2]], remove=[self.items[2]]).status_code, 400)
+        self.assertEqual(self.change().status_code, 400)
+        self.assertEqual(self.member_ids(), {self.items[0].id, self.items[1].id})
+
+    def test_noops_keep_updated_at(self):
+        before = self.updated_at()
+        response = self.change(add=[self.items[0]], remove=[self.items[5]])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['added'], response.json()['removed']), ([], []))
+        self.assertEqual(self.updated_at(), before)
+        self.assertFalse(Tombstone.objects.exists())
+
+    def test_changes_bump_updated_at_and_log_removals(self):
+        before = self.updated_at()
+        response = self.change(add=[self.items[2], self.items[3]], remove=[self.items[0]])
+        self.assertEqual(response.json()['added'], [self.items[2].id, self.items[3].id])
+        self.assertEqual(response.json()['removed'], [self.items[0].id])
+        self.assertEqual(self.member_ids(), {self.items[1].id, self.items[2].id, self.items[3].id})
+        self.assertGreater(self.updated_at(), before)
+        self.assertEqual(
+            list(Tombstone.objects.values_list('kind', 'object_id', 'related_id')),
+            [('outfit_item', self.outfit.id, self.items[0].id)],
+        )
+
+    def test_query_count_is_constant(self):
+        # outfit, ownership check, savepoint, existing links, insert, removed links,
+        # delete, tombstones, updated_at, savepoint release
+        with self.assertNumQueries(10):
+            self.assertEqual(self.change(add=self.items[2:3], remove=self.items[:1]).status_code, 200)
+        with self.assertNumQueries(10):
+            self.assertEqual(self.change(add=self.items[3:12], remove=self.items[1:3]).status_code, 200)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'password123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.item = ClothingItem.objects.create(user=self.user, name='Shirt', category='Tops')
+
+    def test_unchanged_list_is_not_modified(self):
+        response = self.client.get('/api/auth/clothing-items/')
+        etag = response['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/auth/clothing-items/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.item.delete()
+        response = self.client.get('/api/auth/clothing-items/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [])
+
+    def test_outfit_list_changes_when_an_embedded_item_changes(self):
+        outfit = Outfit.objects.create(user=self.user, title='Outfit')
+        outfit.items.add(self.item)
+        etag = self.client.get('/api/auth/outfits/')['ETag']
+
+        self.item.name = 'Blue shirt'
+        self.item.save()
+        response = self.client.get('/api/auth/outfits/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['items'][0]['name'], 'Blue shirt')
+
+    def test_outfit_changes_when_an_embedded_item_is_deleted(self):
+        outfit = Outfit.objects.create(user=self.user, title='Outfit')
+        older = ClothingItem.objects.create(user=self.user, name='Jeans', category='Bottoms')
+        outfit.items.add(self.item, older)
+        # Not the newest item, so max(items.updated_at) alone would not move;
+        # all in the past, as Last-Modified only has whole seconds
+        yesterday = timezone.now() - timezone.timedelta(days=1)
+        ClothingItem.objects.filter(pk=older.pk).update(updated_at=yesterday - timezone.timedelta(hours=1))
+        ClothingItem.objects.filter(pk=self.item.pk).update(updated_at=yesterday)
+        Outfit.objects.filter(pk=outfit.pk).update(updated_at=yesterday)
+        list_etag = self.client.get('/api/auth/outfits/')['ETag']
+        detail = self.client.get(f'/api/auth/outfits/{outfit.id}/')
+
+        self.client.delete(f'/api/auth/clothing-items/{older.id}/')
+        response = self.client.get('/api/auth/outfits/', HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()[0]['items']), 1)
+        for headers in ({'HTTP_IF_NONE_MATCH': detail['ETag']}, {'HTTP_IF_MODIFIED_SINCE': detail['Last-Modified']}):
+            response = self.client.get(f'/api/auth/outfits/{outfit.id}/', **headers)
+            self.assertEqual(response.status_code, 200)
+
+    def test_profile_changes_when_a_user_field_changes(self):
+        # In the past, as Last-Modified only has whole seconds
+        yesterday = timezone.now() - timezone.timedelta(days=1)
+        UserProfile.objects.filter(pk=UserProfile.for_user(self.user).pk).update(updated_at=yesterday)
+        self.client.force_authenticate(User.objects.get(pk=self.user.pk))
+        cached = self.client.get('/api/auth/profile/')
+
+        self.client.patch('/api/auth/update-profile/', {'first_name': 'Alice'}, format='json')
+        for headers in ({'HTTP_IF_NONE_MATCH': cached['ETag']}, {'HTTP_IF_MODIFIED_SINCE': cached['Last-Modified']}):
+            response = self.client.get('/api/auth/profile/', **headers)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['first_name'], 'Alice')
+
+
+class SyncTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'password123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.shirt = ClothingItem.objects.create(user=self.user, name='Shirt', category='Tops')
+        self.jeans = ClothingItem.objects.create(user=self.user, name='Jeans', category='Bottoms')
+        self.outfit = Outfit.objects.create(user=self.user, title='Outfit')
+        self.outfit.items.add(self.shirt, self.jeans)
+
+    def sync(self, token=None):
+        response = self.client.get('/api/auth/sync/', {'since': token} if token else {})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def synced(self):
+        """A token from a sync after which nothing changed (rows moved out of the margin)"""
+        token = self.sync()['sync_token']
+        past = timezone.now() - timezone.timedelta(hours=1)
+        ClothingItem.objects.update(updated_at=past)
+        Outfit.objects.update(updated_at=past)
+        Tombstone.objects.update(deleted_at=past)
+        return token
+
+    def test_full_then_delta(self):
+        data = self.sync()
+        self.assertTrue(data['full'])
+        self.assertEqual(len(data['clothing_items']), 2)
+        self.assertEqual(len(data['outfits']), 1)
+
+        token = self.synced()
+        data = self.sync(token)
+        self.assertFalse(data['full'])
+        self.assertEqual((data['clothing_items'], data['outfits']), ([], []))
+
+        self.shirt.name = 'Blue shirt'
+        self.shirt.save()
+        data = self.sync(token)
+        self.assertEqual([item['name'] for item in data['clothing_items']], ['Blue shirt'])
+
+    def test_late_commit_within_the_margin_is_sent(self):
+        token = self.synced()
+        # Stamped before the token was issued but committed after that sync
+        ClothingItem.objects.filter(pk=self.jeans.pk).update(updated_at=timezone.now() - timezone.timedelta(seconds=30))
+        data = self.sync(token)
+        self.assertEqual([item['name'] for item in data['clothing_items']], ['Jeans'])
+
+    def test_deleted_rows(self):
+        token = self.synced()
+        jeans_id, outfit_id = self.jeans.id, self.outfit.id
+        self.jeans.delete()
+        data = self.sync(token)
+        self.assertEqual(data['deleted']['clothing_items'], [jeans_id])
+        # The outfit lost an item, so it is sent again too
+        self.assertEqual([len(outfit['items']) for outfit in data['outfits']], [1])
+
+        self.outfit.delete()
+        self.assertEqual(self.sync(token)['deleted']['outfits'], [outfit_id])
+
+    def test_items_removed_from_outfits(self):
+        other = Outfit.objects.create(user=self.user, title='Other')
+        other.items.add(self.shirt, self.jeans)
+        token = self.synced()
+
+        def removed():
+            pairs = self.sync(token)['deleted']['outfit_items']
+            Tombstone.objects.all().delete()
+            return sorted((pair['outfit'], pair['item']) for pair in pairs)
+
+        self.outfit.items.remove(self.shirt)
+        self.assertEqual(removed(), [(self.outfit.id, self.shirt.id)])
+        self.jeans.outfits.remove(other)
+        self.assertEqual(removed(), [(other.id, self.jeans.id)])
+        self.outfit.items.clear()
+        self.assertEqual(removed(), [(self.outfit.id, self.jeans.id)])
+        self.shirt.outfits.clear()
+        self.assertEqual(removed(), [(other.id, self.shirt.id)])
+
+        self.outfit.items.add(self.shirt)
+        response = self.client.patch(
+            f'/api/auth/outfits/{self.outfit.id}/items/', {'remove': [self.shirt.id]}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(removed(), [(self.outfit.id, self.shirt.id)])
+
+    def test_invalid_and_foreign_tokens(self):
+        response = self.client.get('/api/auth/sync/', {'since': 'not-a-token'})
+        self.assertEqual(response.status_code, 400)
+
+        other = User.objects.create_user('other', 'other@example.com', 'password123')
+        response = self.client.get('/api/auth/sync/', {'since': sync.make_token(other, timezone.now())})
+        self.assertEqual(response.status_code, 400)
+
+    def test_expired_token_gets_a_snapshot(self):
+        token = sync.make_token(self.user, timezone.now() - sync.TOMBSTONE_RETENTION - timezone.timedelta(days=1))
+        data = self.sync(token)
+        self.assertTrue(data['full'])
+        self.assertEqual(len(data['clothing_items']), 2)
+
+    def test_prune_tombstones(self):
+        jeans_id, shirt_id = self.jeans.id, self.shirt.id
+        self.jeans.delete()
+        self.shirt.delete()
+        Tombstone.objects.filter(object_id=jeans_id).update(
+            deleted_at=timezone.now() - sync.TOMBSTONE_RETENTION - timezone.timedelta(days=1)
+        )
+        call_command('prune_tombstones', stdout=io.StringIO())
+        self.assertEqual(list(Tombstone.objects.values_list('object_id', flat=True)), [shirt_id])
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'password123')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.user.auth_token.key}')
+
+    def test_repeat_requests_skip_the_token_lookup(self):
+        self.client.get('/api/auth/profile/')
+        # Token, user and profile all come from the cache
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/auth/profile/')
+        self.assertEqual(response.json()['username'], 'tester')
+
+    def test_logout_invalidates_cached_token(self):
+        self.client.get('/api/auth/profile/')
+        self.client.post('/api/auth/logout/')
+        response = self.client.get('/api/auth/profile/')
+        self.assertEqual(response.status_code, 401)
+
+    def test_deactivation_invalidates_cached_token(self):
+        self.client.get('/api/auth/profile/')
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get('/api/auth/profile/')
+        self.assertEqual(response.status_code, 401)
+
+    def test_password_change_invalidates_cached_token(self):
+        self.client.get('/api/auth/profile/')
+        response = self.client.patch(
+            '/api/auth/update-profile/', {'current_password': 'password123', 'new_password': 'password456'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/api/auth/profile/').status_code, 401)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {response.json()['new_token']}")
+        self.assertEqual(self.client.get('/api/auth/profile/').status_code, 200)
+
+    def test_update_writes_only_sent_fields(self):
+        self.client.get('/api/auth/profile/')
+        # Changed elsewhere without invalidating this cache, like another worker's LocMemCache
+        User.objects.filter(pk=self.user.pk).update(first_name='Newer')
+
+        response = self.client.patch('/api/auth/update-profile/', {'bio': 'Hello'})
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.first_name, self.user.profile.bio), ('Newer', 'Hello'))
+
+        self.client.get('/api/auth/profile/')
+        with self.assertNumQueries(0):
+            self.client.patch('/api/auth/update-profile/', {})
+
+
+class ClosetFilterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'password123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.shirt = ClothingItem.objects.create(
+            user=self.user, name='Shirt', category='Tops', brand='Uniqlo',
+            tags=['summer', 'linen'], is_favorite=True,
+        )
+        self.jeans = ClothingItem.objects.create(
+            user=self.user, name='Jeans', category='Bottoms', brand='Levis', tags=['denim'],
+        )
+
+    def names(self, query):
+        response = self.client.get(f'/api/auth/clothing-items/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return [item['name'] for item in response.json()]
+
+    def test_column_filters(self):
+        self.assertEqual(self.names('category=Tops'), ['Shirt'])
+        self.assertEqual(self.names('brand=Levis'), ['Jeans'])
+        self.assertEqual(self.names('is_favorite=false'), ['Jeans'])
+        self.assertEqual(self.names('category=Tops&is_favorite=false'), [])
+
+    def test_tags_must_all_match(self):
+        self.assertEqual(self.names('tags=summer'), ['Shirt'])
+        self.assertEqual(self.names('tags=summer,linen'), ['Shirt'])
+        self.assertEqual(self.names('tags=summer,denim'), [])
+
+    def test_tag_changes_are_reindexed(self):
+        self.jeans.tags = ['denim', 'summer']
+        self.jeans.save()
+        self.assertEqual(self.names('tags=summer'), ['Jeans', 'Shirt'])
+
+        # Another user's tags never match
+        other = User.objects.create_user('other', 'other@example.com', 'password123')
+        ClothingItem.objects.create(user=other, name='Hat', category='Accessories', tags=['summer'])
+        self.assertEqual(self.names('tags=summer'), ['Jeans', 'Shirt'])
+
+    def test_invalid_filter_values(self):
+        response = self.client.get('/api/auth/clothing-items/?is_worn=maybe')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/auth/clothing-items/?last_worn_after=yesterday')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/auth/clothing-items/?color_near=plaid')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/auth/clothing-items/?color_near=red&color_distance=0')
+        self.assertEqual(response.status_code, 400)
+
+    def test_color_near(self):
+        # Normally set by image processing; save() derives the Lab columns
+        self.shirt.image_color = '#22304f'
+        self.shirt.save()
+        self.jeans.image_color = '#4a6b8f'
+        self.jeans.save(update_fields=['image_color'])
+        self.assertEqual(ClothingItem.objects.get(pk=self.jeans.pk).color_bucket, self.jeans.color_bucket)
+
+        self.assertEqual(self.names('color_near=navy'), ['Shirt'])
+        self.assertEqual(self.names('color_near=navy&color_distance=40'), ['Jeans', 'Shirt'])
+        self.assertEqual(self.names('color_near=%234a6b8f&color_distance=5'), ['Jeans'])
+        self.assertEqual(self.names('color_near=red'), [])
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'password123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def search(self, query):
+        response = self.client.get('/api/auth/search/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [(result['type'], result['object']['id']) for result in response.json()['results']]
+
+    def test_ranks_items_and_outfits(self):
+        shirt = ClothingItem.objects.create(user=self.user, name='Blue linen shirt', category='Tops')
+        scarf = ClothingItem.objects.create(
+            user=self.user, name='Scarf', category='Accessories', color='Blue', tags=['winter'],
+        )
+        outfit = Outfit.objects.create(user=self.user, title='Beach day', description='Something blue')
+
+        # Name matches outrank color and description matches
+        results = self.search('blue')
+        self.assertEqual(results[0], ('clothing_item', shirt.id))
+        self.assertCountEqual(results[1:], [('clothing_item', scarf.id), ('outfit', outfit.id)])
+
+        # Every word must match, as a prefix
+        self.assertEqual(self.search('blu lin'), [('clothing_item', shirt.id)])
+        self.assertEqual(self.search('blue winter'), [('clothing_item', scarf.id)])
+
+    def test_index_follows_saves_and_deletes(self):
+        item = ClothingItem.objects.create(user=self.user, name='Shirt', category='Tops')
+        self.assertEqual(self.search('oxford'), [])
+
+        item.name = 'Oxford shirt'
+        item.save()
+        self.assertEqual(self.search('oxford'), [('clothing_item', item.id)])
+
+        item.delete()
+        self.assertEqual(self.search('oxford'), [])
+
+    def test_only_own_rows_match(self):
+        other = User.objects.create_user('other', 'other@example.com', 'password123')
+        ClothingItem.objects.create(user=other, name='Oxford shirt', category='Tops')
+        self.assertEqual(self.search('oxford'), [])
+
+    def test_query_is_required(self):
+        response = self.client.get('/api/auth/search/', {'q': '  ?! '})
+        self.assertEqual(response.status_code, 400)
+
+
+class ClothingItemBatchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'password123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_reports_each_item(self):
+        items = [
+            {'name': 'Shirt', 'category': 'Tops', 'tags': ['linen']},
+            {'name': 'Mystery', 'category': 'Hats'},
+            {'name': 'Jeans', 'category': 'Bottoms', 'brand': 'Levis'},
+        ]
+        response = self.client.post('/api/auth/clothing-items/batch/', {'items': items}, format='json')
+        self.assertEqual(response.status_code, 207)
+
+        results = response.json()['results']
+        self.assertEqual([r['status'] for r in results], ['created', 'error', 'created'])
+        self.assertIn('category', results[1]['errors'])
+        self.assertEqual(results[2]['item']['brand'], 'Levis')
+        self.assertEqual(ClothingItem.objects.filter(user=self.user).count(), 2)
+
+        # Bulk-created rows are still filterable and searchable
+        response = self.client.get('/api/auth/clothing-items/?tags=linen')
+        self.assertEqual([item['name'] for item in response.json()], ['Shirt'])
+        response = self.client.get('/api/auth/search/', {'q': 'levis'})
+        self.assertEqual(len(response.json()['results']), 1)
+
+    def test_multipart_items_are_inserted_together(self):
+        items = [{'name': f'Item {i}', 'category': 'Tops'} for i in range(20)]
+        # Constant in the batch size: one INSERT plus the tag and search
+        # index writes, inside a savepoint
+        with self.assertNumQueries(6):
+            response = self.client.post('/api/auth/clothing-items/batch/', {'items': json.dumps(items)})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 20)
+
+    def test_rejects_empty_and_malformed_batches(self):
+        response = self.client.post('/api/auth/clothing-items/batch/', {'items': []}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/auth/clothing-items/batch/', {'items': 'not json'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'password123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.item = ClothingItem.objects.create(user=self.user, name='Shirt', category='Tops', tags=['a', 'b'])
+        self.outfit = Outfit.objects.create(user=self.user, title='Office')
+        self.outfit.items.add(self.item)
+
+    def download(self, query):
+        response = self.client.get(f'/api/auth/export/?{query}')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_jsonl(self):
+        lines = [json.loads(line) for line in self.download('fmt=jsonl').decode().splitlines()]
+        self.assertEqual([(line['type'], line['id']) for line in lines],
+                         [('clothing_item', self.item.id), ('outfit', self.outfit.id)])
+        self.assertEqual(lines[1]['items'], [self.item.id])
+
+    def test_csv(self):
+        rows = self.download('fmt=csv&kind=outfits').decode().splitlines()
+        self.assertTrue(rows[0].startswith('id,title,'))
+        self.assertIn(f',{self.item.id},', rows[1])
+
+    def test_zip(self):
+        with zipfile.ZipFile(io.BytesIO(self.download('fmt=zip'))) as archive:
+            self.assertEqual(archive.namelist(), ['clothing_items.jsonl', 'outfits.jsonl'])
+            self.assertEqual(json.loads(archive.read('clothing_items.jsonl'))['tags'], ['a', 'b'])
+
+    def test_unknown_format(self):
+        response = self.client.get('/api/auth/export/?fmt=xml')
+        self.assertEqual(response.status_code, 400)
+
+
+class ClosetImportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'password123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def archive(self, rows):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            archive.writestr('manifest.jsonl', '\n'.join(json.dumps(row) for row in rows))
+        buffer.seek(0)
+        buffer.name = 'closet.zip'
+        return buffer
+
+    def test_import_is_idempotent(self):
+        rows = [
+            {'id': 1, 'name': 'Shirt', 'category': 'Tops', 'tags': ['linen']},
+            {'id': 2, 'name': 'Boots'},
+            {'id': 3, 'name': 'Mystery', 'category': 'Hats'},
+        ]
+        response = self.client.post('/api/auth/imports/', {'archive': self.archive(rows)})
+        self.assertEqual(response.status_code, 202)
+        job = self.client.get(f"/api/auth/imports/{response.json()['id']}/").json()
+        self.assertEqual(
+            (job['status'], job['total'], job['created'], job['skipped'], job['failed']), ('done', 3, 2, 0, 1)
+        )
+        self.assertEqual(job['errors'][0]['entry'], 'id:3')
+        # Entries without a category get the import's default
+        self.assertEqual(ClothingItem.objects.get(name='Boots').category, 'Tops')
+
+        # Importing the same archive again only adds what is missing
+        rows[2]['category'] = 'Accessories'
+        job = self.client.post('/api/auth/imports/', {'archive': self.archive(rows)}).json()
+        self.assertEqual((job['created'], job['skipped'], job['failed']), (1, 2, 0))
+        self.assertEqual(ClothingItem.objects.filter(user=self.user).count(), 3)
+
+    def test_rejects_non_zip(self):
+        upload = io.BytesIO(b'not a zip')
+        upload.name = 'closet.zip'
+        response = self.client.post('/api/auth/imports/', {'archive': upload})
+        self.assertEqual(response.status_code, 400)
+
+    def test_command_sizes_its_own_pool(self):
+        with tempfile.NamedTemporaryFile(suffix='.zip') as archive:
+            archive.write(self.archive([{'id': 1, 'name': 'Shirt'}]).read())
+            archive.flush()
+            workers = settings.IMAGE_PROCESSING_WORKERS
+            with patch('accounts.management.commands.import_closet.new_executor', wraps=new_executor) as executor:
+                call_command('import_closet', 'tester', archive.name, '--workers', '3', stdout=io.StringIO())
+        executor.assert_called_once_with(3)
+        self.assertEqual(settings.IMAGE_PROCESSING_WORKERS, workers)
+        self.assertTrue(ClothingItem.objects.filter(user=self.user, name='Shirt').exists())
+
+
+class OutfitLikeTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'password123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.outfit = Outfit.objects.create(user=self.user, title='Office')
+        self.url = f'/api/auth/outfits/{self.outfit.id}/like/'
+
+    def test_put_and_delete_are_idempotent(self):
+        with self.assertNumQueries(1):
+            response = self.client.put(self.url)
+        self.assertEqual(response.json(), {'success': True, 'id': self.outfit.id, 'liked': True, 'changed': True})
+        liked_at = Outfit.objects.get().updated_at
+
+        # A retried PUT changes nothing, not even updated_at
+        response = self.client.put(self.url)
+        self.assertEqual((response.json()['liked'], response.json()['changed']), (True, False))
+        self.assertEqual(Outfit.objects.get().updated_at, liked_at)
+
+        response = self.client.delete(self.url)
+        self.assertEqual((response.json()['liked'], response.json()['changed']), (False, True))
+        self.assertFalse(Outfit.objects.get().liked)
+
+    def test_full_outfit_only_on_request(self):
+        response = self.client.put(f'{self.url}?include=outfit')
+        self.assertEqual(response.json()['outfit']['title'], 'Office')
+        self.assertTrue(response.json()['outfit']['liked'])
+
+    def test_post_toggles(self):
+        self.assertTrue(self.client.post(self.url).json()['liked'])
+        self.assertFalse(self.client.post(self.url).json()['liked'])
+
+    def test_other_users_outfit(self):
+        other = User.objects.create_user('other', 'other@example.com', 'password123')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.put(self.url).status_code, 404)
+        self.assertEqual(self.client.post(self.url).status_code, 404)
+        self.assertFalse(Outfit.objects.get().liked)
+
+
+class OutfitSuggestionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'password123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def item(self, name, category, color='', **fields):
+        return ClothingItem.objects.create(user=self.user, name=name, category=category, color=color, **fields)
+
+    def suggest(self, **params):
+        response = self.client.get('/api/auth/outfits/suggestions/', params)
+        self.assertEqual(response.status_code, 200)
+        return [[item['name'] for item in outfit['items']] for outfit in response.json()['suggestions']]
+
+    def test_scores_harmony_tags_and_favorites(self):
+        self.item('Navy tee', 'Tops', 'Navy', tags=['work'])
+        self.item('Pink top', 'Tops', 'Pink')
+        self.item('Chinos', 'Bottoms', 'Beige', tags=['work'], is_favorite=True)
+        self.item('Green skirt', 'Bottoms', 'Green')
+        self.item('Loafers', 'Shoes', 'Brown', tags=['work'])
+        self.item('Wrap dress', 'Dresses', 'Red', last_worn=timezone.localdate())
+
+        outfits = self.suggest(limit=3)
+        self.assertEqual(outfits[0], ['Navy tee', 'Chinos', 'Loafers'])
+        # Pink and green clash; the recently worn dress still makes a valid outfit
+        self.assertNotIn(['Pink top', 'Green skirt', 'Loafers'], outfits)
+        self.assertTrue(all(len(outfit) in (2, 3) for outfit in outfits))
+        self.assertEqual(self.client.get('/api/auth/outfits/suggestions/', {'limit': 'x'}).status_code, 400)
+
+    def test_closet_changes_invalidate_cached_features(self):
+        self.assertEqual(self.suggest(), [])
+        self.item('Tee', 'Tops', 'White')
+        self.item('Jeans', 'Bottoms', 'Denim')
+        # No shoes in the closet: the slot is left out
+        self.assertEqual(self.suggest(), [['Tee', 'Jeans']])
+
+        with self.assertNumQueries(1):
+            # Features come from the cache; only the picked items are loaded
+            self.client.get('/api/auth/outfits/suggestions/')
+
+        jacket = self.item('Jacket', 'Outerwear', 'Olive')
+        self.assertIn(['Tee', 'Jeans', 'Jacket'], self.suggest())
+        jacket.delete()
+        self.assertEqual(self.suggest(), [['Tee', 'Jeans']])
+
+
+class StoredImageTestCase(TestCase):
+    """Processes real uploads inline into a temporary media directory"""
+    def setUp(self):
+        cache.clear()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        storage = patch.object(ClothingItem._meta.get_field('image'), 'storage', FileSystemStorage(self.media))
+        storage.start()
+        self.addCleanup(storage.stop)
+
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'password123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def photo(self, seed, size=(640, 480), quality=90):
+        rng = random.Random(seed)
+        image = Image.new('RGB', (640, 480), 'white')
+        draw = ImageDraw.Draw(image)
+        for _ in range(8):
+            x, y = rng.randrange(640), rng.randrange(480)
+            draw.rectangle([x, y, x + 200, y + 160], fill=tuple(rng.randrange(256) for _ in range(3)))
+        buffer = io.BytesIO()
+        # The same scene shot at another resolution and compression
+        image.resize(size).save(buffer, 'JPEG', quality=quality)
+        return SimpleUploadedFile('photo.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def upload(self, name, photo):
+        item = ClothingItem.objects.create(user=self.user, name=name, category='Tops')
+        schedule_image(item, 'image', photo)
+        item.refresh_from_db()
+        return item
+
+
+class ImageDerivativeTests(StoredImageTestCase):
+    def test_upload_is_rendered_to_every_size_and_format(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # stored sideways, shown rotated 90 degrees
+        exif[0x010F] = 'PhoneMaker'
+        buffer = io.BytesIO()
+        Image.new('RGB', (2000, 1500), 'teal').save(buffer, 'JPEG', exif=exif)
+        photo = SimpleUploadedFile('photo.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+        response = self.client.post('/api/auth/clothing-items/', {'name': 'Shirt', 'category': 'Tops', 'image': photo})
+        self.assertEqual(response.status_code, 201)
+        item = ClothingItem.objects.get()
+        self.assertEqual(item.image_status, 'ready')
+
+        storage = ClothingItem._meta.get_field('image').storage
+        sizes = {'thumb': (150, 200), 'medium': (450, 600), 'full': (1200, 1600)}
+        self.assertEqual(set(item.image_variants), set(sizes))
+        for variant, size in sizes.items():
+            stored = item.image_variants[variant]
+            self.assertEqual((stored['width'], stored['height']), size)
+            for fmt in ('webp', 'jpeg'):
+                with storage.open(stored[fmt]) as handle, Image.open(handle) as image:
+                    self.assertEqual((image.format, image.size), (fmt.upper(), size))
+                    self.assertEqual(dict(image.getexif()), {})
+        self.assertEqual(item.image_variants['full']['jpeg'], item.image.name)
+
+        srcset = self.client.get(f'/api/auth/clothing-items/{item.id}/').json()['srcset']
+        self.assertEqual(srcset['thumb']['webp'], storage.url(item.image_variants['thumb']['webp']))
+        self.assertEqual((srcset['medium']['width'], srcset['medium']['height']), sizes['medium'])
+
+        outfit = Outfit.objects.create(user=self.user, title='Outfit')
+        outfit.items.add(item)
+        embedded = self.client.get(f'/api/auth/outfits/{outfit.id}/').json()['items'][0]
+        self.assertEqual(embedded['srcset'], srcset)
+
+
+class RejectedUploadTests(StoredImageTestCase):
+    def post(self, data, name='photo.jpg', content_type='image/jpeg'):
+        image = SimpleUploadedFile(name, data, content_type=content_type)
+        return self.client.post('/api/auth/clothing-items/', {'name': 'Shirt', 'category': 'Tops', 'image': image})
+
+    def encode(self, image, fmt):
+        buffer = io.BytesIO()
+        image.save(buffer, fmt)
+        return buffer.getvalue()
+
+    def test_oversize_file(self):
+        data = self.encode(Image.new('RGB', (64, 64)), 'JPEG')
+        with patch('accounts.views.MAX_IMAGE_UPLOAD_SIZE', len(data) - 1):
+            response = self.post(data)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Image size must be less than 20MB'})
+
+    def test_too_many_pixels(self):
+        # Tiny as a 1-bit PNG, but past MAX_PIXELS once decoded; only the header is read
+        data = self.encode(Image.new('1', (8000, 7000)), 'PNG')
+        with patch('accounts.views.schedule_image') as schedule:
+            response = self.post(data, 'huge.png', 'image/png')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Image dimensions are too large'})
+        schedule.assert_not_called()
+
+    def test_unsupported_format(self):
+        response = self.post(self.encode(Image.new('RGB', (64, 64)), 'BMP'), 'photo.bmp', 'image/bmp')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Unsupported image format: BMP'})
+        self.assertFalse(ClothingItem.objects.exists())
+
+
+class AvatarUploadTests(StoredImageTestCase):
+    def setUp(self):
+        super().setUp()
+        for patcher in (
+            patch.object(UserProfile._meta.get_field('avatar'), 'storage', FileSystemStorage(self.media)),
+            # The avatar view refuses to run without S3 settings
+            patch('accounts.views._aws_configured', return_value=True),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def avatar(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (1000, 800), 'orange').save(buffer, 'PNG')
+        return SimpleUploadedFile('me.png', buffer.getvalue(), content_type='image/png')
+
+    def test_accepted_while_processing(self):
+        # A worker pool that hasn't picked the job up yet
+        pending = Mock(spec=['submit'], submit=Mock(return_value=Future()))
+        with patch('accounts.processing.get_executor', return_value=pending):
+            response = self.client.post('/api/auth/upload-avatar/', {'avatar': self.avatar()})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(UserProfile.objects.get(user=self.user).avatar_status, 'processing')
+
+    def test_processed_avatar(self):
+        response = self.client.post('/api/auth/upload-avatar/', {'avatar': self.avatar()})
+        self.assertEqual(response.status_code, 200)
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertEqual(profile.avatar_status, 'ready')
+        with profile.avatar.open() as handle, Image.open(handle) as image:
+            self.assertEqual((image.format, image.size), ('JPEG', (imaging.AVATAR_SIZE, 320)))
+
+
+class DuplicateImageTests(StoredImageTestCase):
+    def test_hash_index_matches_brute_force(self):
+        rng = random.Random(1)
+        hashes = [rng.getrandbits(64) - (1 << 63) for _ in range(500)]
+        index = duplicates.HashIndex(range(500), hashes)
+        for value in hashes[:20]:
+            expected = sorted(
+                (duplicates.distance(value, h), i) for i, h in enumerate(hashes) if duplicates.distance(value, h) <= 24
+            )
+            self.assertEqual(index.search(value, 24), expected)
+
+    def test_reshot_photo_is_flagged_and_reported(self):
+        original = self.upload('Shirt', self.photo(1))
+        reshot = self.upload('Shirt again', self.photo(1, size=(1200, 900), quality=60))
+        other = self.upload('Jeans', self.photo(2))
+
+        self.assertIsNotNone(original.image_hash)
+        self.assertLessEqual(duplicates.distance(original.image_hash, reshot.image_hash), duplicates.MAX_DISTANCE)
+        self.assertEqual((original.duplicate_of_id, reshot.duplicate_of_id, other.duplicate_of_id),
+                         (None, original.id, None))
+
+        response = self.client.get('/api/auth/clothing-items/duplicates/')
+        clusters = response.json()['clusters']
+        self.assertEqual([[item['id'] for item in cluster['items']] for cluster in clusters],
+                         [[original.id, reshot.id]])
+        self.assertEqual(clusters[0]['items'][1]['duplicate_of'], original.id)
+        self.assertEqual(self.client.get('/api/auth/clothing-items/duplicates/', {'max_distance': 99}).status_code, 400)
+
+        flagged_at = reshot.updated_at
+        original.delete()
+        self.assertEqual(self.client.get('/api/auth/clothing-items/duplicates/').json()['clusters'], [])
+        reshot.refresh_from_db()
+        self.assertIsNone(reshot.duplicate_of_id)
+        # Unflagging is a change for validators and delta sync
+        self.assertGreater(reshot.updated_at, flagged_at)
+
+    def test_flagging_bumps_updated_at(self):
+        original = self.upload('Shirt', self.photo(1))
+        reshot = ClothingItem.objects.create(user=self.user, name='Shirt again', category='Tops')
+        before = reshot.updated_at
+        reshot.image_hash = original.image_hash
+        reshot.save(update_fields=['image_hash'])
+        reshot.refresh_from_db()
+        self.assertEqual(reshot.duplicate_of_id, original.id)
+        self.assertGreater(reshot.updated_at, before)
+
+    def test_index_times_out_without_an_invalidation(self):
+        original = self.upload('Shirt', self.photo(1))
+        other = ClothingItem.objects.create(user=self.user, name='Copy', category='Tops')
+
+        def rehash(value):
+            # Like a write on another worker, whose invalidation a per-process cache never sees
+            ClothingItem.objects.filter(pk=other.pk).update(image_hash=value)
+
+        def matches():
+            return [item_id for _, item_id in duplicates.find_duplicates(self.user.id, original.image_hash)]
+
+        with self.settings(DUPLICATE_INDEX_TIMEOUT=0):
+            # Rebuild the index the upload cached with the default timeout
+            duplicates.invalidate(self.user.id)
+            self.assertEqual(matches(), [original.id])
+        rehash(original.image_hash)
+        self.assertEqual(matches(), [original.id, other.id])
+        # Kept until DUPLICATE_INDEX_TIMEOUT
+        rehash(~original.image_hash)
+        self.assertEqual(matches(), [original.id, other.id])
+
+
+class ImageColorTests(StoredImageTestCase):
+    def garment(self, color, backdrop='white'):
+        image = Image.new('RGB', (600, 800), backdrop)
+        ImageDraw.Draw(image).rectangle([150, 150, 450, 700], fill=color)
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=90)
+        return SimpleUploadedFile('photo.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def test_dominant_color_skips_the_backdrop(self):
+        shirt = self.upload('Red shirt', self.garment((200, 30, 40)))
+        coat = self.upload('Navy coat', self.garment((30, 42, 70), backdrop=(235, 235, 230)))
+        white = self.upload('White tee', self.garment((250, 250, 250), backdrop=(250, 250, 250)))
+
+        self.assertLess(
+            math.dist(colors.rgb_to_lab(colors.parse_hex(shirt.image_color)), colors.rgb_to_lab((200, 30, 40))), 5
+        )
+        self.assertIsNotNone(coat.color_bucket)
+        # A photo that is all backdrop keeps that color
+        self.assertEqual(colors.bucket(colors.rgb_to_lab(colors.parse_hex(white.image_color))), white.color_bucket)
+
+        response = self.client.get('/api/auth/clothing-items/', {'color_near': 'navy'})
+        self.assertEqual([item['name'] for item in response.json()], ['Navy coat'])
+        self.assertEqual(response.json()[0]['image_color'], coat.image_color)
+
+    def test_backfill_command(self):
+        shirt = self.upload('Red shirt', self.garment((200, 30, 40)))
+        color = shirt.image_color
+        yesterday = timezone.now() - timezone.timedelta(days=1)
+        ClothingItem.objects.filter(pk=shirt.pk).update(image_color='', color_bucket=None, updated_at=yesterday)
+
+        call_command('extract_clothing_colors', stdout=io.StringIO())
+        shirt.refresh_from_db()
+        self.assertEqual((shirt.image_color, shirt.color_bucket), (color, colors.columns(color)[0]))
+        # Validators and delta sync see the new color
+        self.assertGreater(shirt.updated_at, yesterday)
+
+
+@skipUnless(ThreadedMotoServer, 'moto[server] is not installed (see requirements-dev.txt)')
+class DirectUploadTests(TestCase):
+    """The slot -> POST -> confirm flow against a local moto S3 server"""
+    bucket = 'oasis-test'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # moto's server logs every request
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        cls.moto = ThreadedMotoServer(ip_address='127.0.0.1', port=0, verbose=False)
+        cls.moto.start()
+        cls.endpoint = 'http://%s:%d' % cls.moto.get_host_and_port()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.moto.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        aws = self.settings(
+            AWS_ACCESS_KEY_ID='testing', AWS_SECRET_ACCESS_KEY='testing', AWS_STORAGE_BUCKET_NAME=self.bucket,
+            AWS_S3_REGION_NAME='us-east-1', AWS_S3_ENDPOINT_URL=self.endpoint,
+        )
+        aws.enable()
+        self.addCleanup(aws.disable)
+        for patcher in (
+            patch.object(MediaStorage, 'bucket_name', self.bucket),
+            patch.object(ClothingItem._meta.get_field('image'), 'storage', MediaStorage()),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.s3 = MediaStorage().connection.meta.client
+        self.s3.create_bucket(Bucket=self.bucket)
+        self.addCleanup(self.empty_bucket)
+
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'password123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.item = ClothingItem.objects.create(user=self.user, name='Shirt', category='Tops')
+
+    def empty_bucket(self):
+        for key in self.keys():
+            self.s3.delete_object(Bucket=self.bucket, Key=key)
+        self.s3.delete_bucket(Bucket=self.bucket)
+
+    def keys(self):
+        return sorted(o['Key'] for o in self.s3.list_objects_v2(Bucket=self.bucket).get('Contents', []))
+
+    def upload(self, data):
+        response = self.client.post('/api/auth/uploads/', {
+            'target': 'clothing_item', 'object_id': self.item.id, 'content_type': 'image/jpeg', 'size': len(data),
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        slot = response.json()
+        posted = requests.post(slot['url'], data=slot['fields'], files={'file': ('photo.jpg', data, 'image/jpeg')})
+        self.assertLess(posted.status_code, 300)
+        self.assertEqual(self.keys(), [slot['key']])
+        return slot
+
+    def test_confirmed_upload_is_processed_once(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (1600, 1200), 'navy').save(buffer, 'JPEG')
+        slot = self.upload(buffer.getvalue())
+
+        # Hold the job back so the replay arrives while it is still queued
+        with patch('accounts.uploads.schedule_source') as queued:
+            response = self.client.post('/api/auth/uploads/confirm/', {'token': slot['token']}, format='json')
+            self.assertEqual(response.status_code, 200)
+            response = self.client.post('/api/auth/uploads/confirm/', {'token': slot['token']}, format='json')
+            self.assertEqual(response.json(), {'error': 'Upload was already confirmed'})
+        self.assertEqual(queued.call_count, 1)
+
+        schedule_source(*queued.call_args.args, **queued.call_args.kwargs)
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.image_status, 'ready')
+        # The derivatives replace the raw upload in the bucket
+        self.assertNotIn(slot['key'], self.keys())
+        self.assertIn(self.item.image.name, self.keys())
+        self.assertIn(self.item.image_variants['thumb']['webp'], self.keys())
+
+    def test_failed_upload_is_removed_from_the_bucket(self):
+        slot = self.upload(b'not an image')
+        response = self.client.post('/api/auth/uploads/confirm/', {'token': slot['token']}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.image_status, 'failed')
+        self.assertEqual(self.keys(), [])
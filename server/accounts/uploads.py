@@ -0,0 +1,166 @@
+"""
+Direct-to-bucket image uploads.
+
+Instead of streaming image bytes through Django, the client:
+
+1. POSTs to uploads/ to get a presigned S3 POST policy for one object,
+2. uploads the file straight to the bucket with that policy,
+3. POSTs the returned token to uploads/confirm/.
+
+Confirming HEADs the object to check its size and type and queues
+derivative processing for the model it belongs to. Each token confirms
+once: its object key is recorded in UploadConfirmation, so a replayed
+confirm can't queue a second job for an image that is already being
+processed. The worker fetches the
+object from the bucket through a presigned GET, so the bytes never pass
+through a request worker; the derivatives are attached like any other
+processed upload and the raw object is then deleted.
+
+The bucket needs a CORS rule that allows POST from the client origins.
+Set AWS_S3_ENDPOINT_URL to point at MinIO or moto for local testing.
+"""
+from datetime import timedelta
+from botocore.exceptions import ClientError
+from django.core import signing
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from .models import UserProfile, ClothingItem, Outfit, UploadConfirmation
+from .processing import schedule_source
+from .storage import MediaStorage
+from . import imaging
+import uuid
+
+SIGNING_SALT = 'accounts.uploads'
+SLOT_EXPIRES_IN = 10 * 60
+# Confirm tokens are accepted this long after the slot was issued
+CONFIRM_EXPIRES_IN = SLOT_EXPIRES_IN * 2
+PRESIGNED_GET_EXPIRES_IN = 30 * 60
+
+ALLOWED_CONTENT_TYPES = {
+    'image/jpeg': 'jpg',
+    'image/png': 'png',
+    'image/webp': 'webp',
+    'image/gif': 'gif',
+}
+
+# target name -> (model, image field, max size in bytes)
+UPLOAD_TARGETS = {
+    'avatar': (UserProfile, 'avatar', 5 * 1024 * 1024),
+    'clothing_item': (ClothingItem, 'image', 20 * 1024 * 1024),
+    'outfit': (Outfit, 'image', 20 * 1024 * 1024),
+}
+
+
+class UploadError(Exception):
+    pass
+
+
+def _client():
+    storage = MediaStorage()
+    return storage.bucket_name, storage.connection.meta.client
+
+
+def get_target(user, target, object_id=None):
+    """Return the model instance an upload is for, or None if the user doesn't own it"""
+    if target not in UPLOAD_TARGETS:
+        raise UploadError(f"Unknown upload target: {target}")
+    model = UPLOAD_TARGETS[target][0]
+    if model is UserProfile:
+        return UserProfile.for_user(user)
+    return model.objects.filter(id=object_id, user=user).first()
+
+
+def create_slot(user, target, instance, content_type, size):
+    """Presign a POST for one new object and return it with a confirm token"""
+    model, field_name, max_size = UPLOAD_TARGETS[target]
+    extension = ALLOWED_CONTENT_TYPES.get(content_type)
+    if extension is None:
+        raise UploadError('File must be a JPEG, PNG, WebP or GIF image')
+    if not size or size > max_size:
+        raise UploadError(f"Image size must be less than {max_size // (1024 * 1024)}MB")
+
+    field = model._meta.get_field(field_name)
+    key = field.generate_filename(instance, f"upload-{uuid.uuid4().hex}.{extension}")
+
+    bucket, client = _client()
+    post = client.generate_presigned_post(
+        Bucket=bucket,
+        Key=key,
+        Fields={'Content-Type': content_type},
+        Conditions=[
+            {'Content-Type': content_type},
+            ['content-length-range', 1, max_size],
+        ],
+        ExpiresIn=SLOT_EXPIRES_IN,
+    )
+    token = signing.dumps({
+        'user': user.id,
+        'target': target,
+        'object_id': instance.pk,
+        'key': key,
+        'content_type': content_type,
+    }, salt=SIGNING_SALT)
+
+    return {
+        'url': post['url'],
+        'fields': post['fields'],
+        'key': key,
+        'token': token,
+        'expires_in': SLOT_EXPIRES_IN,
+    }
+
+
+def confirm(user, token):
+    """
+    Attach an uploaded object to its model after a HEAD check.
+
+    Returns the updated instance, with derivative processing queued.
+    """
+    try:
+        slot = signing.loads(token, salt=SIGNING_SALT, max_age=CONFIRM_EXPIRES_IN)
+    except signing.BadSignature:
+        raise UploadError('Invalid or expired upload token')
+    if slot['user'] != user.id:
+        raise UploadError('Invalid or expired upload token')
+
+    model, field_name, max_size = UPLOAD_TARGETS[slot['target']]
+    instance = get_target(user, slot['target'], slot['object_id'])
+    if instance is None:
+        raise UploadError('Upload target no longer exists')
+
+    bucket, client = _client()
+    try:
+        head = client.head_object(Bucket=bucket, Key=slot['key'])
+    except ClientError:
+        raise UploadError('Uploaded file not found')
+
+    if head['ContentLength'] > max_size or head.get('ContentType') != slot['content_type']:
+        client.delete_object(Bucket=bucket, Key=slot['key'])
+        raise UploadError('Uploaded file does not match the upload slot')
+
+    # Tokens older than this can't be confirmed anyway, so their records can go
+    UploadConfirmation.objects.filter(
+        created_at__lt=timezone.now() - timedelta(seconds=CONFIRM_EXPIRES_IN)
+    ).delete()
+    try:
+        with transaction.atomic():
+            UploadConfirmation.objects.create(key=slot['key'])
+    except IntegrityError:
+        raise UploadError('Upload was already confirmed')
+
+    source = client.generate_presigned_url(
+        'get_object',
+        Params={'Bucket': bucket, 'Key': slot['key']},
+        ExpiresIn=PRESIGNED_GET_EXPIRES_IN,
+    )
+    if field_name == 'avatar':
+        sizes, formats = {'full': imaging.AVATAR_SIZE}, ('jpeg',)
+    else:
+        sizes, formats = None, imaging.VARIANT_FORMATS
+    filename = f"{slot['key'].rsplit('/', 1)[-1].rsplit('.', 1)[0]}.jpg"
+    # The processed derivatives replace the current image; the raw upload
+    # is deleted once they are stored
+    schedule_source(
+        instance, field_name, source, filename, sizes, formats, discard=[slot['key']]
+    )
+    return instance
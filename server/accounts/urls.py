@@ -10,16 +10,36 @@ urlpatterns = [
     path('profile/', views.profile, name='profile'),
     path('update-profile/', views.update_profile, name='update_profile'),
     path('upload-avatar/', views.upload_avatar, name='upload_avatar'),
+
+    # Direct-to-storage uploads
+    path('uploads/', views.upload_slot, name='upload_slot'),
+    path('uploads/confirm/', views.confirm_upload, name='confirm_upload'),
     
     # Clothing items endpoints
     path('clothing-items/', views.clothing_items, name='clothing_items'),
+    path('clothing-items/batch/', views.clothing_items_batch, name='clothing_items_batch'),
+    path('clothing-items/duplicates/', views.clothing_item_duplicates, name='clothing_item_duplicates'),
     path('clothing-items/<int:item_id>/', views.clothing_item_detail, name='clothing_item_detail'),
     
     # Outfit endpoints
     path('outfits/', views.outfits, name='outfits'),
+    path('outfits/suggestions/', views.outfit_suggestions, name='outfit_suggestions'),
     path('outfits/<int:outfit_id>/', views.outfit_detail, name='outfit_detail'),
+    path('outfits/<int:outfit_id>/items/', views.outfit_items, name='outfit_items'),
     path('outfits/<int:outfit_id>/like/', views.like_outfit, name='like_outfit'),
     
+    # Search
+    path('search/', views.search_closet, name='search_closet'),
+
+    # Export and import
+    path('export/', views.export_closet, name='export_closet'),
+    path('imports/', views.import_closet, name='import_closet'),
+    path('imports/<int:import_id>/', views.closet_import_detail, name='closet_import_detail'),
+    path('imports/<int:import_id>/resume/', views.resume_closet_import, name='resume_closet_import'),
+
+    # Delta sync
+    path('sync/', views.sync_changes, name='sync_changes'),
+    
     # Health check endpoint for debugging
     path('health/', views.health_check, name='health_check'),
 ]
\ No newline at end of file
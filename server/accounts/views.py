@@ -3,27 +3,50 @@ from rest_framework.decorators import api_view, permission_classes, parser_class
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from rest_framework.response import Response
+from rest_framework.exceptions import NotFound
 from rest_framework.authtoken.models import Token
 from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Case, Max, Value, When
 from .serializers import (
     UserRegistrationSerializer,
     UserLoginSerializer,
     UserProfileSerializer,
     ClothingItemSerializer,
     OutfitSerializer,
+    OutfitItemsChangeSerializer,
+    ClosetImportSerializer,
 )
-from .models import UserProfile, ClothingItem, Outfit
-from PIL import Image
-import io
-from django.core.files.uploadedfile import InMemoryUploadedFile
+from .models import UserProfile, ClothingItem, Outfit, ClosetImport
+from .pagination import wants_pagination, paginated_response
+from .processing import schedule_image, delete_image, save_fields
+from . import uploads
+from . import sync
+from . import search
+from . import duplicates
+from . import suggestions
+from . import export
+from . import closet_import
+from .filters import filter_clothing_items, InvalidFilter, sync_item_tags
+from .conditional import list_etag, make_etag, not_modified, set_validators
+from . import imaging
 from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 import logging
+import shutil
+import zipfile
+import uuid
+import json
+import os
 
 # Add logging for debugging upload issues
 logger = logging.getLogger(__name__)
 
+MAX_IMAGE_UPLOAD_SIZE = 20 * 1024 * 1024
+
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
@@ -130,9 +153,14 @@ def logout(request):
 @permission_classes([IsAuthenticated])
 def profile(request):
     try:
-        profile, _ = UserProfile.objects.get_or_create(user=request.user)
+        profile = UserProfile.for_user(request.user)
+        etag = make_etag(request, profile.updated_at)
+        cached = not_modified(request, etag, profile.updated_at)
+        if cached:
+            return cached
+
         serializer = UserProfileSerializer(profile)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return set_validators(Response(serializer.data, status=status.HTTP_200_OK), etag, profile.updated_at)
     except Exception as e:
         logger.error(f"Profile fetch error for {request.user.username}: {str(e)}")
         return Response({'error': 'Error fetching profile'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -145,17 +173,20 @@ def update_profile(request):
     logger.info(f"Profile update attempt for user: {request.user.username}")
     
     user = request.user
-    profile, _ = UserProfile.objects.get_or_create(user=user)
+    profile = UserProfile.for_user(user)
     data = request.data
 
     try:
+        user_changed = False
+
         # Update username
         new_username = data.get('username', '').strip()
         if new_username and new_username != user.username:
             if User.objects.filter(username=new_username).exclude(id=user.id).exists():
                 return Response({'error': 'Username already exists'}, status=status.HTTP_400_BAD_REQUEST)
             user.username = new_username
-            user.save()
+            user.save(update_fields=['username'])
+            user_changed = True
 
         # Change password if requested
         if 'current_password' in data and 'new_password' in data:
@@ -165,7 +196,7 @@ def update_profile(request):
             if not user.check_password(current_password):
                 return Response({'error': 'Current password is incorrect'}, status=status.HTTP_400_BAD_REQUEST)
             user.set_password(new_password)
-            user.save()
+            user.save(update_fields=['password'])
 
             # Invalidate old tokens and create a new one
             Token.objects.filter(user=user).delete()
@@ -173,17 +204,23 @@ def update_profile(request):
         else:
             token = None
 
-        # Update profile fields
+        # The user and profile may come from the auth cache and be stale, so
+        # only the columns the request sent are written
+        name_fields = [field for field in ('first_name', 'last_name') if field in data]
+        for field in name_fields:
+            setattr(user, field, data[field])
+        if name_fields:
+            user.save(update_fields=name_fields)
+            user_changed = True
+
+        # The profile's updated_at drives its ETag and Last-Modified, so it is
+        # bumped when the User columns it serializes change too
+        profile_fields = []
         if 'bio' in data:
             profile.bio = data['bio']
-
-        # Update first and last names
-        if 'first_name' in data:
-            user.first_name = data['first_name']
-        if 'last_name' in data:
-            user.last_name = data['last_name']
-        user.save()
-        profile.save()
+            profile_fields.append('bio')
+        if profile_fields or user_changed:
+            save_fields(profile, profile_fields)
 
         logger.info(f"Profile updated successfully for user: {user.username}")
 
@@ -198,6 +235,25 @@ def update_profile(request):
         return Response({'error': 'Error updating profile'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+def _rejected_image(image_file):
+    """Header-only check of an upload; returns an error Response or None"""
+    if image_file.size > MAX_IMAGE_UPLOAD_SIZE:
+        return Response({'error': 'Image size must be less than 20MB'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        imaging.sniff_image(image_file)
+    except imaging.ImageRejected as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return None
+
+
+def _aws_configured():
+    return all([
+        getattr(settings, 'AWS_ACCESS_KEY_ID', None),
+        getattr(settings, 'AWS_SECRET_ACCESS_KEY', None),
+        getattr(settings, 'AWS_STORAGE_BUCKET_NAME', None)
+    ])
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 @parser_classes([MultiPartParser, FormParser])
@@ -215,58 +271,117 @@ def upload_avatar(request):
     if avatar_file.size > 5 * 1024 * 1024:
         return Response({'error': 'Image size must be less than 5MB'}, status=status.HTTP_400_BAD_REQUEST)
 
-    # Check AWS config
-    aws_configured = all([
-        getattr(settings, 'AWS_ACCESS_KEY_ID', None),
-        getattr(settings, 'AWS_SECRET_ACCESS_KEY', None),
-        getattr(settings, 'AWS_STORAGE_BUCKET_NAME', None)
-    ])
-
-    if not aws_configured:
+    if not _aws_configured():
         logger.error("AWS S3 not properly configured for avatar upload")
         return Response({'error': 'AWS S3 not properly configured'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     try:
-        image = Image.open(avatar_file)
-        if image.mode in ("RGBA", "P"):
-            image = image.convert("RGB")
-        image.thumbnail((400, 400), Image.Resampling.LANCZOS)
-        output = io.BytesIO()
-        image.save(output, format='JPEG', quality=85)
-        output.seek(0)
-        resized_file = InMemoryUploadedFile(
-            output, 'ImageField', f"{avatar_file.name.split('.')[0]}.jpg",
-            'image/jpeg', output.tell(), None
-        )
-        
-        profile, _ = UserProfile.objects.get_or_create(user=request.user)
+        # Only the header is read here; decoding and resizing happen off-thread
+        imaging.sniff_image(avatar_file)
+    except imaging.ImageRejected as e:
+        logger.error(f"Avatar upload rejected for {request.user.username}: {str(e)}")
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Delete old avatar file if exists
-        if profile.avatar:
-            profile.avatar.delete(save=False)
+    try:
+        profile = UserProfile.for_user(request.user)
 
-        profile.avatar = resized_file
-        profile.save()
+        # The old avatar is replaced (and deleted) once the new one is stored
+        schedule_image(
+            profile, 'avatar', avatar_file,
+            sizes={'full': imaging.AVATAR_SIZE}, formats=('jpeg',)
+        )
 
-        logger.info(f"Avatar uploaded successfully for user: {request.user.username}")
+        logger.info(f"Avatar upload accepted for user: {request.user.username}")
 
         serializer = UserProfileSerializer(profile)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        response_status = status.HTTP_202_ACCEPTED if profile.avatar_status == 'processing' else status.HTTP_200_OK
+        return Response(serializer.data, status=response_status)
         
     except Exception as e:
         logger.error(f"Avatar upload failed for {request.user.username}: {str(e)}")
         return Response({'error': f'Image processing failed: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def upload_slot(request):
+    """Step 1 of a direct upload: presign a POST straight to the bucket"""
+    target = request.data.get('target')
+    logger.info(f"Upload slot request for {target} by user: {request.user.username}")
+
+    if not _aws_configured():
+        logger.error("AWS S3 not properly configured for direct uploads")
+        return Response({'error': 'AWS S3 not properly configured'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    try:
+        size = int(request.data.get('size') or 0)
+    except (TypeError, ValueError):
+        return Response({'error': 'size must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        instance = uploads.get_target(request.user, target, request.data.get('object_id'))
+        if instance is None:
+            return Response({'error': 'Upload target not found'}, status=status.HTTP_404_NOT_FOUND)
+        slot = uploads.create_slot(
+            request.user, target, instance, request.data.get('content_type'), size
+        )
+        return Response(slot, status=status.HTTP_201_CREATED)
+    except uploads.UploadError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        logger.error(f"Upload slot error for {request.user.username}: {str(e)}")
+        return Response({'error': 'Error creating upload slot'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def confirm_upload(request):
+    """Step 3 of a direct upload: verify the stored object and attach it"""
+    try:
+        instance = uploads.confirm(request.user, request.data.get('token', ''))
+    except uploads.UploadError as e:
+        logger.warning(f"Upload confirm rejected for {request.user.username}: {str(e)}")
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        logger.error(f"Upload confirm error for {request.user.username}: {str(e)}")
+        return Response({'error': 'Error confirming upload'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    logger.info(f"Direct upload confirmed for {type(instance).__name__} {instance.pk}")
+    if isinstance(instance, UserProfile):
+        data = UserProfileSerializer(instance).data
+    elif isinstance(instance, ClothingItem):
+        data = ClothingItemSerializer(instance).data
+    else:
+        data = OutfitSerializer(instance, context={'request': request}).data
+    return Response(data, status=status.HTTP_200_OK)
+
+
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
 @parser_classes([MultiPartParser, FormParser, JSONParser])
 def clothing_items(request):
     if request.method == 'GET':
         try:
-            items = ClothingItem.objects.filter(user=request.user)
-            serializer = ClothingItemSerializer(items, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            items = filter_clothing_items(
+                ClothingItem.objects.filter(user=request.user), request.user, request.query_params
+            )
+
+            etag = list_etag(request, items)
+            cached = not_modified(request, etag)
+            if cached:
+                return cached
+
+            if wants_pagination(request):
+                response = paginated_response(request, items, ClothingItemSerializer)
+            else:
+                serializer = ClothingItemSerializer(items, many=True)
+                response = Response(serializer.data, status=status.HTTP_200_OK)
+            return set_validators(response, etag)
+        except InvalidFilter as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except NotFound:
+            # Invalid cursor
+            raise
         except Exception as e:
             logger.error(f"Error fetching clothing items for {request.user.username}: {str(e)}")
             return Response({'error': 'Error fetching items'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -277,7 +392,13 @@ def clothing_items(request):
         try:
             serializer = ClothingItemSerializer(data=request.data, context={'request': request})
             if serializer.is_valid():
+                image_file = serializer.validated_data.pop('image', None)
+                rejected = _rejected_image(image_file) if image_file else None
+                if rejected:
+                    return rejected
                 clothing_item = serializer.save()
+                if image_file:
+                    schedule_image(clothing_item, 'image', image_file)
                 logger.info(f"Clothing item created successfully: {clothing_item.id}")
                 return Response(serializer.data, status=status.HTTP_201_CREATED)
             
@@ -289,6 +410,110 @@ def clothing_items(request):
             return Response({'error': 'Error creating item'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+def _batch_entries(request):
+    """
+    The item dicts of a batch request, with images attached.
+
+    `items` is a JSON list (a JSON-encoded string in multipart requests);
+    the image for items[i] is the multipart file `image_<i>`.
+    """
+    entries = request.data.get('items')
+    if isinstance(entries, str):
+        entries = json.loads(entries)
+    if not isinstance(entries, list) or not all(isinstance(e, dict) for e in entries):
+        raise ValueError('items must be a list of objects')
+
+    for index, entry in enumerate(entries):
+        entry.pop('image', None)
+        image_file = request.FILES.get(f'image_{index}')
+        if image_file:
+            entry['image'] = image_file
+    return entries
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@parser_classes([MultiPartParser, FormParser, JSONParser])
+def clothing_items_batch(request):
+    """
+    Create many clothing items in one request.
+
+    Every item is validated on its own; the valid ones are inserted with a
+    single bulk_create and their images are queued for processing, which
+    runs concurrently in the image worker pool. Returns one result per
+    item, in request order: 201 if all were created, 207 if only some were,
+    400 if none were.
+    """
+    logger.info(f"Batch clothing item creation attempt for user: {request.user.username}")
+
+    try:
+        entries = _batch_entries(request)
+    except ValueError as e:
+        return Response({'error': f'Invalid items: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
+
+    max_items = settings.CLOTHING_BATCH_MAX_ITEMS
+    if not entries or len(entries) > max_items:
+        return Response(
+            {'error': f'Send between 1 and {max_items} items per batch'}, status=status.HTTP_400_BAD_REQUEST
+        )
+
+    results = [None] * len(entries)
+    pending = []
+    for index, entry in enumerate(entries):
+        serializer = ClothingItemSerializer(data=entry, context={'request': request})
+        if not serializer.is_valid():
+            results[index] = {'index': index, 'status': 'error', 'errors': serializer.errors}
+            continue
+        image_file = serializer.validated_data.pop('image', None)
+        rejected = _rejected_image(image_file) if image_file else None
+        if rejected:
+            results[index] = {'index': index, 'status': 'error', 'errors': rejected.data}
+            continue
+        item = ClothingItem(
+            user=request.user,
+            image_status='processing' if image_file else 'ready',
+            **serializer.validated_data,
+        )
+        pending.append((index, item, image_file))
+
+    try:
+        created = [item for _, item, _ in pending]
+        with transaction.atomic():
+            ClothingItem.objects.bulk_create(created)
+            # bulk_create skips the post_save signals that maintain these
+            sync_item_tags(created)
+            search.index_objects(created)
+            suggestions.invalidate(request.user.id)
+    except Exception as e:
+        logger.error(f"Batch clothing item creation error for {request.user.username}: {str(e)}")
+        return Response({'error': 'Error creating items'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    for index, item, image_file in pending:
+        if image_file:
+            try:
+                schedule_image(item, 'image', image_file)
+            except Exception as e:
+                logger.error(f"Could not queue image for clothing item {item.id}: {str(e)}")
+                item.image_status = 'failed'
+                save_fields(item, ['image_status'])
+        results[index] = {
+            'index': index,
+            'status': 'created',
+            'item': ClothingItemSerializer(item).data,
+        }
+
+    logger.info(
+        f"Batch for {request.user.username}: {len(pending)} of {len(entries)} clothing items created"
+    )
+    if len(pending) == len(entries):
+        response_status = status.HTTP_201_CREATED
+    elif pending:
+        response_status = status.HTTP_207_MULTI_STATUS
+    else:
+        response_status = status.HTTP_400_BAD_REQUEST
+    return Response({'created': len(pending), 'results': results}, status=response_status)
+
+
 @api_view(['GET', 'PUT', 'PATCH', 'DELETE'])
 @permission_classes([IsAuthenticated])
 @parser_classes([MultiPartParser, FormParser, JSONParser])
@@ -300,8 +525,13 @@ def clothing_item_detail(request, item_id):
 
     if request.method == 'GET':
         try:
+            etag = make_etag(request, item.updated_at)
+            cached = not_modified(request, etag, item.updated_at)
+            if cached:
+                return cached
+
             serializer = ClothingItemSerializer(item)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            return set_validators(Response(serializer.data, status=status.HTTP_200_OK), etag, item.updated_at)
         except Exception as e:
             logger.error(f"Error fetching clothing item {item_id}: {str(e)}")
             return Response({'error': 'Error fetching item'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -313,7 +543,13 @@ def clothing_item_detail(request, item_id):
             partial = request.method == 'PATCH'
             serializer = ClothingItemSerializer(item, data=request.data, partial=partial)
             if serializer.is_valid():
+                image_file = serializer.validated_data.pop('image', None)
+                rejected = _rejected_image(image_file) if image_file else None
+                if rejected:
+                    return rejected
                 updated_item = serializer.save()
+                if image_file:
+                    schedule_image(updated_item, 'image', image_file)
                 logger.info(f"Clothing item updated successfully: {item_id}")
                 return Response(serializer.data, status=status.HTTP_200_OK)
             
@@ -326,8 +562,7 @@ def clothing_item_detail(request, item_id):
 
     elif request.method == 'DELETE':
         try:
-            if item.image:
-                item.image.delete()
+            delete_image(item, 'image')
             item.delete()
             logger.info(f"Clothing item deleted successfully: {item_id}")
             return Response({'message': 'Item deleted successfully'}, status=status.HTTP_204_NO_CONTENT)
@@ -343,7 +578,9 @@ def outfits(request):
     if request.method == 'GET':
         try:
             # Start with the base queryset for the user
-            user_outfits = Outfit.objects.filter(user=request.user).order_by('-created_at')
+            user_outfits = OutfitSerializer.setup_eager_loading(
+                Outfit.objects.filter(user=request.user).order_by('-created_at')
+            )
 
             # Check if a 'category' parameter is in the URL
             category_filter = request.query_params.get('category', None)
@@ -352,9 +589,26 @@ def outfits(request):
                 user_outfits = user_outfits.filter(category=category_filter)
                 logger.info(f"Filtering outfits by category: {category_filter}")
 
+            # Embedded item dicts change when their items do, so the
+            # validator covers the latest item update too
+            etag = list_etag(request, user_outfits, items_latest=Max('items__updated_at'))
+            cached = not_modified(request, etag)
+            if cached:
+                return cached
+
+            if wants_pagination(request):
+                response = paginated_response(
+                    request, user_outfits, OutfitSerializer, context={'request': request}
+                )
+                return set_validators(response, etag)
+
             serializer = OutfitSerializer(user_outfits, many=True, context={'request': request})
-            logger.info(f"Fetched {len(user_outfits)} outfits for user: {request.user.username}")
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            data = serializer.data
+            logger.info(f"Fetched {len(data)} outfits for user: {request.user.username}")
+            return set_validators(Response(data, status=status.HTTP_200_OK), etag)
+        except NotFound:
+            # Invalid cursor
+            raise
         except Exception as e:
             logger.error(f"Error fetching outfits for {request.user.username}: {str(e)}")
             return Response({'error': 'Error fetching outfits'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -370,7 +624,13 @@ def outfits(request):
             
             if serializer.is_valid():
                 logger.info(f"Outfit validation successful, saving...")
+                image_file = serializer.validated_data.pop('image', None)
+                rejected = _rejected_image(image_file) if image_file else None
+                if rejected:
+                    return rejected
                 outfit = serializer.save()
+                if image_file:
+                    schedule_image(outfit, 'image', image_file)
                 logger.info(f"Outfit created successfully: {outfit.id} - '{outfit.title}'")
                 
                 # IMPORTANT: Return the complete outfit data
@@ -405,15 +665,26 @@ def outfits(request):
 @parser_classes([MultiPartParser, FormParser, JSONParser])
 def outfit_detail(request, outfit_id):
     try:
-        outfit = Outfit.objects.get(id=outfit_id, user=request.user)
+        outfit = OutfitSerializer.setup_eager_loading(
+            Outfit.objects.filter(user=request.user)
+        ).get(id=outfit_id)
     except Outfit.DoesNotExist:
         logger.warning(f"Outfit not found: {outfit_id} for user: {request.user.username}")
         return Response({'error': 'Outfit not found'}, status=status.HTTP_404_NOT_FOUND)
 
     if request.method == 'GET':
         try:
+            # Items are already prefetched, so this costs no extra query
+            last_modified = max(
+                [outfit.updated_at] + [item.updated_at for item in outfit.items.all()]
+            )
+            etag = make_etag(request, last_modified)
+            cached = not_modified(request, etag, last_modified)
+            if cached:
+                return cached
+
             serializer = OutfitSerializer(outfit, context={'request': request})
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            return set_validators(Response(serializer.data, status=status.HTTP_200_OK), etag, last_modified)
         except Exception as e:
             logger.error(f"Error fetching outfit {outfit_id}: {str(e)}")
             return Response({'error': 'Error fetching outfit'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -426,7 +697,13 @@ def outfit_detail(request, outfit_id):
             serializer = OutfitSerializer(outfit, data=request.data, partial=partial, context={'request': request})
             
             if serializer.is_valid():
+                image_file = serializer.validated_data.pop('image', None)
+                rejected = _rejected_image(image_file) if image_file else None
+                if rejected:
+                    return rejected
                 updated_outfit = serializer.save()
+                if image_file:
+                    schedule_image(updated_outfit, 'image', image_file)
                 logger.info(f"Outfit updated successfully: {outfit_id}")
                 
                 response_serializer = OutfitSerializer(updated_outfit, context={'request': request})
@@ -454,8 +731,7 @@ def outfit_detail(request, outfit_id):
 
     elif request.method == 'DELETE':
         try:
-            if outfit.image:
-                outfit.image.delete()
+            delete_image(outfit, 'image')
             outfit.delete()
             logger.info(f"Outfit deleted successfully: {outfit_id}")
             return Response({
@@ -470,33 +746,332 @@ def outfit_detail(request, outfit_id):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-@api_view(['POST'])
+@api_view(['PATCH'])
 @permission_classes([IsAuthenticated])
-def like_outfit(request, outfit_id):
-    logger.info(f"Like toggle attempt for outfit {outfit_id} by user: {request.user.username}")
-    
+def outfit_items(request, outfit_id):
+    """Add/remove items on an outfit without resending the whole list"""
     try:
-        outfit = Outfit.objects.get(id=outfit_id, user=request.user)
-        outfit.liked = not outfit.liked
-        outfit.save()
-        
-        logger.info(f"Outfit like toggled: {outfit_id} - liked: {outfit.liked}")
-        
-        serializer = OutfitSerializer(outfit, context={'request': request})
+        outfit = Outfit.objects.only('id', 'user_id').get(id=outfit_id, user=request.user)
+    except Outfit.DoesNotExist:
+        logger.warning(f"Outfit not found: {outfit_id} for user: {request.user.username}")
+        return Response({'error': 'Outfit not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    serializer = OutfitItemsChangeSerializer(data=request.data, context={'request': request})
+    if not serializer.is_valid():
+        logger.error(f"Outfit items change validation failed: {serializer.errors}")
+        return Response({
+            'success': False,
+            'errors': serializer.errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        added, removed = outfit.change_items(
+            add_ids=serializer.validated_data['add'],
+            remove_ids=serializer.validated_data['remove'],
+        )
+        logger.info(f"Outfit {outfit_id} items changed: +{len(added)} -{len(removed)}")
         return Response({
             'success': True,
-            'liked': outfit.liked,
-            'outfit': serializer.data
+            'id': outfit.id,
+            'added': added,
+            'removed': removed,
         }, status=status.HTTP_200_OK)
-        
-    except Outfit.DoesNotExist:
-        logger.warning(f"Outfit not found for like: {outfit_id}")
-        return Response({'error': 'Outfit not found'}, status=status.HTTP_404_NOT_FOUND)
     except Exception as e:
-        logger.error(f"Like toggle error for outfit {outfit_id}: {str(e)}")
+        logger.error(f"Outfit items change error {outfit_id}: {str(e)}")
+        return Response({
+            'success': False,
+            'error': 'Error updating outfit items'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def _like_response(request, outfit_id, liked, changed, include_outfit=False):
+    data = {'success': True, 'id': outfit_id, 'liked': liked, 'changed': changed}
+    if include_outfit or request.query_params.get('include') == 'outfit':
+        outfit = OutfitSerializer.setup_eager_loading(Outfit.objects.filter(id=outfit_id)).get()
+        data['outfit'] = OutfitSerializer(outfit, context={'request': request}).data
+    return Response(data, status=status.HTTP_200_OK)
+
+
+@api_view(['POST', 'PUT', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def like_outfit(request, outfit_id):
+    """
+    PUT likes and DELETE unlikes an outfit. Both are a single conditional
+    UPDATE, so repeating them is harmless; only a real change bumps
+    updated_at. The response is {id, liked, changed}, plus the full outfit
+    with ?include=outfit.
+
+    POST is the older toggle. It flips the flag in the database rather than
+    in Python, so double taps can't lose an update, and still returns the
+    outfit.
+    """
+    logger.info(f"Like {request.method} for outfit {outfit_id} by user: {request.user.username}")
+    outfits = Outfit.objects.filter(id=outfit_id, user=request.user)
+
+    try:
+        if request.method == 'POST':
+            with transaction.atomic():
+                changed = outfits.update(
+                    liked=Case(When(liked=True, then=Value(False)), default=Value(True)),
+                    updated_at=timezone.now(),
+                )
+                liked = outfits.values_list('liked', flat=True).first()
+            if not changed:
+                return Response({'error': 'Outfit not found'}, status=status.HTTP_404_NOT_FOUND)
+            logger.info(f"Outfit like toggled: {outfit_id} - liked: {liked}")
+            return _like_response(request, outfit_id, liked, True, include_outfit=True)
+
+        liked = request.method == 'PUT'
+        changed = outfits.filter(liked=not liked).update(liked=liked, updated_at=timezone.now())
+        if not changed and not outfits.exists():
+            return Response({'error': 'Outfit not found'}, status=status.HTTP_404_NOT_FOUND)
+        logger.info(f"Outfit like set: {outfit_id} - liked: {liked}, changed: {bool(changed)}")
+        return _like_response(request, outfit_id, liked, bool(changed))
+
+    except Exception as e:
+        logger.error(f"Like update error for outfit {outfit_id}: {str(e)}")
         return Response({'error': 'Error updating like status'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def sync_changes(request):
+    """Items and outfits changed since ?since=<sync token>, with tombstones"""
+    token = request.query_params.get('since')
+    try:
+        since = sync.read_token(request.user, token) if token else None
+    except sync.InvalidSyncToken as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        items, user_outfits, deleted, sync_token, full = sync.changes_since(request.user, since)
+        user_outfits = OutfitSerializer.setup_eager_loading(user_outfits)
+        data = {
+            'clothing_items': ClothingItemSerializer(items, many=True).data,
+            'outfits': OutfitSerializer(user_outfits, many=True, context={'request': request}).data,
+            'deleted': deleted,
+            'sync_token': sync_token,
+            'full': full,
+        }
+        logger.info(
+            f"Sync for {request.user.username}: {len(data['clothing_items'])} items, "
+            f"{len(data['outfits'])} outfits, full={full}"
+        )
+        return Response(data, status=status.HTTP_200_OK)
+    except Exception as e:
+        logger.error(f"Sync error for {request.user.username}: {str(e)}")
+        return Response({'error': 'Error syncing changes'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def search_closet(request):
+    """Ranked full-text search over the user's clothing items and outfits (?q=, ?limit=)"""
+    query = request.query_params.get('q', '').strip()
+    if not search.terms(query):
+        return Response({'error': 'Search query is required'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        limit = min(max(int(request.query_params.get('limit', 20)), 1), 100)
+    except ValueError:
+        return Response({'error': 'limit must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        matches = search.search(request.user, query, limit)
+        item_ids = [object_id for kind, object_id, _ in matches if kind == 'clothing_item']
+        outfit_ids = [object_id for kind, object_id, _ in matches if kind == 'outfit']
+
+        found = {}
+        if item_ids:
+            items = ClothingItem.objects.filter(user=request.user, id__in=item_ids)
+            for data in ClothingItemSerializer(items, many=True).data:
+                found['clothing_item', data['id']] = data
+        if outfit_ids:
+            user_outfits = OutfitSerializer.setup_eager_loading(
+                Outfit.objects.filter(user=request.user, id__in=outfit_ids)
+            )
+            for data in OutfitSerializer(user_outfits, many=True, context={'request': request}).data:
+                found['outfit', data['id']] = data
+
+        results = [
+            {'type': kind, 'score': round(score, 4), 'object': found[kind, object_id]}
+            for kind, object_id, score in matches
+            if (kind, object_id) in found
+        ]
+        logger.info(f"Search for {request.user.username}: {len(results)} results")
+        return Response({'query': query, 'results': results}, status=status.HTTP_200_OK)
+    except Exception as e:
+        logger.error(f"Search error for {request.user.username}: {str(e)}")
+        return Response({'error': 'Error searching closet'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def clothing_item_duplicates(request):
+    """
+    Clusters of clothing items whose photos are near-duplicates, largest
+    first, each oldest item first (?max_distance= in bits, default 10).
+    Built from the stored perceptual hashes; no image is read.
+    """
+    try:
+        max_distance = int(request.query_params.get('max_distance', duplicates.MAX_DISTANCE))
+    except ValueError:
+        return Response({'error': 'max_distance must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+    if not 0 <= max_distance <= duplicates.MAX_REPORT_DISTANCE:
+        return Response(
+            {'error': f"max_distance must be between 0 and {duplicates.MAX_REPORT_DISTANCE}"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    try:
+        groups = duplicates.clusters(request.user.id, max_distance)
+        item_ids = [item_id for group in groups for item_id in group]
+        items = {
+            data['id']: data
+            for data in ClothingItemSerializer(
+                ClothingItem.objects.filter(user=request.user, id__in=item_ids), many=True
+            ).data
+        }
+        clusters = [
+            [items[item_id] for item_id in group if item_id in items]
+            for group in groups
+        ]
+        clusters = [{'items': cluster} for cluster in clusters if len(cluster) > 1]
+        logger.info(f"Duplicate report for {request.user.username}: {len(clusters)} clusters")
+        return Response({'max_distance': max_distance, 'clusters': clusters}, status=status.HTTP_200_OK)
+    except Exception as e:
+        logger.error(f"Duplicate report error for {request.user.username}: {str(e)}")
+        return Response({'error': 'Error finding duplicates'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def outfit_suggestions(request):
+    """Outfits put together from the user's closet, best first (?limit=, default 10)"""
+    try:
+        limit = min(max(int(request.query_params.get('limit', 10)), 1), 50)
+    except ValueError:
+        return Response({'error': 'limit must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        picked = suggestions.suggest(request.user.id, limit)
+        item_ids = {item_id for _, ids in picked for item_id in ids}
+        items = {
+            data['id']: data
+            for data in ClothingItemSerializer(
+                ClothingItem.objects.filter(user=request.user, id__in=item_ids), many=True
+            ).data
+        }
+        results = [
+            {'score': score, 'items': [items[item_id] for item_id in ids]}
+            for score, ids in picked
+            # Skips outfits whose items were deleted since the features were read
+            if all(item_id in items for item_id in ids)
+        ]
+        logger.info(f"Outfit suggestions for {request.user.username}: {len(results)} outfits")
+        return Response({'suggestions': results}, status=status.HTTP_200_OK)
+    except Exception as e:
+        logger.error(f"Outfit suggestion error for {request.user.username}: {str(e)}")
+        return Response({'error': 'Error suggesting outfits'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_closet(request):
+    """
+    Download the closet and outfits as a stream (?fmt=jsonl|csv|zip).
+
+    CSV holds one table, picked with ?kind=clothing_items|outfits. The ZIP
+    bundles JSON Lines for both plus the stored images. (?format= is taken
+    by DRF's content negotiation, hence ?fmt=.)
+    """
+    fmt = request.query_params.get('fmt', 'jsonl')
+    kind = request.query_params.get('kind', 'clothing_items')
+    if fmt not in export.FORMATS:
+        return Response(
+            {'error': f"fmt must be one of: {', '.join(export.FORMATS)}"}, status=status.HTTP_400_BAD_REQUEST
+        )
+    if kind not in ('clothing_items', 'outfits'):
+        return Response({'error': 'kind must be clothing_items or outfits'}, status=status.HTTP_400_BAD_REQUEST)
+
+    logger.info(f"Closet export ({fmt}) for {request.user.username}")
+    suffix = f'-{kind}' if fmt == 'csv' else ''
+    filename = f"closet-{request.user.username}{suffix}-{timezone.now():%Y%m%d}.{fmt}"
+    response = StreamingHttpResponse(
+        export.stream(request.user, fmt, kind), content_type=export.FORMATS[fmt]
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Cache-Control'] = 'private, no-store'
+    return response
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@parser_classes([MultiPartParser, FormParser])
+def import_closet(request):
+    """
+    Start importing a ZIP archive (an export, a manifest plus images, or a
+    folder of photos) into the closet. Answers 202 with the import's
+    progress, which GET imports/<id>/ keeps reporting.
+    """
+    archive = request.FILES.get('archive')
+    if archive is None:
+        return Response({'error': 'No archive provided'}, status=status.HTTP_400_BAD_REQUEST)
+    if archive.size > settings.CLOSET_IMPORT_MAX_SIZE:
+        return Response({'error': 'Archive is too large'}, status=status.HTTP_400_BAD_REQUEST)
+    if not zipfile.is_zipfile(archive):
+        return Response({'error': 'Archive must be a ZIP file'}, status=status.HTTP_400_BAD_REQUEST)
+
+    category = request.data.get('default_category', 'Tops')
+    if category not in dict(ClothingItem.CATEGORY_CHOICES):
+        return Response({'error': 'Invalid default_category'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        os.makedirs(settings.CLOSET_IMPORT_DIR, exist_ok=True)
+        path = os.path.join(settings.CLOSET_IMPORT_DIR, f'{uuid.uuid4().hex}.zip')
+        archive.seek(0)
+        with open(path, 'wb') as target:
+            shutil.copyfileobj(archive, target)
+
+        job = ClosetImport.objects.create(
+            user=request.user, archive_path=path, remove_archive=True, default_category=category
+        )
+        closet_import.start_import(job)
+        logger.info(f"Closet import {job.id} started for {request.user.username}")
+        return Response(ClosetImportSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+    except Exception as e:
+        logger.error(f"Closet import error for {request.user.username}: {str(e)}")
+        return Response({'error': 'Error starting import'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def closet_import_detail(request, import_id):
+    try:
+        job = ClosetImport.objects.get(id=import_id, user=request.user)
+    except ClosetImport.DoesNotExist:
+        return Response({'error': 'Import not found'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(ClosetImportSerializer(job).data, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def resume_closet_import(request, import_id):
+    """Run a failed or interrupted import again; finished entries are skipped"""
+    try:
+        job = ClosetImport.objects.get(id=import_id, user=request.user)
+    except ClosetImport.DoesNotExist:
+        return Response({'error': 'Import not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    stalled = job.updated_at < timezone.now() - closet_import.STALLED_AFTER
+    if job.status == 'done' or (job.status in ('pending', 'running') and not stalled):
+        return Response({'error': f'Import is {job.status}'}, status=status.HTTP_409_CONFLICT)
+    if not os.path.exists(job.archive_path):
+        return Response({'error': 'Import archive is no longer available'}, status=status.HTTP_410_GONE)
+
+    closet_import.start_import(job)
+    return Response(ClosetImportSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def health_check(request):
@@ -1,5 +1,6 @@
 
 import os
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 import dj_database_url
@@ -69,7 +70,7 @@ DATABASES = {
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'accounts.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
@@ -109,15 +110,66 @@ CORS_ALLOWED_HEADERS = [
     'x-requested-with',
 ]
 
+# Let the client read validators for conditional GETs
+CORS_EXPOSE_HEADERS = ['ETag', 'Last-Modified']
+
 CSRF_TRUSTED_ORIGINS = [
    "https://project-oasis-omega.vercel.app",
     "https://oasis-production-6131.up.railway.app",
 ]
 
 
+TEST_RUNNER = 'backend.test_runner.TestRunner'
+
+# 'process' runs image decode/resize in a process pool, 'inline' runs it in the request
+# (the test runner switches to 'inline')
+IMAGE_PROCESSING_EXECUTOR = os.getenv('IMAGE_PROCESSING_EXECUTOR', 'process')
+IMAGE_PROCESSING_WORKERS = int(os.getenv('IMAGE_PROCESSING_WORKERS', '2'))
+
+
 DATA_UPLOAD_MAX_MEMORY_SIZE = 25 * 1024 * 1024  
-FILE_UPLOAD_MAX_MEMORY_SIZE = 25 * 1024 * 1024 
+# Uploads past 1MB are streamed to a temp file instead of held in memory
+FILE_UPLOAD_MAX_MEMORY_SIZE = 1 * 1024 * 1024
+FILE_UPLOAD_TEMP_DIR = os.getenv('FILE_UPLOAD_TEMP_DIR')
 DATA_UPLOAD_MAX_NUMBER_FIELDS = 1000 
+# clothing-items/batch/ takes up to this many items, each with one image
+CLOTHING_BATCH_MAX_ITEMS = 200
+DATA_UPLOAD_MAX_NUMBER_FILES = CLOTHING_BATCH_MAX_ITEMS
+# Closet import archives uploaded through the API are kept here until imported
+CLOSET_IMPORT_DIR = os.getenv('CLOSET_IMPORT_DIR', os.path.join(FILE_UPLOAD_TEMP_DIR or tempfile.gettempdir(), 'closet-imports'))
+CLOSET_IMPORT_MAX_SIZE = 1024 * 1024 * 1024
+# Rows each pin's pending like/save deltas are spread over (see pins.counters)
+PIN_COUNTER_SHARDS = int(os.getenv('PIN_COUNTER_SHARDS', '8'))
+# Let pins.dimensions fetch image headers from private/loopback hosts
+PIN_IMAGE_FETCH_PRIVATE_HOSTS = False
+
+
+# LocMemCache is per process, so an invalidation only reaches the worker
+# that made it and the others keep their entries until they time out. The
+# timeouts below are therefore a minute unless REDIS_URL shares one cache.
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+# How long an authenticated token stays cached (accounts.authentication)
+AUTH_TOKEN_CACHE_TIMEOUT = int(os.getenv('AUTH_TOKEN_CACHE_TIMEOUT', '300' if os.getenv('REDIS_URL') else '60'))
+# How long a worker keeps a closet's image hash index without rechecking the database (accounts.duplicates)
+DUPLICATE_INDEX_TIMEOUT = int(os.getenv('DUPLICATE_INDEX_TIMEOUT', '3600' if os.getenv('REDIS_URL') else '60'))
+# How long a closet's outfit suggestion features stay cached (accounts.suggestions)
+OUTFIT_SUGGESTIONS_CACHE_TIMEOUT = int(
+    os.getenv('OUTFIT_SUGGESTIONS_CACHE_TIMEOUT', '86400' if os.getenv('REDIS_URL') else '60')
+)
 
 
 CONN_MAX_AGE = 600 
@@ -144,6 +196,8 @@ AWS_ACCESS_KEY_ID = os.getenv('AWS_ACCESS_KEY_ID')
 AWS_SECRET_ACCESS_KEY = os.getenv('AWS_SECRET_ACCESS_KEY')
 AWS_STORAGE_BUCKET_NAME = os.getenv('AWS_STORAGE_BUCKET_NAME')
 AWS_S3_REGION_NAME = os.getenv('AWS_S3_REGION_NAME', 'us-east-1')
+# Point at MinIO/moto to exercise S3 (including direct uploads) locally
+AWS_S3_ENDPOINT_URL = os.getenv('AWS_S3_ENDPOINT_URL')
 
 if AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY and AWS_STORAGE_BUCKET_NAME:
     AWS_S3_CUSTOM_DOMAIN = f'{AWS_STORAGE_BUCKET_NAME}.s3.amazonaws.com'
@@ -0,0 +1,109 @@
+"""
+Write-behind like/save counters for pins.
+
+Liking or saving a pin records a PinInteraction (one per user, pin and
+kind, so repeats change nothing) and adds +1/-1 to one of
+PIN_COUNTER_SHARDS PinCounterShard rows for the pin, picked at random.
+Concurrent interactions on a popular pin therefore update different rows
+instead of queueing on the Pin row's lock.
+
+flush() folds the pending deltas into Pin.likes/saves: it locks a batch
+of shard rows, sums them per pin, deletes them and applies one
+UPDATE ... SET likes = likes + n per pin, then refreshes those pins'
+trending scores (see pins.trending). Run it periodically with the
+flush_pin_counters command. Until then Pin.likes/saves lag behind;
+current_counts() adds the pending deltas for a single pin.
+"""
+from collections import defaultdict
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from .models import Pin, PinInteraction, PinCounterShard
+from . import trending
+import random
+
+FIELDS = {'like': 'likes', 'save': 'saves'}
+FLUSH_BATCH_SIZE = 1000
+
+
+def _shard_count():
+    return getattr(settings, 'PIN_COUNTER_SHARDS', 8)
+
+
+def add(pin_id, field, delta):
+    """Add `delta` to a random shard of `pin_id`'s `field` counter"""
+    shard = random.randrange(_shard_count())
+    shards = PinCounterShard.objects.filter(pin_id=pin_id, shard=shard)
+    if shards.update(**{field: F(field) + delta}):
+        return
+    try:
+        with transaction.atomic():
+            PinCounterShard.objects.create(pin_id=pin_id, shard=shard, **{field: delta})
+    except IntegrityError:
+        # Another request created the shard first
+        shards.update(**{field: F(field) + delta})
+
+
+def set_interaction(user, pin_id, kind, active):
+    """
+    Like/save (`active`) or unlike/unsave a pin for `user`.
+
+    Returns True if anything changed; repeating a call returns False and
+    leaves the counters alone.
+    """
+    field = FIELDS[kind]
+    with transaction.atomic():
+        if active:
+            try:
+                with transaction.atomic():
+                    PinInteraction.objects.create(user=user, pin_id=pin_id, kind=kind)
+            except IntegrityError:
+                return False
+            add(pin_id, field, 1)
+            return True
+
+        deleted, _ = PinInteraction.objects.filter(user=user, pin_id=pin_id, kind=kind).delete()
+        if deleted:
+            add(pin_id, field, -1)
+        return bool(deleted)
+
+
+def current_counts(pin):
+    """(likes, saves) for `pin` including deltas that haven't been flushed"""
+    pending = pin.counter_shards.aggregate(likes=Sum('likes'), saves=Sum('saves'))
+    return pin.likes + (pending['likes'] or 0), pin.saves + (pending['saves'] or 0)
+
+
+def flush(batch_size=FLUSH_BATCH_SIZE):
+    """Fold pending shard deltas into Pin.likes/saves; returns the number of pins updated"""
+    updated = 0
+    while True:
+        with transaction.atomic():
+            # skip_locked lets several flushers run side by side
+            shards = list(
+                PinCounterShard.objects.select_for_update(skip_locked=True)
+                .order_by('id')
+                .values_list('id', 'pin_id', 'likes', 'saves')[:batch_size]
+            )
+            if not shards:
+                return updated
+
+            totals = defaultdict(lambda: [0, 0])
+            for _, pin_id, likes, saves in shards:
+                totals[pin_id][0] += likes
+                totals[pin_id][1] += saves
+            PinCounterShard.objects.filter(id__in=[shard[0] for shard in shards]).delete()
+
+            # Pin order keeps concurrent flushers from deadlocking
+            changed = []
+            for pin_id in sorted(totals):
+                likes, saves = totals[pin_id]
+                if likes or saves:
+                    Pin.objects.filter(pk=pin_id).update(likes=F('likes') + likes, saves=F('saves') + saves)
+                    changed.append(pin_id)
+            # Rescore with the new counts in the same transaction
+            trending.refresh(changed)
+            updated += len(changed)
+
+        if len(shards) < batch_size:
+            return updated
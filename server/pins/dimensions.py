@@ -0,0 +1,232 @@
+"""
+Pin image dimensions, read from the image header.
+
+A pin only stores the URL of its image, so width/height default to
+200x300 unless the client sends them. After a pin is created (or its
+image_url changes) schedule() fetches the first HEADER_CHUNK_SIZE bytes
+of the image with a Range request, has Pillow parse the header
+(PIL.Image.open is lazy: it reads the size without decoding pixels) and
+stores the size on the row. JPEG, PNG, GIF and WebP headers all fit in
+the first chunk unless a JPEG carries a large EXIF block; then growing
+ranges are requested, up to MAX_HEADER_SIZE. Servers that ignore Range
+are read chunk by chunk and the connection is dropped once the header
+is parsed.
+
+Image URLs come from users, so every connection, redirects included, is
+made by _connect(): it resolves the host once, refuses it unless all its
+addresses are public and connects to one of those same addresses, so a
+redirect or a DNS answer that changes between check and connect cannot
+reach an internal service. Only http(s) redirects are followed, at most
+MAX_REDIRECTS of them, and no proxy is used.
+
+Sizes are cached per URL (misses too, for a shorter time), so pins that
+share an image cost a single fetch. Fetches run on a small thread pool
+off the request; with the inline image executor (tests) they run
+straight away.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import (
+    HTTPDefaultErrorHandler, HTTPErrorProcessor, HTTPHandler, HTTPRedirectHandler, HTTPSHandler,
+    OpenerDirector, Request,
+)
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, connection
+from PIL import Image
+from accounts.processing import get_executor
+from .models import Pin
+import http.client
+import ipaddress
+import threading
+import hashlib
+import logging
+import socket
+import ssl
+import io
+
+logger = logging.getLogger(__name__)
+
+HEADER_CHUNK_SIZE = 16 * 1024
+MAX_HEADER_SIZE = 256 * 1024
+FETCH_TIMEOUT = 5
+MAX_REDIRECTS = 3
+CACHE_TIMEOUT = 7 * 24 * 60 * 60
+MISS_CACHE_TIMEOUT = 60 * 60
+# EXIF orientations that rotate the image by 90 degrees
+ROTATED_ORIENTATIONS = {5, 6, 7, 8}
+
+_lock = threading.Lock()
+_runner = None
+
+
+def _cache_key(url):
+    return f"pin-image-size:{hashlib.sha1(url.encode()).hexdigest()}"
+
+
+def parse_size(data):
+    """(width, height) from the start of an image file, or None if it isn't enough"""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            width, height = image.size
+            if image.format in ('JPEG', 'MPO', 'WEBP'):
+                # Phones store portrait photos sideways with an orientation tag
+                if image.getexif().get(0x0112) in ROTATED_ORIENTATIONS:
+                    width, height = height, width
+    except Exception:
+        return None
+    if width <= 0 or height <= 0:
+        return None
+    return width, height
+
+
+class BlockedAddress(Exception):
+    """The image host resolves to a loopback, private or link-local address"""
+
+
+def _is_public_address(address):
+    return ipaddress.ip_address(address.split('%')[0]).is_global
+
+
+def _connect(host, port, timeout):
+    """A socket to `host`, connected to one of the addresses that were checked"""
+    addresses = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    if not getattr(settings, 'PIN_IMAGE_FETCH_PRIVATE_HOSTS', False):
+        if not addresses or not all(_is_public_address(info[4][0]) for info in addresses):
+            raise BlockedAddress(f"{host} does not resolve to a public address")
+
+    error = None
+    for family, kind, proto, _, address in addresses:
+        sock = socket.socket(family, kind, proto)
+        try:
+            sock.settimeout(timeout)
+            sock.connect(address)
+            return sock
+        except OSError as e:
+            sock.close()
+            error = e
+    raise error
+
+
+class _PinnedHTTPConnection(http.client.HTTPConnection):
+    def connect(self):
+        self.sock = _connect(self.host, self.port, self.timeout)
+
+
+class _PinnedHTTPSConnection(http.client.HTTPSConnection):
+    def connect(self):
+        # Certificates are still checked against the host name
+        self.sock = _ssl_context.wrap_socket(
+            _connect(self.host, self.port, self.timeout), server_hostname=self.host
+        )
+
+
+class _PinnedHTTPHandler(HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(_PinnedHTTPConnection, req)
+
+
+class _PinnedHTTPSHandler(HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(_PinnedHTTPSConnection, req)
+
+
+class _RedirectHandler(HTTPRedirectHandler):
+    max_redirections = MAX_REDIRECTS
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        # None makes the redirect fail as an HTTPError
+        if not newurl.startswith(('http://', 'https://')):
+            return None
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+_ssl_context = ssl.create_default_context()
+# Built by hand rather than with build_opener(), which would add proxy, ftp and file handlers
+_opener = OpenerDirector()
+for _handler in (
+    _PinnedHTTPHandler(), _PinnedHTTPSHandler(), _RedirectHandler(),
+    HTTPDefaultErrorHandler(), HTTPErrorProcessor(),
+):
+    _opener.add_handler(_handler)
+
+
+def fetch_size(url):
+    """Read just enough of the image at `url` to get its size; None if that fails"""
+    if not url.startswith(('http://', 'https://')):
+        return None
+
+    data = b''
+    while len(data) < MAX_HEADER_SIZE:
+        # Each follow-up range doubles what has been read so far
+        end = min(max(2 * len(data), HEADER_CHUNK_SIZE), MAX_HEADER_SIZE) - 1
+        request = Request(url, headers={
+            'Range': f'bytes={len(data)}-{end}',
+            'User-Agent': 'Oasis/1.0 (+image size)',
+        })
+        with _opener.open(request, timeout=FETCH_TIMEOUT) as response:
+            partial = response.status == 206
+            if not partial:
+                data = b''
+            while len(data) < MAX_HEADER_SIZE:
+                chunk = response.read(HEADER_CHUNK_SIZE)
+                if not chunk:
+                    break
+                data += chunk
+                size = parse_size(data)
+                if size:
+                    return size
+        if not partial or len(data) <= end:
+            # The whole file was read
+            return None
+    return None
+
+
+def cached_size(url):
+    """fetch_size() through the cache"""
+    key = _cache_key(url)
+    size = cache.get(key)
+    if size is not None:
+        return tuple(size) if size else None
+
+    try:
+        size = fetch_size(url)
+    except Exception as e:
+        logger.warning(f"Could not read image size of {url}: {str(e)}")
+        size = None
+    # Misses are cached as () so a broken URL isn't fetched on every save
+    cache.set(key, size or (), CACHE_TIMEOUT if size else MISS_CACHE_TIMEOUT)
+    return size
+
+
+def update_size(pin_id, url):
+    """Store the size of `url` on the pin, unless its image changed meanwhile"""
+    size = cached_size(url)
+    if size:
+        Pin.objects.filter(pk=pin_id, image_url=url).update(width=size[0], height=size[1])
+    return size
+
+
+def _update_in_background(pin_id, url):
+    # Runs on a fetch thread with its own database connection
+    close_old_connections()
+    try:
+        update_size(pin_id, url)
+    except Exception as e:
+        logger.error(f"Updating image size of pin {pin_id} failed: {str(e)}")
+    finally:
+        connection.close()
+
+
+def schedule(pin):
+    """Fetch the real size of `pin`'s image off the request thread"""
+    global _runner
+    if getattr(get_executor(), 'inline', False):
+        size = update_size(pin.pk, pin.image_url)
+        if size:
+            pin.width, pin.height = size
+        return
+
+    with _lock:
+        if _runner is None:
+            _runner = ThreadPoolExecutor(max_workers=4, thread_name_prefix='pin-image-size')
+    _runner.submit(_update_in_background, pin.pk, pin.image_url)
@@ -0,0 +1,29 @@
+"""
+Fold pending like/save deltas into Pin.likes/saves (see pins.counters).
+
+    python manage.py flush_pin_counters             # once, e.g. from cron
+    python manage.py flush_pin_counters --every 10  # keep flushing every 10s
+"""
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from pins import counters
+import time
+
+
+class Command(BaseCommand):
+    help = 'Flush buffered pin like/save counters into the pin rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=float, metavar='SECONDS', help='Keep running, flushing at this interval')
+        parser.add_argument('--batch-size', type=int, default=counters.FLUSH_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            started = time.perf_counter()
+            updated = counters.flush(options['batch_size'])
+            if updated or not options['every']:
+                self.stdout.write(f"Flushed counters for {updated} pins in {time.perf_counter() - started:.2f}s")
+            if not options['every']:
+                return
+            time.sleep(options['every'])
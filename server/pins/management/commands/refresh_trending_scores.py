@@ -0,0 +1,23 @@
+"""
+Recompute every pin's trending score (see pins.trending).
+
+    python manage.py refresh_trending_scores   # e.g. nightly from cron
+
+Scores are kept current by counters.flush(); this repairs rows changed
+outside it and applies new constants after the formula is tuned.
+"""
+from django.core.management.base import BaseCommand
+from pins import trending
+import time
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored trending score of every pin'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=trending.REFRESH_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        changed = trending.refresh_all(options['batch_size'])
+        self.stdout.write(f"Updated {changed} trending scores in {time.perf_counter() - started:.2f}s")
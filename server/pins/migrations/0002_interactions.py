@@ -0,0 +1,43 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pins', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PinCounterShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('likes', models.IntegerField(default=0)),
+                ('saves', models.IntegerField(default=0)),
+                ('pin', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='counter_shards', to='pins.pin')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('pin', 'shard'), name='pin_counter_shard_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PinInteraction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('like', 'Like'), ('save', 'Save')], max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('pin', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='interactions', to='pins.pin')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pin_interactions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'kind', '-created_at'], name='pin_interaction_user_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'pin', 'kind'), name='pin_interaction_unique')],
+            },
+        ),
+    ]
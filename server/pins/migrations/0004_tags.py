@@ -0,0 +1,55 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_csv_tags(apps, schema_editor):
+    """Build Tag/PinTag rows from the existing comma-separated Pin.tags"""
+    Pin = apps.get_model('pins', 'Pin')
+    Tag = apps.get_model('pins', 'Tag')
+    PinTag = apps.get_model('pins', 'PinTag')
+
+    def names(tags):
+        return {tag.strip().lower()[:100] for tag in (tags or '').split(',') if tag.strip()}
+
+    pins = list(Pin.objects.exclude(tags='').values_list('id', 'tags', 'created_at'))
+    all_names = set().union(*(names(tags) for _, tags, _ in pins)) if pins else set()
+    Tag.objects.bulk_create([Tag(name=name) for name in all_names], batch_size=1000)
+    tag_ids = dict(Tag.objects.values_list('name', 'id'))
+    PinTag.objects.bulk_create([
+        PinTag(pin_id=pin_id, tag_id=tag_ids[name], pin_created_at=created_at)
+        for pin_id, tags, created_at in pins
+        for name in names(tags)
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pins', '0003_feed_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PinTag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pin_created_at', models.DateTimeField()),
+                ('pin', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pin_tags', to='pins.pin')),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pin_tags', to='pins.tag')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['tag', '-pin_created_at', '-pin'], name='pintag_tag_created_idx')],
+                'constraints': [models.UniqueConstraint(fields=('pin', 'tag'), name='pin_tag_unique')],
+            },
+        ),
+        migrations.RunPython(copy_csv_tags, migrations.RunPython.noop),
+    ]
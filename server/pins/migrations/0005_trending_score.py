@@ -0,0 +1,38 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:09
+
+from django.conf import settings
+from datetime import datetime, timezone
+from django.db import migrations, models
+import math
+
+
+def score_existing_pins(apps, schema_editor):
+    """Same formula as pins.trending.score, frozen here"""
+    Pin = apps.get_model('pins', 'Pin')
+    epoch = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    pins = list(Pin.objects.only('id', 'likes', 'saves', 'created_at'))
+    for pin in pins:
+        engagement = max(pin.likes + 2 * pin.saves, 1)
+        pin.trending_score = round(math.log10(engagement) + (pin.created_at - epoch).total_seconds() / 45000, 7)
+    Pin.objects.bulk_update(pins, ['trending_score'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pins', '0004_tags'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pin',
+            name='trending_score',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='pin',
+            index=models.Index(fields=['-trending_score', '-id'], name='pin_trending_idx'),
+        ),
+        migrations.RunPython(score_existing_pins, migrations.RunPython.noop),
+    ]
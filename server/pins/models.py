@@ -1,6 +1,12 @@
 
 from django.db import models
 from django.contrib.auth.models import User
+from functools import lru_cache
+
+@lru_cache(maxsize=4096)
+def split_tags(tags):
+    """Parsed form of a CSV tags string; many pins share the same string"""
+    return tuple(tag.strip() for tag in tags.split(',') if tag.strip())
 
 class Pin(models.Model):
     title = models.CharField(max_length=255)
@@ -12,17 +18,94 @@ class Pin(models.Model):
     likes = models.IntegerField(default=0)
     saves = models.IntegerField(default=0)
     tags = models.CharField(max_length=500, blank=True)
+    # Maintained by pins.trending
+    trending_score = models.FloatField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Feed cursor pagination: order by -created_at, -id
+            models.Index(fields=['-created_at', '-id'], name='pin_created_idx'),
+            # ?sort=trending cursor pagination: order by -trending_score, -id
+            models.Index(fields=['-trending_score', '-id'], name='pin_trending_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
     def get_tags_list(self):
-        return [tag.strip() for tag in self.tags.split(',') if tag.strip()]
+        return list(split_tags(self.tags))
+
+class Tag(models.Model):
+    """A normalized (lowercased) tag name; see pins.tagging"""
+    name = models.CharField(max_length=100, unique=True)
+
+    def __str__(self):
+        return self.name
+
+class PinTag(models.Model):
+    """
+    Pin <-> tag link. The pin's created_at is copied in (it never changes)
+    so a tag's pins can be paged newest first straight off one index.
+    """
+    pin = models.ForeignKey(Pin, on_delete=models.CASCADE, related_name='pin_tags')
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name='pin_tags')
+    pin_created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['pin', 'tag'], name='pin_tag_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['tag', '-pin_created_at', '-pin'], name='pintag_tag_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.tag.name} on pin {self.pin_id}"
+
+class PinInteraction(models.Model):
+    """A user's like or save of a pin; the unique constraint makes repeats no-ops"""
+    KIND_CHOICES = [
+        ('like', 'Like'),
+        ('save', 'Save'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='pin_interactions')
+    pin = models.ForeignKey(Pin, on_delete=models.CASCADE, related_name='interactions')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'pin', 'kind'], name='pin_interaction_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'kind', '-created_at'], name='pin_interaction_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} {self.kind}d pin {self.pin_id}"
+
+class PinCounterShard(models.Model):
+    """
+    Pending like/save deltas for a pin, spread over a few rows so concurrent
+    interactions don't all lock the same one. Folded into Pin.likes/saves
+    by flush_pin_counters (see pins.counters).
+    """
+    pin = models.ForeignKey(Pin, on_delete=models.CASCADE, related_name='counter_shards')
+    shard = models.PositiveSmallIntegerField()
+    likes = models.IntegerField(default=0)
+    saves = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['pin', 'shard'], name='pin_counter_shard_unique'),
+        ]
+
+    def __str__(self):
+        return f"Pin {self.pin_id} shard {self.shard}: +{self.likes} likes, +{self.saves} saves"
 
 class Category(models.Model):
     name = models.CharField(max_length=100)
@@ -1,11 +1,19 @@
 from rest_framework import serializers
-from .models import Pin, Category
+from .models import Pin, Tag, Category
 
 class PinSerializer(serializers.ModelSerializer):
     author_name = serializers.CharField(source='author.username', read_only=True)
-    author_avatar = serializers.CharField(source='author.profile.avatar', read_only=True)
+    author_avatar = serializers.SerializerMethodField()
     tags_list = serializers.SerializerMethodField()
 
+    # Columns the feed loads; everything else on the pin, author and profile is deferred.
+    # trending_score isn't serialized but the trending cursor reads it.
+    FEED_FIELDS = (
+        'id', 'title', 'description', 'image_url', 'width', 'height', 'likes', 'saves', 'tags',
+        'trending_score', 'created_at', 'author__id', 'author__username', 'author__profile__id',
+        'author__profile__avatar',
+    )
+
     class Meta:
         model = Pin
         fields = [
@@ -15,6 +23,25 @@ class PinSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['author', 'likes', 'saves']
 
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        """Author and profile come in the same query, so a page costs one query"""
+        return queryset.select_related('author__profile').only(*cls.FEED_FIELDS)
+
+    def get_author_avatar(self, obj):
+        # Resolved once per author per response; storage URLs can be costly to build
+        if not hasattr(self, '_avatar_urls'):
+            self._avatar_urls = {}
+        cache = self._avatar_urls
+        if obj.author_id not in cache:
+            try:
+                avatar = obj.author.profile.avatar if obj.author else None
+                cache[obj.author_id] = avatar.url if avatar else None
+            except Exception as e:
+                print(f"❌ Error getting pin author avatar URL: {e}")
+                cache[obj.author_id] = None
+        return cache[obj.author_id]
+
     def get_tags_list(self, obj):
         return obj.get_tags_list()
 
@@ -22,6 +49,13 @@ class PinSerializer(serializers.ModelSerializer):
         validated_data['author'] = self.context['request'].user
         return super().create(validated_data)
 
+class TagSerializer(serializers.ModelSerializer):
+    pin_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Tag
+        fields = ['id', 'name', 'pin_count']
+
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
@@ -0,0 +1,23 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from .models import Pin
+from .tagging import sync_pin_tags
+from . import trending
+
+
+@receiver(post_save, sender=Pin)
+def index_pin_tags(sender, instance, created, update_fields=None, **kwargs):
+    if created and not instance.tags:
+        return
+    if update_fields is None or 'tags' in update_fields:
+        sync_pin_tags([instance])
+
+
+@receiver(post_save, sender=Pin)
+def set_trending_score(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not {'likes', 'saves'} & set(update_fields):
+        return
+    value = trending.score(instance.likes, instance.saves, instance.created_at)
+    if instance.trending_score != value:
+        Pin.objects.filter(pk=instance.pk).update(trending_score=value)
+        instance.trending_score = value
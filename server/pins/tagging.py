@@ -0,0 +1,39 @@
+"""
+Normalized tag index for pins.
+
+Pin.tags stays the comma-separated field clients read and write (and what
+tags_list is parsed from). Every save mirrors it into Tag/PinTag rows, so
+finding a tag's pins is an index range scan on PinTag instead of a LIKE
+over the CSV column. Tag names are stored stripped and lowercased.
+"""
+from .models import Tag, PinTag, split_tags
+
+TAG_MAX_LENGTH = Tag._meta.get_field('name').max_length
+
+
+def normalize_tag(tag):
+    return tag.strip().lower()[:TAG_MAX_LENGTH]
+
+
+def tag_names(tags):
+    """The normalized, distinct tag names of a CSV tags string"""
+    return {name for name in (normalize_tag(tag) for tag in split_tags(tags or '')) if name}
+
+
+def sync_pin_tags(pins):
+    """
+    Rebuild the PinTag rows of `pins` from their CSV tags.
+
+    Called from the post_save signal; bulk paths must call it themselves.
+    """
+    pins = list(pins)
+    names = set().union(*(tag_names(pin.tags) for pin in pins)) if pins else set()
+    Tag.objects.bulk_create([Tag(name=name) for name in names], ignore_conflicts=True)
+    tag_ids = dict(Tag.objects.filter(name__in=names).values_list('name', 'id'))
+
+    PinTag.objects.filter(pin__in=pins).delete()
+    PinTag.objects.bulk_create([
+        PinTag(pin=pin, tag_id=tag_ids[name], pin_created_at=pin.created_at)
+        for pin in pins
+        for name in tag_names(pin.tags)
+    ])
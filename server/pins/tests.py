@@ -1,3 +1,313 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.core.cache import cache
+from django.utils import timezone
+from datetime import timedelta
+from django.contrib.auth.models import User
+from rest_framework.test import APIClient
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from PIL import Image
+from unittest.mock import patch
+import threading
+import io
+from .models import Pin, PinInteraction, PinTag
+from . import counters, dimensions, trending
 
-# Create your tests here.
+
+class PinInteractionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'password123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.pin = Pin.objects.create(title='Pin', image_url='https://example.com/pin.jpg', author=self.user)
+
+    def test_likes_are_deduplicated_and_buffered(self):
+        response = self.client.put(f'/api/pins/{self.pin.id}/like/')
+        self.assertEqual(response.json()['likes'], 1)
+        self.assertTrue(response.json()['changed'])
+
+        response = self.client.put(f'/api/pins/{self.pin.id}/like/')
+        self.assertEqual((response.json()['likes'], response.json()['changed']), (1, False))
+        self.assertEqual(PinInteraction.objects.count(), 1)
+
+        # The pin row itself only moves when the counters are flushed
+        self.assertEqual(Pin.objects.get().likes, 0)
+        self.assertEqual(counters.flush(), 1)
+        self.assertEqual(Pin.objects.get().likes, 1)
+        self.assertEqual(counters.flush(), 0)
+
+    def test_unlike_and_save(self):
+        for other in ('a', 'b', 'c'):
+            user = User.objects.create_user(other, f'{other}@example.com', 'password123')
+            counters.set_interaction(user, self.pin.id, 'like', True)
+        self.client.put(f'/api/pins/{self.pin.id}/save/')
+        counters.flush()
+
+        self.client.put(f'/api/pins/{self.pin.id}/like/')
+        response = self.client.delete(f'/api/pins/{self.pin.id}/like/')
+        self.assertEqual(response.json(), {
+            'id': self.pin.id, 'liked': False, 'changed': True, 'likes': 3, 'saves': 1,
+        })
+        counters.flush()
+        pin = Pin.objects.get()
+        self.assertEqual((pin.likes, pin.saves), (3, 1))
+
+    def test_missing_pin(self):
+        self.assertEqual(self.client.put('/api/pins/999/like/').status_code, 404)
+
+
+class PinFeedTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def create_pins(self, authors, pins_per_author):
+        start = User.objects.count()
+        for a in range(start, start + authors):
+            author = User.objects.create_user(f'author{a}', f'author{a}@example.com', 'password123')
+            for p in range(pins_per_author):
+                Pin.objects.create(
+                    title=f'Pin {a}-{p}', image_url='https://example.com/pin.jpg', author=author, tags='a, b',
+                )
+
+    def test_page_query_count_is_constant(self):
+        self.create_pins(1, 2)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/pins/', {'page_size': 10})
+        self.assertEqual(len(response.json()['results']), 2)
+
+        self.create_pins(5, 10)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/pins/', {'page_size': 20})
+        page = response.json()
+        self.assertEqual(len(page['results']), 20)
+        self.assertEqual(page['results'][0]['tags_list'], ['a', 'b'])
+        self.assertIsNone(page['results'][0]['author_avatar'])
+
+        with self.assertNumQueries(1):
+            response = self.client.get(page['next'])
+        self.assertEqual(len(response.json()['results']), 20)
+
+    def test_unpaginated_list_is_one_query(self):
+        self.create_pins(3, 3)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/pins/')
+        self.assertEqual(len(response.json()), 9)
+        self.assertEqual(response.json()[0]['author_name'], 'author2')
+
+
+class PinTagTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'password123')
+        self.client = APIClient()
+
+    def create_pin(self, title, tags):
+        return Pin.objects.create(title=title, image_url='https://example.com/pin.jpg', author=self.user, tags=tags)
+
+    def test_browse_by_tag(self):
+        for i in range(25):
+            self.create_pin(f'Summer {i}', 'Summer, linen' if i % 2 else 'summer')
+        self.create_pin('Winter', 'winter')
+
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/pins/', {'tag': ' SUMMER ', 'page_size': 10})
+        page = response.json()
+        self.assertEqual([pin['title'] for pin in page['results']], [f'Summer {i}' for i in range(24, 14, -1)])
+        # tags_list still comes from the CSV as written
+        self.assertEqual(page['results'][1]['tags_list'], ['Summer', 'linen'])
+
+        titles = [pin['title'] for pin in page['results']]
+        while page['next']:
+            page = self.client.get(page['next']).json()
+            titles += [pin['title'] for pin in page['results']]
+        self.assertEqual(len(titles), 25)
+        self.assertEqual(len(self.client.get('/api/pins/', {'tag': 'linen'}).json()['results']), 12)
+        self.assertEqual(self.client.get('/api/pins/', {'tag': 'nope'}).json()['results'], [])
+
+    def test_tag_index_follows_edits(self):
+        pin = self.create_pin('Pin', 'a, b')
+        self.assertEqual(sorted(PinTag.objects.values_list('tag__name', flat=True)), ['a', 'b'])
+
+        pin.tags = 'b, c'
+        pin.save()
+        self.assertEqual(sorted(PinTag.objects.values_list('tag__name', flat=True)), ['b', 'c'])
+        self.assertEqual(self.client.get('/api/pins/', {'tag': 'a'}).json()['results'], [])
+
+        response = self.client.get('/api/pins/tags/')
+        self.assertEqual([tag['name'] for tag in response.json()], ['b', 'c'])
+        self.assertEqual(response.json()[0]['pin_count'], 1)
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    """Serves ImageServer.files, honouring Range unless ImageServer.ranges is off"""
+    def do_GET(self):
+        data = self.server.files.get(self.path)
+        self.server.requests.append(self.path)
+        if self.path in self.server.redirects:
+            self.send_response(302)
+            self.send_header('Location', self.server.redirects[self.path])
+            self.end_headers()
+            return
+        if data is None:
+            self.send_error(404)
+            return
+        status, body = 200, data
+        header = self.headers.get('Range')
+        if header and self.server.ranges:
+            start, end = header.split('=')[1].split('-')
+            body = data[int(start):int(end) + 1]
+            status = 206
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+            self.server.sent += len(body)
+        except OSError:
+            # The client hung up after reading the header
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+# The image server runs on loopback
+@override_settings(PIN_IMAGE_FETCH_PRIVATE_HOSTS=True)
+class PinImageSizeTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), ImageHandler)
+        cls.server.files, cls.server.redirects, cls.server.requests = {}, {}, []
+        cls.server.ranges, cls.server.sent = True, 0
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.server.files.clear()
+        self.server.redirects.clear()
+        self.server.requests.clear()
+        self.server.ranges, self.server.sent = True, 0
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'password123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def serve(self, path, size, fmt='PNG', exif=None):
+        buffer = io.BytesIO()
+        # Noise keeps the encoded file large, so reading it all would show up
+        image = Image.effect_noise(size, 100).convert('RGB')
+        image.save(buffer, fmt, **({'exif': exif} if exif else {}))
+        self.server.files[path] = buffer.getvalue()
+        return f"http://127.0.0.1:{self.server.server_address[1]}{path}"
+
+    def test_size_is_read_from_the_header_and_cached(self):
+        url = self.serve('/wide.png', (1200, 400))
+        self.assertGreater(len(self.server.files['/wide.png']), dimensions.MAX_HEADER_SIZE)
+
+        response = self.client.post('/api/pins/', {'title': 'Wide', 'image_url': url}, format='json')
+        self.assertEqual((response.json()['width'], response.json()['height']), (1200, 400))
+        self.assertEqual((Pin.objects.get().width, Pin.objects.get().height), (1200, 400))
+        self.assertLessEqual(self.server.sent, dimensions.HEADER_CHUNK_SIZE)
+
+        self.client.post('/api/pins/', {'title': 'Again', 'image_url': url}, format='json')
+        self.assertEqual(self.server.requests, ['/wide.png'])
+        self.assertEqual(Pin.objects.filter(width=1200, height=400).count(), 2)
+
+    def test_rotated_jpeg_without_range_support(self):
+        self.server.ranges = False
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        url = self.serve('/portrait.jpg', (640, 480), 'JPEG', exif)
+
+        pin = Pin.objects.create(title='Portrait', image_url=url, author=self.user)
+        dimensions.schedule(pin)
+        self.assertEqual((pin.width, pin.height), (480, 640))
+
+    def test_client_sizes_and_failures_keep_the_row(self):
+        url = self.serve('/square.png', (300, 300))
+        response = self.client.post(
+            '/api/pins/', {'title': 'Given', 'image_url': url, 'width': 10, 'height': 20}, format='json'
+        )
+        self.assertEqual((response.json()['width'], response.json()['height']), (10, 20))
+        self.assertEqual(self.server.requests, [])
+
+        missing = url.replace('square', 'missing')
+        response = self.client.post('/api/pins/', {'title': 'Missing', 'image_url': missing}, format='json')
+        self.assertEqual((response.json()['width'], response.json()['height']), (200, 300))
+        self.assertIsNone(dimensions.cached_size(missing))
+        self.assertEqual(self.server.requests, ['/missing.png'])
+
+        response = self.client.patch(f"/api/pins/{response.json()['id']}/", {'image_url': url}, format='json')
+        self.assertEqual((response.json()['width'], response.json()['height']), (300, 300))
+
+    def test_redirects_to_private_hosts_are_not_followed(self):
+        url = self.serve('/square.png', (300, 300))
+        port = self.server.server_address[1]
+        self.server.redirects['/moved.png'] = '/square.png'
+        self.assertEqual(dimensions.fetch_size(url.replace('square', 'moved')), (300, 300))
+
+        # Treat the test server's address as public; any other loopback address stays blocked
+        self.server.redirects['/internal.png'] = f'http://127.0.0.2:{port}/square.png'
+        with self.settings(PIN_IMAGE_FETCH_PRIVATE_HOSTS=False), \
+                patch.object(dimensions, '_is_public_address', lambda address: address == '127.0.0.1'):
+            self.assertEqual(dimensions.fetch_size(url), (300, 300))
+            self.server.requests.clear()
+            with self.assertRaises(dimensions.BlockedAddress):
+                dimensions.fetch_size(url.replace('square', 'internal'))
+            self.assertIsNone(dimensions.cached_size(url.replace('square', 'internal')))
+            self.assertEqual(self.server.requests, ['/internal.png', '/internal.png'])
+
+            with self.assertRaises(dimensions.BlockedAddress):
+                dimensions.fetch_size(f'http://127.0.0.2:{port}/square.png')
+
+
+class TrendingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'password123')
+        self.client = APIClient()
+
+    def create_pin(self, title, created_at, likes=0):
+        pin = Pin.objects.create(title=title, image_url='https://example.com/pin.jpg', author=self.user, likes=likes)
+        Pin.objects.filter(pk=pin.pk).update(created_at=created_at)
+        return pin
+
+    def test_score_formula(self):
+        now = timezone.now()
+        later = now + timedelta(seconds=trending.DECAY_SECONDS)
+        # Ten times the engagement buys DECAY_SECONDS of age
+        self.assertAlmostEqual(trending.score(10, 0, now), trending.score(1, 0, later), places=5)
+        self.assertEqual(trending.score(0, 5, now), trending.score(10, 0, now))
+
+        pin = Pin.objects.create(title='New', image_url='https://example.com/pin.jpg', likes=100)
+        self.assertEqual(Pin.objects.get().trending_score, trending.score(100, 0, pin.created_at))
+
+    def test_trending_pages_follow_flushed_counters(self):
+        now = timezone.now()
+        old = self.create_pin('Old but loved', now - timedelta(days=1), likes=1000)
+        new = self.create_pin('New', now)
+        stale = self.create_pin('Stale', now - timedelta(days=3), likes=5)
+        trending.refresh_all()
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/pins/', {'sort': 'trending', 'page_size': 2})
+        page = response.json()
+        self.assertEqual([pin['title'] for pin in page['results']], ['Old but loved', 'New'])
+        self.assertEqual([pin['title'] for pin in self.client.get(page['next']).json()['results']], ['Stale'])
+
+        user = User.objects.create_user('fan', 'fan@example.com', 'password123')
+        counters.set_interaction(user, stale.id, 'save', True)
+        counters.flush()
+        self.assertEqual(Pin.objects.get(pk=stale.pk).trending_score, trending.score(5, 1, now - timedelta(days=3)))
+        self.assertEqual(trending.refresh_all(), 0)
+
+        Pin.objects.filter(pk=new.pk).update(likes=10 ** 6)
+        self.assertEqual(trending.refresh_all(), 1)
+        response = self.client.get('/api/pins/', {'sort': 'trending'})
+        self.assertEqual([pin['id'] for pin in response.json()['results']], [new.id, old.id, stale.id])
+
+        self.assertEqual(self.client.get('/api/pins/', {'sort': 'hot'}).status_code, 400)
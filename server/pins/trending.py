@@ -0,0 +1,62 @@
+"""
+Stored trending score for pins (?sort=trending on the pin list).
+
+    score = log10(max(likes + SAVE_WEIGHT * saves, 1)) + (created_at - EPOCH) / DECAY_SECONDS
+
+Engagement counts logarithmically and age linearly, so a pin needs ten
+times the engagement to keep up with one posted DECAY_SECONDS later.
+Because age is measured from a fixed epoch rather than from "now", a
+pin's score only changes when its counters do and the order decays by
+itself as new pins arrive: nothing has to rewrite every row as time
+passes. The score is stored in Pin.trending_score behind a
+(-trending_score, -id) index, so a trending page is an index range scan
+however many pins there are.
+
+New pins get their score from a post_save signal and counters.flush()
+refreshes the pins it touches. Run `manage.py refresh_trending_scores`
+periodically (or after changing the constants) to recompute every row
+and repair anything that was missed, e.g. counts edited in the admin.
+"""
+from datetime import datetime, timezone
+from .models import Pin
+import math
+
+EPOCH = datetime(2026, 1, 1, tzinfo=timezone.utc)
+DECAY_SECONDS = 45000
+SAVE_WEIGHT = 2
+REFRESH_BATCH_SIZE = 1000
+
+
+def score(likes, saves, created_at):
+    engagement = max(likes + SAVE_WEIGHT * saves, 1)
+    return round(math.log10(engagement) + (created_at - EPOCH).total_seconds() / DECAY_SECONDS, 7)
+
+
+def _rescore(pins):
+    changed = []
+    for pin in pins:
+        value = score(pin.likes, pin.saves, pin.created_at)
+        if pin.trending_score != value:
+            pin.trending_score = value
+            changed.append(pin)
+    Pin.objects.bulk_update(changed, ['trending_score'], batch_size=REFRESH_BATCH_SIZE)
+    return len(changed)
+
+
+def refresh(pin_ids):
+    """Recompute the score of the given pins; returns how many changed"""
+    return _rescore(Pin.objects.filter(pk__in=list(pin_ids)).only('id', 'likes', 'saves', 'created_at', 'trending_score'))
+
+
+def refresh_all(batch_size=REFRESH_BATCH_SIZE):
+    """Recompute every pin's score in id order, batch by batch; returns how many changed"""
+    changed, last_id = 0, 0
+    while True:
+        pins = list(
+            Pin.objects.filter(pk__gt=last_id).order_by('pk')
+            .only('id', 'likes', 'saves', 'created_at', 'trending_score')[:batch_size]
+        )
+        if not pins:
+            return changed
+        changed += _rescore(pins)
+        last_id = pins[-1].pk
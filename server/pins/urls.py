@@ -4,5 +4,8 @@ from . import views
 urlpatterns = [
     path('', views.PinListCreateView.as_view(), name='pin-list-create'),
     path('<int:pk>/', views.PinDetailView.as_view(), name='pin-detail'),
+    path('<int:pk>/like/', views.PinInteractionView.as_view(kind='like'), name='pin-like'),
+    path('<int:pk>/save/', views.PinInteractionView.as_view(kind='save'), name='pin-save'),
+    path('tags/', views.TagListView.as_view(), name='tag-list'),
     path('categories/', views.CategoryListCreateView.as_view(), name='category-list-create'),
 ]
\ No newline at end of file
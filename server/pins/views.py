@@ -1,24 +1,133 @@
 from django.shortcuts import render
-from rest_framework import generics, permissions
+from rest_framework import generics, permissions, status
+from rest_framework.views import APIView
+from django.db.models import Count
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
-from .models import Pin, Category
-from .serializers import PinSerializer, CategorySerializer
+from .models import Pin, Tag, PinTag, Category
+from .serializers import PinSerializer, TagSerializer, CategorySerializer
+from . import counters, dimensions
+from .tagging import normalize_tag
+from accounts.pagination import CreatedAtCursorPagination, wants_pagination
+
+SORTS = ('newest', 'trending')
+
+
+def supplies_size(serializer):
+    # Pins whose client sent both dimensions keep them as given
+    return 'width' in serializer.initial_data and 'height' in serializer.initial_data
+
+
+class TagCursorPagination(CreatedAtCursorPagination):
+    """Pages PinTag rows straight off the (tag, -pin_created_at, -pin) index"""
+    ordering = ('-pin_created_at', '-pin_id')
+
+
+class TrendingCursorPagination(CreatedAtCursorPagination):
+    """Pages pins off the (-trending_score, -id) index"""
+    ordering = ('-trending_score', '-id')
+
 
 class PinListCreateView(generics.ListCreateAPIView):
-    queryset = Pin.objects.all()
+    """
+    Pin feed, newest first. Cursor pagination is opt-in (?page_size= /
+    ?cursor=), except for ?tag=<name> and ?sort=trending, which always
+    return pages.
+    """
     serializer_class = PinSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = CreatedAtCursorPagination
+
+    def get_queryset(self):
+        return PinSerializer.setup_eager_loading(Pin.objects.all())
+
+    @property
+    def paginator(self):
+        if self.request.query_params.get('sort') == 'trending':
+            if not hasattr(self, '_paginator'):
+                self._paginator = TrendingCursorPagination()
+            return self._paginator
+        # Clients that don't ask for pages keep getting a plain list
+        if not wants_pagination(self.request):
+            return None
+        return super().paginator
+
+    def list(self, request, *args, **kwargs):
+        sort = request.query_params.get('sort', 'newest')
+        if sort not in SORTS:
+            return Response({'error': f"sort must be one of: {', '.join(SORTS)}"}, status=status.HTTP_400_BAD_REQUEST)
+        if 'tag' not in request.query_params:
+            return super().list(request, *args, **kwargs)
+        if sort != 'newest':
+            return Response({'error': 'tag pages are sorted by newest only'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # One indexed query for the page of pin ids, one for the pins
+        paginator = TagCursorPagination()
+        tag = normalize_tag(request.query_params['tag'])
+        links = PinTag.objects.filter(tag__name=tag).only('pin_id', 'pin_created_at')
+        page = paginator.paginate_queryset(links, request, view=self)
+        pins = self.get_queryset().in_bulk([link.pin_id for link in page])
+        serializer = self.get_serializer([pins[link.pin_id] for link in page if link.pin_id in pins], many=True)
+        return paginator.get_paginated_response(serializer.data)
 
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        pin = serializer.save(author=self.request.user)
+        if not supplies_size(serializer):
+            dimensions.schedule(pin)
 
 class PinDetailView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Pin.objects.all()
+    # No only() here: saving a partly deferred pin would skip updated_at
+    queryset = Pin.objects.select_related('author__profile')
     serializer_class = PinSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
+    def perform_update(self, serializer):
+        old_url = serializer.instance.image_url
+        pin = serializer.save()
+        if pin.image_url != old_url and not supplies_size(serializer):
+            dimensions.schedule(pin)
+
+class TagListView(generics.ListAPIView):
+    """Most used tags, for browsing; ?q= filters by name prefix"""
+    serializer_class = TagSerializer
+    permission_classes = [permissions.AllowAny]
+
+    def get_queryset(self):
+        tags = Tag.objects.all()
+        if self.request.query_params.get('q'):
+            tags = tags.filter(name__startswith=normalize_tag(self.request.query_params['q']))
+        tags = tags.annotate(pin_count=Count('pin_tags')).filter(pin_count__gt=0)
+        return tags.order_by('-pin_count', 'name')[:50]
+
 class CategoryListCreateView(generics.ListCreateAPIView):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
-    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
\ No newline at end of file
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+
+class PinInteractionView(APIView):
+    """
+    PUT likes/saves a pin for the current user, DELETE undoes it. Both are
+    idempotent. Counts include deltas not yet flushed into the pin row.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    kind = None
+
+    def respond(self, request, pk, active):
+        pin = Pin.objects.filter(pk=pk).only('id', 'likes', 'saves').first()
+        if pin is None:
+            return Response({'error': 'Pin not found'}, status=status.HTTP_404_NOT_FOUND)
+        changed = counters.set_interaction(request.user, pin.id, self.kind, active)
+        likes, saves = counters.current_counts(pin)
+        return Response({
+            'id': pin.id,
+            'liked' if self.kind == 'like' else 'saved': active,
+            'changed': changed,
+            'likes': likes,
+            'saves': saves,
+        })
+
+    def put(self, request, pk):
+        return self.respond(request, pk, True)
+
+    def delete(self, request, pk):
+        return self.respond(request, pk, False)